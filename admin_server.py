@@ -5,14 +5,21 @@ UniMCPSim 管理后台服务器
 
 import os
 import json
+import time
 from datetime import datetime, timedelta, timezone
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
 from models import db_manager, User, Token, Application, AppPermission, AuditLog, PromptTemplate
 from auth_utils import hash_password, verify_password, login_required, admin_required
+from auth_cache import auth_cache
 from version import get_version
 from playground_service import playground_service
+from response_recorder import response_recorder
+from prompt_registry import prompt_registry
+from metrics import metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from health_probes import health_monitor, liveness
+from compression import CompressionWSGIMiddleware
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,10 +28,37 @@ app = Flask(__name__)
 app.secret_key = os.urandom(32)
 app.permanent_session_lifetime = timedelta(hours=24)
 CORS(app)
+# 按 Accept-Encoding 压缩响应（页面、静态资源和API）
+app.wsgi_app = CompressionWSGIMiddleware(app.wsgi_app)
 
 # 启动时间（使用本地时区）
 START_TIME = datetime.now()
 
+# ===== Prometheus 指标 =====
+
+admin_requests_total = metrics_registry.counter(
+    'unimcp_admin_requests_total', 'Admin server HTTP requests', ('endpoint', 'method', 'status')
+)
+admin_request_duration = metrics_registry.histogram(
+    'unimcp_admin_request_duration_seconds', 'Admin server HTTP request latency in seconds', ('endpoint', 'method')
+)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.path != '/metrics':
+        # 使用路由规则作为标签（而不是实际路径），避免标签基数膨胀
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        admin_requests_total.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+        admin_request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+    return response
+
 # ===== 页面路由 =====
 
 @app.route('/admin/login')
@@ -153,7 +187,9 @@ def get_apps():
             'description': app.description,
             'ai_notes': app.ai_notes,
             'enabled': app.enabled,
-            'created_at': app.created_at.isoformat()
+            'created_at': app.created_at.isoformat(),
+            **quota_fields(app),
+            **response_cache_fields(app)
         } for app in apps])
     finally:
         session_db.close()
@@ -174,6 +210,55 @@ def validate_app_name(name, field_name='名称'):
 
     return True, ''
 
+# Token / 应用的配额字段（为空表示默认，0 表示不限制）
+QUOTA_FIELDS = ('rate_limit_per_minute', 'rate_limit_burst', 'max_concurrency')
+
+def quota_fields(obj):
+    """获取对象的配额字段"""
+    return {field: getattr(obj, field) for field in QUOTA_FIELDS}
+
+def apply_quota_fields(obj, data):
+    """将请求中提供的配额字段写入对象，返回错误信息或 None"""
+    for field in QUOTA_FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if value in (None, ''):
+            setattr(obj, field, None)
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return f'{field} 必须为非负整数'
+        setattr(obj, field, value)
+    return None
+
+# 应用的大模型响应缓存设置（缓存秒数为空表示默认，0 表示不缓存）和相同调用合并设置
+RESPONSE_FLAG_FIELDS = ('response_cache_always_fresh', 'response_distinct')
+
+def response_cache_fields(app):
+    """获取应用的响应缓存和合并设置"""
+    return {
+        'response_cache_ttl': app.response_cache_ttl,
+        **{field: bool(getattr(app, field)) for field in RESPONSE_FLAG_FIELDS}
+    }
+
+def apply_response_cache_fields(app, data):
+    """将请求中提供的响应缓存和合并设置写入应用，返回错误信息或 None"""
+    if 'response_cache_ttl' in data:
+        value = data['response_cache_ttl']
+        if value in (None, ''):
+            app.response_cache_ttl = None
+        elif isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return 'response_cache_ttl 必须为非负整数'
+        else:
+            app.response_cache_ttl = value
+    for field in RESPONSE_FLAG_FIELDS:
+        if field not in data:
+            continue
+        if not isinstance(data[field], bool):
+            return f'{field} 必须为布尔值'
+        setattr(app, field, data[field])
+    return None
+
 @app.route('/admin/api/apps', methods=['POST'])
 @admin_required
 def create_app():
@@ -207,6 +292,9 @@ def create_app():
             ai_notes=data.get('ai_notes', ''),
             template=data.get('template', {})
         )
+        error = apply_quota_fields(app, data) or apply_response_cache_fields(app, data)
+        if error:
+            return jsonify({'error': error}), 400
         session_db.add(app)
         session_db.commit()
         return jsonify({
@@ -234,7 +322,9 @@ def get_app_detail(app_id):
             'description': app.description,
             'ai_notes': app.ai_notes,
             'enabled': app.enabled,
-            'template': app.template
+            'template': app.template,
+            **quota_fields(app),
+            **response_cache_fields(app)
         })
     finally:
         session_db.close()
@@ -297,8 +387,14 @@ def update_app(app_id):
             if 'display_name' in data:
                 app.display_name = data['display_name']
 
+        # 配额和响应缓存字段（PUT / PATCH 均只更新提供的字段）
+        error = apply_quota_fields(app, data) or apply_response_cache_fields(app, data)
+        if error:
+            return jsonify({'error': error}), 400
+
         app.updated_at = datetime.now(timezone.utc)
         session_db.commit()
+        auth_cache.invalidate_app()
         return jsonify({'success': True})
     finally:
         session_db.close()
@@ -315,6 +411,7 @@ def delete_app(app_id):
 
         session_db.delete(app)
         session_db.commit()
+        auth_cache.invalidate_app()
         return jsonify({'success': True})
     finally:
         session_db.close()
@@ -439,6 +536,7 @@ def import_apps():
 
         # 提交所有成功的修改
         session_db.commit()
+        auth_cache.invalidate_app()
 
         return jsonify({
             'success': True,
@@ -451,6 +549,36 @@ def import_apps():
     finally:
         session_db.close()
 
+@app.route('/admin/api/recordings', methods=['GET'])
+@login_required
+def get_recordings():
+    """获取录制文件中各应用的大模型响应录制概况"""
+    return jsonify({
+        'mode': response_recorder.mode,
+        'miss_policy': response_recorder.miss_policy,
+        'path': response_recorder.path,
+        'apps': response_recorder.summary()
+    })
+
+@app.route('/admin/api/apps/<int:app_id>/recordings', methods=['GET'])
+@login_required
+def export_app_recordings(app_id):
+    """导出应用的大模型响应录制（JSON Lines，可直接作为回放文件）"""
+    session_db = db_manager.get_session()
+    try:
+        app_obj = session_db.query(Application).filter_by(id=app_id).first()
+        if not app_obj:
+            return jsonify({"error": "Application not found"}), 404
+        category, name = app_obj.category, app_obj.name
+    finally:
+        session_db.close()
+
+    body = response_recorder.export(f"{category}/{name}")
+    filename = f"{category}_{name}_recordings.jsonl"
+    return Response(body, content_type='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
 @app.route('/admin/api/tokens', methods=['GET'])
 @login_required
 def get_tokens():
@@ -468,7 +596,8 @@ def get_tokens():
                 'enabled': token.enabled,
                 'created_at': token.created_at.isoformat(),
                 'last_used': token.last_used.isoformat() if token.last_used else None,
-                'app_count': app_count
+                'app_count': app_count,
+                **quota_fields(token)
             })
         return jsonify(result)
     finally:
@@ -486,6 +615,9 @@ def create_token():
             name=data['name'],
             user_id=session['user_id']
         )
+        error = apply_quota_fields(token, data)
+        if error:
+            return jsonify({'error': error}), 400
         session_db.add(token)
         session_db.flush()
 
@@ -495,6 +627,7 @@ def create_token():
             session_db.add(perm)
 
         session_db.commit()
+        auth_cache.invalidate_token(token.token)
         return jsonify({'token': token.token, 'id': token.id})
     finally:
         session_db.close()
@@ -513,7 +646,12 @@ def update_token(token_id):
         if 'enabled' in data:
             token.enabled = data['enabled']
 
+        error = apply_quota_fields(token, data)
+        if error:
+            return jsonify({'error': error}), 400
+
         session_db.commit()
+        auth_cache.invalidate_token(token.token)
         return jsonify({'success': True})
     finally:
         session_db.close()
@@ -528,8 +666,10 @@ def delete_token(token_id):
         if not token:
             return jsonify({'error': 'Token不存在'}), 404
 
+        token_str = token.token
         session_db.delete(token)
         session_db.commit()
+        auth_cache.invalidate_token(token_str)
         return jsonify({'success': True})
     finally:
         session_db.close()
@@ -570,6 +710,7 @@ def update_token_apps(token_id):
             session_db.add(permission)
 
         session_db.commit()
+        auth_cache.invalidate_token()
         return jsonify({'success': True})
     except Exception as e:
         session_db.rollback()
@@ -708,7 +849,7 @@ def generate_actions_with_ai(category, name, display_name, description, prompt):
         import json
 
         # 从数据库获取提示词模板
-        prompt_template = db_manager.get_prompt_template('action_generation')
+        prompt_template = prompt_registry.get('action_generation')
         if not prompt_template:
             raise Exception("未找到动作生成提示词模板")
 
@@ -722,7 +863,7 @@ def generate_actions_with_ai(category, name, display_name, description, prompt):
         }
 
         # 使用变量替换生成最终的user prompt
-        user_prompt = prompt_template.template.format(**variables)
+        user_prompt = prompt_template.render(variables)
 
         # 读取LLM配置（数据库优先，环境变量兜底）
         db_config = db_manager.get_llm_config()
@@ -823,26 +964,41 @@ def index():
 
 @app.route('/health', methods=['GET', 'HEAD', 'OPTIONS'])
 def health_check():
-    """健康检查端点"""
+    """健康检查端点（数据库状态取自缓存的探针结果）"""
     if request.method == 'OPTIONS':
         return '', 200
 
-    try:
-        # 检查数据库连接
-        session = db_manager.get_session()
-        session.query(Application).first()
-        session.close()
+    database_ok, error = health_monitor.is_ok('database')
+    if database_ok:
         return jsonify({
             "status": "healthy",
             "service": "UniMCPSim-Admin",
             "timestamp": datetime.now().isoformat()
         }), 200
-    except Exception as e:
-        return jsonify({
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+    return jsonify({
+        "status": "unhealthy",
+        "error": error,
+        "timestamp": datetime.now().isoformat()
+    }), 500
+
+
+@app.route('/livez', methods=['GET', 'HEAD'])
+def liveness_check():
+    """存活检查（不访问数据库）"""
+    return jsonify(liveness("UniMCPSim-Admin", get_version()))
+
+
+@app.route('/readyz', methods=['GET', 'HEAD'])
+def readiness_check():
+    """就绪检查（返回缓存的探针结果）"""
+    body, status = health_monitor.readiness()
+    return jsonify(body), status
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 指标端点"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 
 # ===== 提示词管理API =====
@@ -907,13 +1063,17 @@ def api_save_prompt():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
 
-        prompt = db_manager.save_prompt_template(
-            name=data['name'],
-            display_name=data['display_name'],
-            description=data.get('description', ''),
-            template=data['template'],
-            variables=data.get('variables', [])
-        )
+        try:
+            prompt = db_manager.save_prompt_template(
+                name=data['name'],
+                display_name=data['display_name'],
+                description=data.get('description', ''),
+                template=data['template'],
+                variables=data.get('variables', [])
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        prompt_registry.invalidate()
 
         return jsonify({
             'id': prompt.id,
@@ -936,6 +1096,7 @@ def api_delete_prompt(name):
     try:
         success = db_manager.delete_prompt_template(name)
         if success:
+            prompt_registry.invalidate()
             return jsonify({'message': 'Prompt template deleted successfully'})
         else:
             return jsonify({'error': 'Prompt template not found'}), 404
@@ -1203,12 +1364,41 @@ def llm_config_to_dict(config, mask_key: bool = True) -> dict:
         'model_name': config.model_name,
         'enable_thinking': config.enable_thinking,
         'enable_stream': config.enable_stream,
+        'request_timeout': config.request_timeout,
+        'max_concurrency': config.max_concurrency,
         'created_at': config.created_at.isoformat() if config.created_at else None,
         'updated_at': config.updated_at.isoformat() if config.updated_at else None,
         'has_config': bool(config.api_key)
     }
 
 
+def parse_llm_limits(data, config=None):
+    """读取请求超时和并发上限（为空使用环境变量默认值），请求中未提供时保留 config 的原值
+
+    Returns:
+        ((request_timeout, max_concurrency), None) 或 (None, 错误信息)
+    """
+    timeout = config.request_timeout if config else None
+    concurrency = config.max_concurrency if config else None
+    if 'request_timeout' in data:
+        value = data['request_timeout']
+        if value in (None, ''):
+            timeout = None
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            return None, 'request_timeout 必须为正数（秒）'
+        else:
+            timeout = float(value)
+    if 'max_concurrency' in data:
+        value = data['max_concurrency']
+        if value in (None, ''):
+            concurrency = None
+        elif isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return None, 'max_concurrency 必须为非负整数'
+        else:
+            concurrency = value
+    return (timeout, concurrency), None
+
+
 @app.route('/admin/api/llm-configs', methods=['GET'])
 @login_required
 def api_get_all_llm_configs():
@@ -1241,6 +1431,9 @@ def api_create_llm_config():
         model_name = data.get('model_name', 'gpt-4o-mini')
         enable_thinking = data.get('enable_thinking', False)
         enable_stream = data.get('enable_stream', False)
+        limits, error = parse_llm_limits(data)
+        if error:
+            return jsonify({'error': error}), 400
 
         config = db_manager.create_llm_config(
             name=name,
@@ -1248,7 +1441,9 @@ def api_create_llm_config():
             api_base_url=api_base_url,
             model_name=model_name,
             enable_thinking=enable_thinking,
-            enable_stream=enable_stream
+            enable_stream=enable_stream,
+            request_timeout=limits[0],
+            max_concurrency=limits[1]
         )
 
         # 如果配置自动启用了，重新加载AI生成器
@@ -1300,6 +1495,9 @@ def api_update_llm_config_by_id(config_id):
         model_name = data.get('model_name', 'gpt-4o-mini')
         enable_thinking = data.get('enable_thinking', False)
         enable_stream = data.get('enable_stream', False)
+        limits, error = parse_llm_limits(data, db_manager.get_llm_config_by_id(config_id))
+        if error:
+            return jsonify({'error': error}), 400
 
         config = db_manager.update_llm_config(
             config_id=config_id,
@@ -1308,7 +1506,9 @@ def api_update_llm_config_by_id(config_id):
             api_base_url=api_base_url,
             model_name=model_name,
             enable_thinking=enable_thinking,
-            enable_stream=enable_stream
+            enable_stream=enable_stream,
+            request_timeout=limits[0],
+            max_concurrency=limits[1]
         )
 
         if not config:
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+大模型调用准入控制
+同时进行中的大模型调用数有上限，超出的调用进入有界等待队列；
+队列已满或等待超时的调用被提前拒绝（降载），不再在线程中堆积到客户端超时
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+
+class AdmissionRejected(Exception):
+    """调用未获准入（队列已满或等待超时）
+
+    Attributes:
+        reason: queue_full / timeout
+        retry_after: 建议的重试等待时间（秒）
+    """
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """等待队列中的一个调用（同步调用使用 Event，异步调用使用 Future）"""
+
+    __slots__ = ('event', 'loop', 'future', 'granted')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionTicket:
+    """已获准入的调用，结束时释放（可重复调用，只释放一次）"""
+
+    def __init__(self, controller: 'AdmissionController'):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """有界准入队列（同步线程和异步协程共用，先到先得）
+
+    Args:
+        max_active: 同时进行中的调用数上限，0 表示不限制（关闭准入控制）
+        queue_size: 等待队列容量，队列已满时立即拒绝
+        max_wait: 在队列中最多等待的秒数，超时后拒绝
+        overflow: 被拒绝时的处理方式，reject 返回错误响应，default 降级为默认模拟响应
+    """
+
+    def __init__(self, max_active: int = 64, queue_size: int = 256, max_wait: float = 15.0,
+                 overflow: str = 'reject'):
+        self.max_active = max_active
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.overflow = overflow
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # 调用持续时间的指数移动平均，用于估算重试等待时间
+        self._avg_hold = 1.0
+
+        # 统计信息
+        self.admitted = 0
+        self.queued = 0
+        self.shed: Dict[str, int] = {'queue_full': 0, 'timeout': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_active > 0
+
+    def reset_after_fork(self):
+        """子进程中重置状态（父进程的进行中调用不会随fork复制）"""
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _retry_after(self) -> float:
+        """估算队列排空所需时间（需持有锁）"""
+        rounds = len(self._waiters) / self.max_active + 1
+        return max(1.0, self._avg_hold * rounds)
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """尝试直接获准入，返回 None（已获准入）或需等待的 _Waiter（需持有锁）"""
+        if self._active < self.max_active and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.queue_size or self.max_wait <= 0:
+            self.shed['queue_full'] += 1
+            raise AdmissionRejected('queue_full', self._retry_after())
+        waiter = _Waiter(loop)
+        self._waiters.append(waiter)
+        self.queued += 1
+        return waiter
+
+    def _finish_wait(self, waiter: _Waiter):
+        """等待结束：已被唤醒则获准入，否则移出队列并拒绝（需持有锁）"""
+        if waiter.granted:
+            self.admitted += 1
+            return
+        self._waiters.remove(waiter)
+        self.shed['timeout'] += 1
+        raise AdmissionRejected('timeout', self._retry_after())
+
+    def admit(self) -> AdmissionTicket:
+        """获取准入（同步），未获准入时抛出 AdmissionRejected"""
+        if not self.enabled:
+            return AdmissionTicket(self)
+        with self._lock:
+            waiter = self._enter()
+        if waiter is not None:
+            waiter.event.wait(self.max_wait)
+            with self._lock:
+                self._finish_wait(waiter)
+        return AdmissionTicket(self)
+
+    async def admit_async(self) -> AdmissionTicket:
+        """获取准入（异步，在事件循环中等待），未获准入时抛出 AdmissionRejected"""
+        if not self.enabled:
+            return AdmissionTicket(self)
+        with self._lock:
+            waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # 请求被取消：已获准入则归还，否则移出队列
+                with self._lock:
+                    if not waiter.granted:
+                        self._waiters.remove(waiter)
+                        waiter = None
+                if waiter is not None:
+                    self._release(0.0)
+                raise
+            with self._lock:
+                self._finish_wait(waiter)
+        return AdmissionTicket(self)
+
+    def _release(self, held: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            if held > 0:
+                self._avg_hold = self._avg_hold * 0.9 + held * 0.1
+            if self._waiters:
+                # 名额直接移交给队首的等待者
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self._active -= 1
+
+    def queue_depth(self) -> int:
+        """当前等待队列深度"""
+        return len(self._waiters)
+
+    def active(self) -> int:
+        """当前进行中的调用数"""
+        return self._active
+
+    def stats(self) -> Dict[str, Any]:
+        """获取准入控制统计信息"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'active': self._active,
+                'max_active': self.max_active,
+                'queue_depth': len(self._waiters),
+                'queue_size': self.queue_size,
+                'max_wait': self.max_wait,
+                'overflow': self.overflow,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': dict(self.shed)
+            }
+
+
+# 全局大模型调用准入控制（每个进程一个）
+llm_admission = AdmissionController(
+    max_active=int(os.getenv('LLM_ADMISSION_MAX_ACTIVE', '64')),
+    queue_size=int(os.getenv('LLM_ADMISSION_QUEUE_SIZE', '256')),
+    max_wait=float(os.getenv('LLM_ADMISSION_MAX_WAIT', '15')),
+    overflow=os.getenv('LLM_ADMISSION_OVERFLOW', 'reject').lower()
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=llm_admission.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_llm_admission_active', 'LLM calls currently admitted', llm_admission.active
+)
+metrics_registry.callback(
+    'unimcp_llm_admission_queue_depth', 'LLM calls waiting for admission', llm_admission.queue_depth
+)
+metrics_registry.callback(
+    'unimcp_llm_admission_shed_total', 'LLM calls shed before reaching the model', lambda: {
+        reason: count for reason, count in llm_admission.stats()['shed'].items()
+    }, ('reason',), kind='counter'
+)
@@ -6,12 +6,21 @@ AI响应生成器
 import os
 import json
 import random
+import asyncio
 import time
-from typing import Dict, Any, Optional, List
-from openai import OpenAI
+from typing import Dict, Any, Optional, List, Iterator, AsyncIterator, Tuple
 from dotenv import load_dotenv
 from models import DatabaseManager
 from logger_utils import mcp_logger
+from request_timing import span, record_span
+from metrics import observe_llm_call
+from admission import llm_admission, AdmissionRejected
+from llm_pool import llm_pool, request_timeout, max_concurrency
+from response_cache import response_cache
+from response_recorder import response_recorder
+from singleflight import llm_flights
+from prompt_registry import prompt_registry
+from cache_utils import cache_generation
 
 load_dotenv()
 
@@ -25,12 +34,16 @@ class AIResponseGenerator:
         # 配置版本追踪（用于检测配置变化）
         self._config_id = None
         self._config_updated_at = None
+        # 载入配置时的跨进程缓存代数，代数不变时不查询数据库
+        self._config_generation = None
 
         # 加载配置（数据库优先，环境变量兜底）
         self._load_config()
 
     def _load_config(self):
         """加载LLM配置（数据库优先，环境变量兜底）"""
+        # 先记录代数再查询，查询之后的配置修改会推进代数
+        generation = cache_generation.current()
         # 尝试从数据库读取配置
         db_config = self.db_manager.get_llm_config()
 
@@ -41,6 +54,8 @@ class AIResponseGenerator:
             model = db_config.model_name or 'gpt-4o-mini'
             enable_thinking = db_config.enable_thinking
             use_stream = db_config.enable_stream
+            timeout = request_timeout(db_config.request_timeout)
+            concurrency = max_concurrency(db_config.max_concurrency)
             # 记录配置版本
             self._config_id = db_config.id
             self._config_updated_at = db_config.updated_at
@@ -53,35 +68,69 @@ class AIResponseGenerator:
             enable_thinking = os.getenv('OPENAI_ENABLE_THINKING', 'false').lower() == 'true'
             # 读取stream配置,默认为False(某些模型如qwq-32b强制要求stream=True)
             use_stream = os.getenv('OPENAI_STREAM', 'false').lower() == 'true'
+            timeout = request_timeout(None)
+            concurrency = max_concurrency(None)
             self._config_id = None
             self._config_updated_at = None
 
         if api_key:
-            self.client = OpenAI(api_key=api_key, base_url=api_base)
+            # 客户端由连接池按 (api_key, api_base, timeout) 创建并复用
+            self._client_args = (api_key, api_base, timeout)
             self.model = model
             self.enabled = True
             self.enable_thinking = enable_thinking
             self.use_stream = use_stream
         else:
-            self.client = None
+            self._client_args = None
             self.enabled = False
             self.enable_thinking = False
             self.use_stream = False
+        self.request_timeout = timeout
+        self.max_concurrency = concurrency
+        self._config_generation = generation
+
+    @property
+    def client(self):
+        """使用共享连接池的同步客户端，未配置时为 None"""
+        return llm_pool.openai_client(*self._client_args) if self._client_args else None
+
+    @property
+    def async_client(self):
+        """使用当前事件循环共享连接池的异步客户端（在事件循环中访问），未配置时为 None"""
+        return llm_pool.async_openai_client(*self._client_args) if self._client_args else None
+
+    def _concurrency_limiter(self):
+        """当前配置的并发上限（数据库配置按ID区分，环境变量配置共用一个）"""
+        return llm_pool.limiter(self._config_id or 'env', self.max_concurrency)
+
+    def _config_stale(self) -> bool:
+        """跨进程缓存代数是否在载入配置后变化（不访问数据库）"""
+        return cache_generation.current() != self._config_generation
 
     def _check_and_reload_config(self):
-        """检查配置是否有更新，如有则重新加载"""
+        """检查配置是否有更新，如有则重新加载
+
+        配置修改后管理后台推进缓存代数，代数未变化时直接返回，不查询数据库
+        """
+        if not self._config_stale():
+            return
+        generation = cache_generation.current()
         db_config = self.db_manager.get_llm_config()
         if db_config:
             # 检查是否切换了配置或配置有更新
             if (db_config.id != self._config_id or
                 db_config.updated_at != self._config_updated_at):
                 self._load_config()
+                return
         elif self._config_id is not None:
             # 数据库配置被删除，重新加载（回退到环境变量）
             self._load_config()
+            return
+        self._config_generation = generation
 
     def reload_config(self):
-        """重新加载配置（用于配置更新后立即生效）"""
+        """重新加载配置并通知其他进程（用于配置更新后立即生效）"""
+        cache_generation.bump()
         self._load_config()
 
     def _parse_json_response(self, result: str) -> Dict[str, Any]:
@@ -147,57 +196,51 @@ class AIResponseGenerator:
         # 最后尝试：直接解析（会抛出原始错误）
         return json.loads(result)
 
-    def generate_response(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any], action_def: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """生成模拟响应
+    def _build_prompt(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any],
+                      action_def: Optional[Dict[str, Any]] = None, prompt_template=None) -> str:
+        """构建响应模拟提示词（优先使用提示词注册表中的提示词模板）
 
         Args:
-            app_info: 应用信息字典，包含 category, name, display_name, description
-            action: 动作名称
-            parameters: 用户调用参数
-            action_def: 动作完整定义
+            prompt_template: 已获取的编译提示词，为 None 时从提示词注册表获取
         """
-
-        # 检查配置是否有更新（支持多进程场景下的配置热切换）
-        self._check_and_reload_config()
-
-        # 提取应用信息
         app_name = app_info.get('display_name', app_info.get('name', 'Unknown'))
 
-        # 如果AI未启用，返回默认响应
-        if not self.enabled:
-            return self._generate_default_response(app_name, action, parameters)
+        # 从提示词注册表获取响应生成提示词模板（不访问数据库）
+        if prompt_template is None:
+            prompt_template = prompt_registry.get('response_simulation')
+        if prompt_template:
+            # 准备变量替换
+            ai_notes = app_info.get('ai_notes', '')
+            # 如果有 ai_notes，保留原文；如果没有，使用默认提示
+            if not ai_notes or ai_notes.strip() == '':
+                ai_notes = '无特殊要求'
+
+            variables = {
+                'app_category': app_info.get('category', ''),
+                'app_name': app_info.get('name', ''),
+                'app_display_name': app_info.get('display_name', ''),
+                'app_description': app_info.get('description', ''),
+                'ai_notes': ai_notes,
+                'action': action,
+                'parameters': '',
+                'action_definition': ''
+            }
+            # 序列化较大的变量只在模板引用时进行
+            if prompt_template.uses('parameters'):
+                variables['parameters'] = json.dumps(parameters, ensure_ascii=False, indent=2)
+            if prompt_template.uses('action_definition'):
+                variables['action_definition'] = json.dumps(action_def, ensure_ascii=False, indent=2) if action_def else 'null'
 
-        try:
-            # 从数据库获取响应生成提示词模板
-            prompt_template = self.db_manager.get_prompt_template('response_simulation')
-            if prompt_template:
-                # 准备变量替换
-                ai_notes = app_info.get('ai_notes', '')
-                # 如果有 ai_notes，保留原文；如果没有，使用默认提示
-                if not ai_notes or ai_notes.strip() == '':
-                    ai_notes = '无特殊要求'
-
-                variables = {
-                    'app_category': app_info.get('category', ''),
-                    'app_name': app_info.get('name', ''),
-                    'app_display_name': app_info.get('display_name', ''),
-                    'app_description': app_info.get('description', ''),
-                    'ai_notes': ai_notes,
-                    'action': action,
-                    'parameters': json.dumps(parameters, ensure_ascii=False, indent=2),
-                    'action_definition': json.dumps(action_def, ensure_ascii=False, indent=2) if action_def else 'null'
-                }
-
-                # 使用变量替换生成最终的prompt
-                prompt = prompt_template.template.format(**variables)
-            else:
-                # 如果没有找到模板，使用原来的硬编码提示词（包含应用完整信息）
-                action_def_str = json.dumps(action_def, ensure_ascii=False, indent=2) if action_def else 'null'
-                ai_notes = app_info.get('ai_notes', '')
-                if not ai_notes or ai_notes.strip() == '':
-                    ai_notes = '无特殊要求'
+            # 使用变量替换生成最终的prompt
+            return prompt_template.render(variables)
 
-                prompt = f"""你是{app_info.get('display_name', app_name)}系统的模拟器。
+        # 如果没有找到模板，使用原来的硬编码提示词（包含应用完整信息）
+        action_def_str = json.dumps(action_def, ensure_ascii=False, indent=2) if action_def else 'null'
+        ai_notes = app_info.get('ai_notes', '')
+        if not ai_notes or ai_notes.strip() == '':
+            ai_notes = '无特殊要求'
+
+        return f"""你是{app_info.get('display_name', app_name)}系统的模拟器。
 
 # 应用信息
 - 分类: {app_info.get('category', 'Unknown')}
@@ -226,121 +269,68 @@ class AIResponseGenerator:
 
 直接返回JSON，不要任何其他说明文字。"""
 
-            start_time = time.time()
+    def _prepare_generation(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any], action_def: Optional[Dict[str, Any]] = None):
+        """生成前的准备：回放录制的响应、检查配置、查找响应缓存并构建提示词
 
-            try:
-                if self.use_stream:
-                    # Stream模式处理
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": "你是一个API响应模拟器,返回符合规范的JSON数据。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.7,
-                        max_tokens=4096,
-                        stream=True,
-                        # 禁用thinking模式,防止思考过程影响JSON输出格式
-                        extra_body={"enable_thinking": self.enable_thinking}
-                    )
-
-                    # 收集stream响应
-                    result = ""
-                    reasoning = ""
-                    for chunk in response:
-                        if chunk.choices and len(chunk.choices) > 0:
-                            delta = chunk.choices[0].delta
-                            if hasattr(delta, 'content') and delta.content:
-                                result += delta.content
-                            # 智谱等模型的思考内容
-                            if hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                                reasoning += delta.reasoning_content
-                    # 如果 content 为空但有 reasoning，使用 reasoning
-                    if not result and reasoning:
-                        result = reasoning
-
-                    duration = time.time() - start_time
-                else:
-                    # 非Stream模式处理
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": "你是一个API响应模拟器,返回符合规范的JSON数据。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.7,
-                        max_tokens=4096,
-                        # 禁用thinking模式,防止思考过程影响JSON输出格式
-                        extra_body={"enable_thinking": self.enable_thinking}
-                    )
-
-                    duration = time.time() - start_time
-
-                    # 解析响应 - 优先使用 content，如果为空则尝试 reasoning_content（智谱等模型）
-                    message = response.choices[0].message
-                    result = message.content or ""
-                    if not result and hasattr(message, 'reasoning_content') and message.reasoning_content:
-                        result = message.reasoning_content
-
-                # 记录成功的 AI 调用
-                # Stream模式下无法获取usage信息
-                usage = None
-                if not self.use_stream and hasattr(response, 'usage') and response.usage:
-                    usage = {
-                        'prompt_tokens': response.usage.prompt_tokens,
-                        'completion_tokens': response.usage.completion_tokens,
-                        'total_tokens': response.usage.total_tokens
-                    }
-
-                mcp_logger.log_ai_call(
-                    provider="OpenAI",
-                    model=self.model,
-                    prompt=prompt,
-                    response=result,
-                    success=True,
-                    duration=duration,
-                    usage=usage
-                )
-
-                # 使用增强的 JSON 解析方法
-                return self._parse_json_response(result)
-
-            except Exception as e:
-                duration = time.time() - start_time
-                error_msg = str(e)
-
-                # 检测空响应问题，可能需要启用 stream 模式
-                hint = ""
-                if "Empty response" in error_msg or "column 1" in error_msg:
-                    hint = f" (模型 {self.model} 可能需要启用 Stream 模式)"
-
-                # 记录失败的 AI 调用
-                mcp_logger.log_ai_call(
-                    provider="OpenAI",
-                    model=self.model,
-                    prompt=prompt,
-                    success=False,
-                    error=error_msg + hint,
-                    duration=duration
-                )
-
-                # 返回错误响应而不是抛出异常
-                return {
+        Returns:
+            (prompt, None, cache_entry, record_entry) 需要调用大模型，cache_entry 为 (缓存键, 缓存秒数)，
+            不为 None 时生成结果写入响应缓存；record_entry 为 (应用路径, 动作, 参数)，不为 None 时生成结果
+            写入录制文件；(None, response, None, None) 直接返回该响应
+        """
+        # 提取应用信息
+        app_name = app_info.get('display_name', app_info.get('name', 'Unknown'))
+        app_path = f"{app_info.get('category', '')}/{app_info.get('name', '')}"
+
+        # 回放模式：直接返回录制的响应（不访问数据库和大模型），未命中时按 LLM_REPLAY_MISS 处理
+        if response_recorder.replaying:
+            with span('replay'):
+                recorded = response_recorder.lookup(app_path, action, parameters)
+            if recorded is not None:
+                return None, recorded, None, None
+            if response_recorder.miss_policy == 'default':
+                return None, self._generate_default_response(app_name, action, parameters), None, None
+            if response_recorder.miss_policy == 'fail':
+                return None, {
                     "success": False,
-                    "error": "AI generation failed",
-                    "error_detail": error_msg + hint,
-                    "code": 500,
+                    "error": "No recorded response",
+                    "error_detail": f"No recording of {action} with these parameters for {app_path} "
+                                    f"in {response_recorder.path}",
+                    "code": 404,
                     "app": app_name,
-                    "action": action,
-                    "model": self.model,
-                    "stream_enabled": self.use_stream,
-                    "fallback": "Consider enabling Stream mode for reasoning models like deepseek-reasoner, qwq-32b"
-                }
+                    "action": action
+                }, None, None
+
+        # 检查配置是否有更新（支持多进程场景下的配置热切换）
+        self._check_and_reload_config()
 
+        # 如果AI未启用，返回默认响应
+        if not self.enabled:
+            return None, self._generate_default_response(app_name, action, parameters), None, None
+
+        try:
+            prompt_template = prompt_registry.get('response_simulation')
+
+            # 响应缓存：应用开启缓存时，相同调用直接返回已生成的响应
+            cache_entry = None
+            ttl = response_cache.ttl_for(app_info)
+            if ttl is None:
+                response_cache.bypass(app_path)
+            else:
+                prompt_version = prompt_template.version if prompt_template else None
+                key = response_cache.make_key(app_info, action, parameters, prompt_version, self.model)
+                with span('cache'):
+                    cached = response_cache.get(key, app_path)
+                if cached is not None:
+                    return None, cached, None, None
+                cache_entry = (key, ttl)
+
+            record_entry = (app_path, action, parameters) if response_recorder.recording else None
+            prompt = self._build_prompt(app_info, action, parameters, action_def, prompt_template)
+            return prompt, None, cache_entry, record_entry
         except Exception as e:
             mcp_logger.error(f"AI generation failed: {e}", exc_info=True)
             # 返回错误响应而不是默认成功响应
-            return {
+            return None, {
                 "success": False,
                 "error": "AI generation failed",
                 "error_detail": str(e),
@@ -348,7 +338,411 @@ class AIResponseGenerator:
                 "app": app_name,
                 "action": action,
                 "fallback": "Consider using default response or check AI configuration"
+            }, None, None
+
+    def _completion_kwargs(self, prompt: str, stream: Optional[bool] = None) -> Dict[str, Any]:
+        """构建 chat completion 请求参数（stream 未指定时使用配置中的 use_stream）"""
+        kwargs = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "你是一个API响应模拟器,返回符合规范的JSON数据。"},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 4096,
+            # 禁用thinking模式,防止思考过程影响JSON输出格式
+            "extra_body": {"enable_thinking": self.enable_thinking}
+        }
+        if self.use_stream if stream is None else stream:
+            kwargs["stream"] = True
+        return kwargs
+
+    @staticmethod
+    def _read_delta(chunk) -> tuple:
+        """读取stream分片中的 content 和 reasoning_content（智谱等模型的思考内容）"""
+        if not chunk.choices or len(chunk.choices) == 0:
+            return "", ""
+        delta = chunk.choices[0].delta
+        content = delta.content if hasattr(delta, 'content') and delta.content else ""
+        reasoning = delta.reasoning_content if hasattr(delta, 'reasoning_content') and delta.reasoning_content else ""
+        return content, reasoning
+
+    @staticmethod
+    def _read_message(response) -> str:
+        """解析非stream响应 - 优先使用 content，如果为空则尝试 reasoning_content（智谱等模型）"""
+        message = response.choices[0].message
+        result = message.content or ""
+        if not result and hasattr(message, 'reasoning_content') and message.reasoning_content:
+            result = message.reasoning_content
+        return result
+
+    @staticmethod
+    def _read_usage(response) -> Optional[Dict[str, Any]]:
+        """读取token用量（Stream模式下无法获取usage信息）"""
+        if hasattr(response, 'usage') and response.usage:
+            return {
+                'prompt_tokens': response.usage.prompt_tokens,
+                'completion_tokens': response.usage.completion_tokens,
+                'total_tokens': response.usage.total_tokens
             }
+        return None
+
+    def _finish_generation(self, prompt: str, result: str, duration: float,
+                           usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """记录成功的 AI 调用并解析响应"""
+        mcp_logger.log_ai_call(
+            provider="OpenAI",
+            model=self.model,
+            prompt=prompt,
+            response=result,
+            success=True,
+            duration=duration,
+            usage=usage
+        )
+
+        # 使用增强的 JSON 解析方法
+        with span('parse'):
+            return self._parse_json_response(result)
+
+    def _store_generated(self, response: Dict[str, Any], cache_entry: Optional[Tuple[Any, float]],
+                         record_entry: Optional[Tuple[str, str, Dict[str, Any]]]):
+        """成功生成的响应写入响应缓存和录制文件"""
+        if cache_entry is not None:
+            response_cache.set(cache_entry[0], response, cache_entry[1])
+        if record_entry is not None:
+            try:
+                response_recorder.record(*record_entry, response, self.model)
+            except OSError as e:
+                # 录制失败不影响本次调用
+                mcp_logger.error(f"Failed to record LLM response: {e}")
+
+    def _generation_failed(self, error: Exception, prompt: str, duration: float,
+                           app_name: str, action: str) -> Dict[str, Any]:
+        """记录失败的 AI 调用并返回错误响应"""
+        error_msg = str(error)
+
+        # 检测空响应问题，可能需要启用 stream 模式
+        hint = ""
+        if "Empty response" in error_msg or "column 1" in error_msg:
+            hint = f" (模型 {self.model} 可能需要启用 Stream 模式)"
+
+        # 记录失败的 AI 调用
+        mcp_logger.log_ai_call(
+            provider="OpenAI",
+            model=self.model,
+            prompt=prompt,
+            success=False,
+            error=error_msg + hint,
+            duration=duration
+        )
+
+        # 返回错误响应而不是抛出异常
+        return {
+            "success": False,
+            "error": "AI generation failed",
+            "error_detail": error_msg + hint,
+            "code": 500,
+            "app": app_name,
+            "action": action,
+            "model": self.model,
+            "stream_enabled": self.use_stream,
+            "fallback": "Consider enabling Stream mode for reasoning models like deepseek-reasoner, qwq-32b"
+        }
+
+    def _shed_response(self, error: AdmissionRejected, app_name: str, action: str,
+                       parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """未获准入时的响应：降级为默认模拟响应，或返回快速失败的错误响应"""
+        mcp_logger.warning(f"LLM call shed ({error.reason}) for {app_name}/{action}")
+        if llm_admission.overflow == 'default':
+            return self._generate_default_response(app_name, action, parameters)
+        return {
+            "success": False,
+            "error": "Server overloaded",
+            "error_detail": f"LLM backlog is full ({error.reason}), retry later",
+            "code": 503,
+            "retry_after": round(error.retry_after, 1),
+            "app": app_name,
+            "action": action
+        }
+
+    def iter_response(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any],
+                      action_def: Optional[Dict[str, Any]] = None,
+                      stream: Optional[bool] = None) -> Iterator[Tuple[str, Any]]:
+        """生成模拟响应（生成器版本），大模型输出的文本片段随到随产出
+
+        Args:
+            stream: 是否以stream模式调用大模型，默认使用配置中的 use_stream
+
+        Yields:
+            ('delta', 文本片段) 零到多次，最后一次为 ('result', 响应字典)
+        """
+        with span('prompt'):
+            prompt, early_response, cache_entry, record_entry = self._prepare_generation(
+                app_info, action, parameters, action_def
+            )
+        if prompt is None:
+            yield 'result', early_response
+            return
+
+        use_stream = self.use_stream if stream is None else stream
+        app_name = app_info.get('display_name', app_info.get('name', 'Unknown'))
+
+        # 相同调用合并：同时进行中的相同生成只请求一次大模型，其他调用等待并共享结果
+        flight_key = self._flight_key(app_info, prompt)
+        if flight_key is None:
+            yield from self._iter_generation(prompt, use_stream, app_name, action, parameters,
+                                             cache_entry, record_entry)
+            return
+        flight, leader = llm_flights.join(flight_key)
+        if not leader:
+            with span('coalesce'):
+                shared = flight.wait(llm_flights.max_wait)
+            if shared is not None:
+                yield 'result', shared
+                return
+            llm_flights.fallback()
+            yield from self._iter_generation(prompt, use_stream, app_name, action, parameters,
+                                             cache_entry, record_entry)
+            return
+
+        finished = False
+        try:
+            for event, value in self._iter_generation(prompt, use_stream, app_name, action, parameters,
+                                                      cache_entry, record_entry):
+                if event == 'result':
+                    # 先唤醒等待者再产出结果，不等调用方处理完结果帧
+                    llm_flights.finish(flight_key, flight, value)
+                    finished = True
+                yield event, value
+        finally:
+            if not finished:
+                llm_flights.finish(flight_key, flight, None)
+
+    def _flight_key(self, app_info: Dict[str, Any], prompt: str) -> Optional[Tuple[Any, ...]]:
+        """相同调用合并的键（配置、模型和完整提示词），关闭合并或应用要求各自生成时返回 None"""
+        if not llm_flights.enabled or app_info.get('response_distinct'):
+            return None
+        return self._config_id, self.model, self.enable_thinking, prompt
+
+    def _iter_generation(self, prompt: str, use_stream: bool, app_name: str, action: str,
+                         parameters: Dict[str, Any], cache_entry: Optional[Tuple[Any, float]],
+                         record_entry: Optional[Tuple[str, str, Dict[str, Any]]]) -> Iterator[Tuple[str, Any]]:
+        """经过准入控制和配置并发上限后调用大模型"""
+        # 准入控制：大模型积压过多时提前拒绝或降级
+        try:
+            with span('admission'):
+                ticket = llm_admission.admit()
+        except AdmissionRejected as e:
+            yield 'result', self._shed_response(e, app_name, action, parameters)
+            return
+
+        with ticket:
+            # 配置并发上限：超出的调用排队等待，队列已满或超时时同样提前拒绝或降级
+            try:
+                with span('llm_slot'):
+                    slot = self._concurrency_limiter().admit()
+            except AdmissionRejected as e:
+                yield 'result', self._shed_response(e, app_name, action, parameters)
+                return
+            with slot:
+                yield from self._iter_completion(prompt, use_stream, app_name, action, cache_entry, record_entry)
+
+    def _iter_completion(self, prompt: str, use_stream: bool, app_name: str, action: str,
+                         cache_entry: Optional[Tuple[Any, float]] = None,
+                         record_entry: Optional[Tuple[str, str, Dict[str, Any]]] = None) -> Iterator[Tuple[str, Any]]:
+        """调用大模型并产出文本片段和最终结果（已获准入，成功的结果按 cache_entry 和 record_entry 写入响应缓存和录制文件）"""
+        start_time = time.time()
+        llm_start = time.perf_counter()
+        first_delta = True
+        llm_done = False
+
+        try:
+            response = self.client.chat.completions.create(**self._completion_kwargs(prompt, use_stream))
+
+            if use_stream:
+                # 收集stream响应
+                result = ""
+                reasoning = ""
+                for chunk in response:
+                    content, reasoning_content = self._read_delta(chunk)
+                    if content or reasoning_content:
+                        if first_delta:
+                            # 大模型首个输出片段的等待时间
+                            record_span('llm_ttft', llm_start)
+                            first_delta = False
+                        yield 'delta', content + reasoning_content
+                    result += content
+                    reasoning += reasoning_content
+                # 如果 content 为空但有 reasoning，使用 reasoning
+                if not result and reasoning:
+                    result = reasoning
+                usage = None
+            else:
+                result = self._read_message(response)
+                usage = self._read_usage(response)
+            record_span('llm', llm_start)
+            observe_llm_call(self.model, time.time() - start_time, True, usage)
+            llm_done = True
+
+            final = self._finish_generation(prompt, result, time.time() - start_time, usage)
+            self._store_generated(final, cache_entry, record_entry)
+
+        except Exception as e:
+            if not llm_done:
+                record_span('llm', llm_start, error=True)
+                observe_llm_call(self.model, time.time() - start_time, False)
+            final = self._generation_failed(e, prompt, time.time() - start_time, app_name, action)
+
+        yield 'result', final
+
+    def generate_response(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any], action_def: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """生成模拟响应
+
+        Args:
+            app_info: 应用信息字典，包含 category, name, display_name, description
+            action: 动作名称
+            parameters: 用户调用参数
+            action_def: 动作完整定义
+        """
+        result = None
+        for event, value in self.iter_response(app_info, action, parameters, action_def):
+            if event == 'result':
+                result = value
+        return result
+
+    async def aiter_response(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any],
+                             action_def: Optional[Dict[str, Any]] = None,
+                             stream: Optional[bool] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """生成模拟响应（异步生成器版本），事件格式同 iter_response
+
+        缓存代数变化后配置检查和提示词载入需要访问数据库，此时在线程池中执行，
+        其余情况直接在事件循环中构建提示词；大模型调用使用 AsyncOpenAI 客户端在事件循环中等待。
+        """
+        with span('prompt'):
+            if self._config_stale() or prompt_registry.stale():
+                prepared = await asyncio.to_thread(
+                    self._prepare_generation, app_info, action, parameters, action_def
+                )
+            else:
+                prepared = self._prepare_generation(app_info, action, parameters, action_def)
+            prompt, early_response, cache_entry, record_entry = prepared
+        if prompt is None:
+            yield 'result', early_response
+            return
+
+        use_stream = self.use_stream if stream is None else stream
+        app_name = app_info.get('display_name', app_info.get('name', 'Unknown'))
+
+        flight_key = self._flight_key(app_info, prompt)
+        if flight_key is None:
+            async for event, value in self._aiter_generation(prompt, use_stream, app_name, action, parameters,
+                                                             cache_entry, record_entry):
+                yield event, value
+            return
+        flight, leader = llm_flights.join(flight_key)
+        if not leader:
+            with span('coalesce'):
+                shared = await flight.wait_async(llm_flights.max_wait)
+            if shared is not None:
+                yield 'result', shared
+                return
+            llm_flights.fallback()
+            async for event, value in self._aiter_generation(prompt, use_stream, app_name, action, parameters,
+                                                             cache_entry, record_entry):
+                yield event, value
+            return
+
+        finished = False
+        try:
+            async for event, value in self._aiter_generation(prompt, use_stream, app_name, action, parameters,
+                                                             cache_entry, record_entry):
+                if event == 'result':
+                    llm_flights.finish(flight_key, flight, value)
+                    finished = True
+                yield event, value
+        finally:
+            if not finished:
+                llm_flights.finish(flight_key, flight, None)
+
+    async def _aiter_generation(self, prompt: str, use_stream: bool, app_name: str, action: str,
+                                parameters: Dict[str, Any], cache_entry: Optional[Tuple[Any, float]],
+                                record_entry: Optional[Tuple[str, str, Dict[str, Any]]]
+                                ) -> AsyncIterator[Tuple[str, Any]]:
+        """经过准入控制和配置并发上限后调用大模型（异步版本）"""
+        # 准入控制：在事件循环中排队等待，积压过多时提前拒绝或降级
+        try:
+            with span('admission'):
+                ticket = await llm_admission.admit_async()
+        except AdmissionRejected as e:
+            yield 'result', self._shed_response(e, app_name, action, parameters)
+            return
+
+        with ticket:
+            try:
+                with span('llm_slot'):
+                    slot = await self._concurrency_limiter().admit_async()
+            except AdmissionRejected as e:
+                yield 'result', self._shed_response(e, app_name, action, parameters)
+                return
+            with slot:
+                async for event, value in self._aiter_completion(prompt, use_stream, app_name, action,
+                                                                 cache_entry, record_entry):
+                    yield event, value
+
+    async def _aiter_completion(self, prompt: str, use_stream: bool, app_name: str, action: str,
+                                cache_entry: Optional[Tuple[Any, float]] = None,
+                                record_entry: Optional[Tuple[str, str, Dict[str, Any]]] = None
+                                ) -> AsyncIterator[Tuple[str, Any]]:
+        """调用大模型并产出文本片段和最终结果（异步版本，已获准入）"""
+        start_time = time.time()
+        llm_start = time.perf_counter()
+        first_delta = True
+        llm_done = False
+
+        try:
+            response = await self.async_client.chat.completions.create(**self._completion_kwargs(prompt, use_stream))
+
+            if use_stream:
+                result = ""
+                reasoning = ""
+                async for chunk in response:
+                    content, reasoning_content = self._read_delta(chunk)
+                    if content or reasoning_content:
+                        if first_delta:
+                            # 大模型首个输出片段的等待时间
+                            record_span('llm_ttft', llm_start)
+                            first_delta = False
+                        yield 'delta', content + reasoning_content
+                    result += content
+                    reasoning += reasoning_content
+                if not result and reasoning:
+                    result = reasoning
+                usage = None
+            else:
+                result = self._read_message(response)
+                usage = self._read_usage(response)
+            record_span('llm', llm_start)
+            observe_llm_call(self.model, time.time() - start_time, True, usage)
+            llm_done = True
+
+            final = self._finish_generation(prompt, result, time.time() - start_time, usage)
+            self._store_generated(final, cache_entry, record_entry)
+
+        except Exception as e:
+            if not llm_done:
+                record_span('llm', llm_start, error=True)
+                observe_llm_call(self.model, time.time() - start_time, False)
+            final = self._generation_failed(e, prompt, time.time() - start_time, app_name, action)
+
+        yield 'result', final
+
+    async def generate_response_async(self, app_info: Dict[str, Any], action: str, parameters: Dict[str, Any], action_def: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """生成模拟响应（异步版本，等待大模型期间不占用线程）"""
+        result = None
+        async for event, value in self.aiter_response(app_info, action, parameters, action_def):
+            if event == 'result':
+                result = value
+        return result
 
     def _generate_default_response(self, app_name: str, action: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """生成默认响应"""
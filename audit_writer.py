@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+异步批量审计日志写入器
+工具调用的审计记录先进入有界队列，由后台线程分批插入数据库，
+响应无需等待审计记录落库即可返回
+"""
+
+import os
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from models import db_manager, AuditLog
+from logger_utils import mcp_logger
+
+load_dotenv()
+
+
+class AuditLogWriter:
+    """审计日志后台写入器
+
+    Args:
+        db: 数据库管理器
+        queue_size: 队列容量，队列满时触发背压
+        batch_size: 单个事务最多插入的记录数
+        flush_interval: 队列为空时的等待间隔（秒）
+        enqueue_timeout: 队列满时提交方最多阻塞等待的秒数，0 表示立即丢弃
+    """
+
+    def __init__(self, db=None, queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 0.5, enqueue_timeout: float = 0.0):
+        self.db = db or db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计计数
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.failed = 0
+        self.batches = 0
+
+    def reset_after_fork(self):
+        """子进程中重置队列和线程状态（后台线程不会随fork复制）"""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        """首次提交时启动后台线程"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _count(self, name: str, value: int = 1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def submit(self, token_id: Optional[int], app_id: Optional[int], action: str,
+               params: Dict, response: Dict, ip: Optional[str] = None) -> bool:
+        """提交一条审计记录，返回是否成功入队（队列已满且等待超时则丢弃）"""
+        row = {
+            'token_id': token_id,
+            'application_id': app_id,
+            'action': action,
+            'parameters': params,
+            'response': response,
+            'ip_address': ip,
+            'timestamp': datetime.now(timezone.utc)
+        }
+
+        if self._stop_event.is_set():
+            # 已关闭时同步写入，避免丢失
+            self._write([row])
+            return True
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('backpressure')
+            try:
+                if self.enqueue_timeout <= 0:
+                    raise queue.Full
+                self._queue.put(row, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self._count('dropped')
+                mcp_logger.warning(f"Audit queue full, dropped audit log for action: {action}")
+                return False
+
+        self._count('enqueued')
+        return True
+
+    def _drain(self, first: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """从队列中取出一批记录"""
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            self._write(self._drain(first))
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        """在一个事务中批量插入审计记录"""
+        session = self.db.get_session()
+        try:
+            session.execute(insert(AuditLog), batch)
+            session.commit()
+            self._count('written', len(batch))
+            self._count('batches')
+        except Exception as e:
+            session.rollback()
+            self._count('failed', len(batch))
+            mcp_logger.error(f"Audit log batch insert failed ({len(batch)} rows): {e}")
+        finally:
+            session.close()
+
+    def close(self, timeout: float = 10.0):
+        """停止后台线程，写入队列中剩余的记录"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # 线程超时或未启动时，同步写入剩余记录
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._write(self._drain(first))
+
+    def queue_depth(self) -> int:
+        """当前队列深度"""
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取写入器统计信息"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'backpressure': self.backpressure,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+
+
+# 全局审计日志写入器
+audit_writer = AuditLogWriter(
+    queue_size=int(os.getenv('AUDIT_QUEUE_SIZE', '10000')),
+    batch_size=int(os.getenv('AUDIT_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('AUDIT_FLUSH_INTERVAL', '0.5')),
+    enqueue_timeout=float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', '0'))
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=audit_writer.reset_after_fork)
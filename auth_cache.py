@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+MCP请求路径的授权缓存
+缓存 token → (token_id, 可访问应用ID集合)、(category, name) → 应用
+和 token → 可访问应用列表（聚合端点），热点Token的鉴权不再访问数据库
+"""
+
+import os
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from cache_utils import CacheGeneration, TTLCache, cache_generation
+from models import db_manager, Application
+
+load_dotenv()
+
+
+class AuthCache:
+    """授权缓存
+
+    失效方式：
+    - TTL 过期（AUTH_CACHE_TTL，默认30秒；无效Token的否定缓存为 AUTH_NEGATIVE_CACHE_TTL，默认5秒）
+    - 管理后台修改Token/应用/权限时调用 invalidate_* 钩子，
+      本进程立即失效，其他进程通过缓存代数在 CACHE_GENERATION_CHECK_INTERVAL 内失效
+    """
+
+    def __init__(self, db=None, ttl: Optional[float] = None, maxsize: Optional[int] = None,
+                 generation: Optional[CacheGeneration] = None):
+        self.db = db or db_manager
+        self.generation = generation or cache_generation
+        ttl = ttl if ttl is not None else float(os.getenv('AUTH_CACHE_TTL', '30'))
+        maxsize = maxsize if maxsize is not None else int(os.getenv('AUTH_CACHE_SIZE', '4096'))
+        self.tokens = TTLCache(maxsize=maxsize, ttl=ttl, generation=self.generation)
+        self.apps = TTLCache(maxsize=maxsize, ttl=ttl, generation=self.generation)
+        self.token_apps = TTLCache(maxsize=maxsize, ttl=ttl, generation=self.generation)
+        # 无效Token的否定缓存：错误或未知的Token重复请求时不再每次查询数据库
+        negative_ttl = float(os.getenv('AUTH_NEGATIVE_CACHE_TTL', '5'))
+        self.invalid_tokens = TTLCache(maxsize=maxsize, ttl=negative_ttl, generation=self.generation)
+
+    def get_token(self, token_str: str) -> Optional[dict]:
+        """获取Token授权信息，包含 id、name、user_id、app_ids 和配额字段"""
+        if not token_str:
+            return None
+        info = self.tokens.get(token_str)
+        if info is None:
+            if self.invalid_tokens.contains(token_str):
+                return None
+            info = self.db.get_token_auth(token_str)
+            if not info:
+                self.invalid_tokens.set(token_str, True)
+                return None
+            self.tokens.set(token_str, info)
+        self.db.token_usage.record(info['id'])
+        return info
+
+    def get_application(self, category: str, name: str) -> Optional[Application]:
+        """根据路径获取应用（只读使用，不要修改返回对象）"""
+        key = (category, name)
+        app = self.apps.get(key)
+        if app is None:
+            app = self.db.get_application_by_path(category, name)
+            if app:
+                self.apps.set(key, app)
+        return app
+
+    def get_token_applications(self, token_str: str) -> Tuple[Application, ...]:
+        """获取Token可访问的全部已启用应用（聚合端点使用，只读）"""
+        apps = self.token_apps.get(token_str)
+        if apps is None:
+            apps = tuple(self.db.get_token_applications(token_str))
+            self.token_apps.set(token_str, apps)
+        return apps
+
+    def is_cached(self, token_str: Optional[str], category: Optional[str] = None,
+                  name: Optional[str] = None, token_apps: bool = False) -> bool:
+        """鉴权所需的信息是否都已缓存（为真时鉴权不访问数据库）
+
+        Args:
+            category, name: 同时检查应用路径是否已缓存
+            token_apps: 同时检查Token的可访问应用列表是否已缓存（聚合端点）
+        """
+        if not token_str:
+            return True
+        if category is not None and not self.apps.contains((category, name)):
+            return False
+        if self.invalid_tokens.contains(token_str):
+            return True
+        if not self.tokens.contains(token_str):
+            return False
+        return not token_apps or self.token_apps.contains(token_str)
+
+    def is_authorized(self, token_str: str, app_id: int) -> bool:
+        """检查Token是否有权访问指定应用"""
+        info = self.get_token(token_str)
+        return bool(info) and app_id in info['app_ids']
+
+    def invalidate_token(self, token_str: Optional[str] = None):
+        """失效Token缓存，不指定token_str时失效全部Token"""
+        if token_str:
+            self.tokens.pop(token_str)
+            self.token_apps.pop(token_str)
+            self.invalid_tokens.pop(token_str)
+        else:
+            self.tokens.clear()
+            self.token_apps.clear()
+            self.invalid_tokens.clear()
+        self.generation.bump()
+
+    def invalidate_app(self, category: Optional[str] = None, name: Optional[str] = None):
+        """失效应用缓存，不指定路径时失效全部应用
+
+        应用的启用状态会影响Token的可访问应用集合，因此同时失效Token缓存。
+        """
+        if category and name:
+            self.apps.pop((category, name))
+        else:
+            self.apps.clear()
+        self.tokens.clear()
+        self.token_apps.clear()
+        self.generation.bump()
+
+
+# 全局授权缓存实例
+auth_cache = AuthCache()
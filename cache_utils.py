@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+缓存工具
+提供线程安全的 LRU + TTL 缓存，以及跨进程的缓存代数（generation）失效信号
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CacheGeneration:
+    """跨进程缓存代数
+
+    管理后台与MCP服务器运行在不同进程中，进程内的失效钩子无法直接通知对方。
+    修改数据后调用 bump() 原子替换一个标记文件，各进程通过 os.stat 比较文件标识
+    即可感知变化并清空本地缓存，整个过程不访问数据库。
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._value = self._read()
+        self._checked_at = time.monotonic()
+
+    def _read(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def current(self) -> Optional[tuple]:
+        """获取当前代数（按 check_interval 节流 stat 调用）"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._value = self._read()
+            self._checked_at = now
+        return self._value
+
+    def bump(self):
+        """推进代数，使所有进程的本地缓存失效"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(f"{time.time_ns()}\n")
+        os.replace(tmp_path, self.path)
+        self._value = self._read()
+        self._checked_at = time.monotonic()
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 缓存
+
+    Args:
+        maxsize: 最大条目数，超出后淘汰最久未使用的条目
+        ttl: 默认过期时间（秒），None 表示不过期
+        generation: 可选的跨进程缓存代数，代数变化时清空缓存
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 60.0,
+                 generation: Optional[CacheGeneration] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = generation
+        self._seen_generation = generation.current() if generation else None
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _sync_generation(self):
+        """检查跨进程代数，变化时清空缓存（需持有锁）"""
+        if self._generation is None:
+            return
+        current = self._generation.current()
+        if current != self._seen_generation:
+            self._data.clear()
+            self._seen_generation = current
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值，不存在或已过期时返回 default"""
+        with self._lock:
+            self._sync_generation()
+            item = self._data.get(key, self._MISSING)
+            if item is self._MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key: Hashable) -> bool:
+        """检查是否有未过期的缓存值（不计入命中统计，不调整LRU顺序）"""
+        with self._lock:
+            self._sync_generation()
+            item = self._data.get(key, self._MISSING)
+            if item is self._MISSING:
+                return False
+            expires_at = item[1]
+            return expires_at is None or expires_at > time.monotonic()
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存值，ttl 为 None 时使用默认过期时间"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._sync_generation()
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回缓存值"""
+        with self._lock:
+            item = self._data.pop(key, self._MISSING)
+            return default if item is self._MISSING else item[0]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+# 全局缓存代数（与数据库位于同一数据目录）
+cache_generation = CacheGeneration(
+    os.getenv('CACHE_GENERATION_FILE', 'data/.cache_generation'),
+    check_interval=float(os.getenv('CACHE_GENERATION_CHECK_INTERVAL', '1.0'))
+)
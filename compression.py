@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+HTTP响应压缩
+根据 Accept-Encoding 协商 gzip / brotli，压缩超过阈值的文本类响应；
+SSE 等流式响应逐块压缩并立即刷新，每个事件帧仍然及时送达客户端
+"""
+
+import os
+import zlib
+from typing import Iterable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只协商 gzip
+    brotli = None
+
+# 是否启用响应压缩（默认开启）
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+# 响应体小于该字节数时不压缩（流式响应长度未知，总是压缩）
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+# gzip 压缩级别（1-9）和 brotli 压缩质量（0-11）
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
+# 服务端支持的编码，q 值相同时按此顺序优先
+AVAILABLE_ENCODINGS: Tuple[str, ...] = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+_COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+
+compressed_responses_total = metrics_registry.counter(
+    'unimcp_http_compressed_responses_total', 'HTTP responses compressed by encoding', ('encoding',)
+)
+compression_bytes_total = metrics_registry.counter(
+    'unimcp_http_compression_bytes_total', 'Bytes before and after response compression', ('stage',)
+)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据 Accept-Encoding 选择编码，客户端不接受任何可用编码时返回 None"""
+    if not accept_encoding:
+        return None
+    preferences = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        preferences[token] = quality
+
+    wildcard = preferences.get('*', 0.0)
+    candidates = [enc for enc in AVAILABLE_ENCODINGS if preferences.get(enc, wildcard) > 0]
+    # max 在 q 值相同时返回靠前的编码
+    return max(candidates, key=lambda enc: preferences.get(enc, wildcard), default=None)
+
+
+def _header(headers: Sequence[Tuple[str, str]], name: str) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """文本类内容（包括 text/event-stream 和 JSON）才压缩"""
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    return (mimetype.startswith('text/') or mimetype in _COMPRESSIBLE_TYPES
+            or mimetype.endswith('+json') or mimetype.endswith('+xml'))
+
+
+def should_compress(status: int, headers: Sequence[Tuple[str, str]], method: str) -> bool:
+    """根据状态码和响应头判断是否压缩"""
+    if method == 'HEAD' or status < 200 or status in (204, 206, 304):
+        return False
+    if _header(headers, 'content-encoding') or not is_compressible(_header(headers, 'content-type')):
+        return False
+    length = _header(headers, 'content-length')
+    if length is not None:
+        try:
+            return int(length) >= COMPRESSION_MIN_SIZE
+        except ValueError:
+            return False
+    return True
+
+
+def compressed_headers(headers: Sequence[Tuple[str, str]], encoding: str) -> List[Tuple[str, str]]:
+    """改写响应头：去掉长度和范围请求支持，添加 Content-Encoding 和 Vary，ETag 改为弱校验"""
+    result = []
+    vary = None
+    for key, value in headers:
+        lower = key.lower()
+        if lower in ('content-length', 'accept-ranges'):
+            continue
+        if lower == 'vary':
+            vary = value
+            continue
+        if lower == 'etag' and not value.startswith('W/'):
+            value = 'W/' + value
+        result.append((key, value))
+    result.append(('Content-Encoding', encoding))
+    if vary is None:
+        vary = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        vary = f'{vary}, Accept-Encoding'
+    result.append(('Vary', vary))
+    return result
+
+
+class StreamCompressor:
+    """增量压缩器
+
+    Args:
+        encoding: br 或 gzip
+        streaming: 流式响应每块压缩后立即刷新，保证事件帧及时送达
+    """
+
+    def __init__(self, encoding: str, streaming: bool = False):
+        self.encoding = encoding
+        self.streaming = streaming
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31：gzip 格式
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, last: bool = False) -> bytes:
+        """压缩一块数据，last 为 True 时结束压缩流"""
+        self.raw_bytes += len(data)
+        if self.encoding == 'br':
+            out = self._compressor.process(data) if data else b''
+            if last:
+                out += self._compressor.finish()
+            elif self.streaming:
+                out += self._compressor.flush()
+        else:
+            out = self._compressor.compress(data) if data else b''
+            if last:
+                out += self._compressor.flush(zlib.Z_FINISH)
+            elif self.streaming:
+                out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.compressed_bytes += len(out)
+        if last:
+            compressed_responses_total.inc(encoding=self.encoding)
+            compression_bytes_total.inc(self.raw_bytes, stage='raw')
+            compression_bytes_total.inc(self.compressed_bytes, stage='compressed')
+        return out
+
+
+class CompressionWSGIMiddleware:
+    """WSGI中间件：协商并压缩响应体"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate_encoding(environ.get('HTTP_ACCEPT_ENCODING')) if COMPRESSION_ENABLED else None
+        if encoding is None:
+            return self.wsgi_app(environ, start_response)
+
+        method = environ.get('REQUEST_METHOD', '')
+        compressor: List[StreamCompressor] = []
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if should_compress(int(status.split(' ', 1)[0]), headers, method):
+                streaming = _header(headers, 'content-length') is None
+                headers = compressed_headers(headers, encoding)
+                compressor.append(StreamCompressor(encoding, streaming))
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, compressing_start_response)
+        return _CompressedBody(body, compressor)
+
+
+class _CompressedBody:
+    """包装WSGI响应体，关闭时关闭原响应体（保留 call_on_close 等回调）"""
+
+    def __init__(self, body: Iterable[bytes], compressor: List[StreamCompressor]):
+        self._body = body
+        self._compressor = compressor
+
+    def __iter__(self):
+        if not self._compressor:
+            yield from self._body
+            return
+        compressor = self._compressor[0]
+        for chunk in self._body:
+            if chunk:
+                out = compressor.compress(chunk)
+                if out:
+                    yield out
+        yield compressor.compress(b'', last=True)
+
+    def close(self):
+        if hasattr(self._body, 'close'):
+            self._body.close()
+
+
+class CompressionASGIMiddleware:
+    """ASGI中间件：协商并压缩响应体"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        accept = None
+        for key, value in scope.get('headers', []):
+            if key == b'accept-encoding':
+                accept = value.decode('latin-1')
+                break
+        encoding = negotiate_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        compressor: Optional[StreamCompressor] = None
+
+        async def compressing_send(message):
+            nonlocal compressor
+            if message['type'] == 'http.response.start':
+                headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in message.get('headers', [])]
+                if should_compress(message['status'], headers, scope.get('method', '')):
+                    compressor = StreamCompressor(encoding, _header(headers, 'content-length') is None)
+                    message = {**message, 'headers': [
+                        (k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in compressed_headers(headers, encoding)
+                    ]}
+            elif message['type'] == 'http.response.body' and compressor is not None:
+                more_body = message.get('more_body', False)
+                message = {**message, 'body': compressor.compress(message.get('body', b''), last=not more_body)}
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
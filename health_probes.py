@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+健康检查探针
+数据库、大模型配置等探针由后台线程定期执行并缓存结果，
+/readyz 和 /health 只读取缓存，健康检查轮询不会给 SQLite 增加负载
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from models import db_manager
+from metrics import metrics_registry
+
+load_dotenv()
+
+# 进程启动时间（用于 /livez 的运行时长）
+STARTED_AT = time.monotonic()
+
+
+class HealthProbe:
+    """单个探针
+
+    Args:
+        name: 探针名称
+        check: 检查函数，返回 (是否正常, 详情字典)，抛出异常视为失败
+        critical: 关键探针失败时服务不可用（not_ready），非关键探针失败时为降级（degraded）
+    """
+
+    def __init__(self, name: str, check: Callable[[], Tuple[bool, Dict[str, Any]]], critical: bool = True):
+        self.name = name
+        self.check = check
+        self.critical = critical
+
+    def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            ok, detail = self.check()
+        except Exception as e:
+            ok, detail = False, {'error': str(e)}
+        return {
+            'status': 'ok' if ok else 'fail',
+            'critical': self.critical,
+            'detail': detail,
+            'checked_at': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            '_checked': time.monotonic()
+        }
+
+
+class HealthMonitor:
+    """定期执行探针并缓存结果
+
+    首次读取结果时启动后台线程（fork后的子进程中重新启动）；
+    结果超过 3 个检查周期未更新视为过期，按失败处理。
+
+    Args:
+        interval: 探针执行间隔（秒）
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._probes: Dict[str, HealthProbe] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def register(self, name: str, check: Callable[[], Tuple[bool, Dict[str, Any]]], critical: bool = True):
+        """注册探针（同名探针会被替换）"""
+        with self._lock:
+            self._probes[name] = HealthProbe(name, check, critical)
+
+    def reset_after_fork(self):
+        """子进程中重置线程状态（后台线程不会随fork复制）"""
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._results = {}
+
+    def run_probes(self):
+        """执行一轮探针"""
+        with self._lock:
+            probes = list(self._probes.values())
+        for probe in probes:
+            result = probe.run()
+            with self._lock:
+                self._results[probe.name] = result
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_probes()
+
+    def _ensure_started(self):
+        """首次使用时执行一轮探针并启动后台线程"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                # 首轮探针同步执行，并发的首次读取等待其完成
+                self.run_probes()
+                thread = threading.Thread(target=self._run, name='health-probes', daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def stop(self):
+        self._stop_event.set()
+
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        """获取缓存的探针结果（过期结果标记为失败）"""
+        self._ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+        for result in results.values():
+            if now - result.pop('_checked') > self.interval * 3:
+                result['status'] = 'fail'
+                result['stale'] = True
+        return results
+
+    def readiness(self) -> Tuple[Dict[str, Any], int]:
+        """就绪状态，返回 (响应体, HTTP状态码)
+
+        关键探针全部正常为 ready（非关键探针失败时为 degraded），均返回 200；
+        任一关键探针失败为 not_ready，返回 503。
+        """
+        checks = self.results()
+        failed = [name for name, result in checks.items() if result['status'] != 'ok']
+        if any(checks[name]['critical'] for name in failed):
+            status = 'not_ready'
+        elif failed:
+            status = 'degraded'
+        else:
+            status = 'ready'
+        return {
+            'status': status,
+            'checks': checks,
+            'timestamp': datetime.now().isoformat()
+        }, 503 if status == 'not_ready' else 200
+
+    def is_ok(self, name: str) -> Tuple[bool, Optional[str]]:
+        """获取单个探针的缓存结果，返回 (是否正常, 错误信息)"""
+        result = self.results().get(name)
+        if result is None:
+            return False, f'probe {name} not registered'
+        if result['status'] == 'ok':
+            return True, None
+        if result.get('stale'):
+            return False, f'probe {name} result is stale'
+        return False, result['detail'].get('error', f'probe {name} failed')
+
+
+def liveness(service: str, version: Optional[str] = None) -> Dict[str, Any]:
+    """存活状态（不访问数据库，进程能响应即为存活）"""
+    body = {
+        'status': 'alive',
+        'service': service,
+        'uptime': round(time.monotonic() - STARTED_AT, 1),
+        'timestamp': datetime.now().isoformat()
+    }
+    if version:
+        body['version'] = version
+    return body
+
+
+def check_database() -> Tuple[bool, Dict[str, Any]]:
+    """数据库探针：执行一次 SELECT 1"""
+    with db_manager.engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    return True, {'url': db_manager.engine.url.render_as_string(hide_password=True)}
+
+
+def check_llm_config() -> Tuple[bool, Dict[str, Any]]:
+    """大模型配置探针：数据库或环境变量中是否有可用的API Key（未配置时只能返回默认响应）"""
+    config = db_manager.get_llm_config()
+    if config and config.api_key:
+        return True, {'source': 'database', 'name': config.name, 'model': config.model_name}
+    if os.getenv('OPENAI_API_KEY'):
+        return True, {'source': 'env', 'model': os.getenv('OPENAI_MODEL', 'gpt-4o-mini')}
+    return False, {'error': 'No LLM API key configured, default responses only'}
+
+
+# 全局健康检查监控（每个进程一个）
+health_monitor = HealthMonitor(interval=float(os.getenv('HEALTH_PROBE_INTERVAL', '10')))
+health_monitor.register('database', check_database, critical=True)
+health_monitor.register('llm_config', check_llm_config, critical=False)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=health_monitor.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_health_check_ok', 'Cached health probe results (1 = ok)', lambda: {
+        name: 1 if result['status'] == 'ok' else 0 for name, result in health_monitor.results().items()
+    }, ('check',)
+)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+JSON编解码层
+统一SSE响应帧、审计记录和日志的JSON编码：可用时使用 orjson，
+输出紧凑格式（不缩进），预序列化的结果只编码一次，各处直接复用编码结果
+"""
+
+import os
+import json
+from typing import Any, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+# 编解码器选择：auto（默认，有 orjson 则使用）/ orjson / json
+_codec_setting = os.getenv('JSON_CODEC', 'auto').lower()
+USE_ORJSON = orjson is not None and _codec_setting in ('auto', 'orjson')
+CODEC_NAME = 'orjson' if USE_ORJSON else 'json'
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+class PreSerializedResult(dict):
+    """附带预序列化JSON的结果对象
+
+    仍然是普通 dict，可按常规方式使用；编码响应帧、写入审计记录时直接复用 json_bytes，
+    省去重复序列化。编码后请勿修改其内容。
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        super().__init__(data)
+        self.json_bytes = _encode(data)
+
+    @property
+    def json_text(self) -> str:
+        return self.json_bytes.decode('utf-8')
+
+
+def _encode(obj: Any) -> bytes:
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # orjson 不支持的类型（如超过64位的整数），回退到标准库
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj: Any) -> bytes:
+    """编码为紧凑的UTF-8 JSON字节串，预序列化结果直接返回缓存的编码"""
+    if isinstance(obj, PreSerializedResult):
+        return obj.json_bytes
+    return _encode(obj)
+
+
+def dumps_str(obj: Any) -> str:
+    """编码为紧凑的JSON字符串（用于日志和数据库JSON列）"""
+    return dumps(obj).decode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """解码JSON"""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def preserialize(data: Dict[str, Any]) -> PreSerializedResult:
+    """将结果编码一次，返回可在响应、审计和日志之间复用的对象"""
+    if isinstance(data, PreSerializedResult):
+        return data
+    return PreSerializedResult(data)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+大模型客户端连接池
+所有 OpenAI / AsyncOpenAI 客户端共用进程内的 HTTP 连接池，大量并发的模拟调用复用少量连接
+（使用 HTTP/2 在同一连接上多路复用）；每个大模型配置有独立的并发上限，
+请求超时取自配置
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+from dotenv import load_dotenv
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from admission import AdmissionController, llm_admission
+from logger_utils import mcp_logger
+from metrics import metrics_registry
+
+load_dotenv()
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # httpx[http2] 未安装时退回 HTTP/1.1 长连接
+    HTTP2_AVAILABLE = False
+
+# 大模型配置未设置时的默认请求超时（秒）和并发上限（0 表示不限制）
+DEFAULT_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '120'))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '0'))
+# 建立连接的超时上限（秒），请求超时更短时使用请求超时
+CONNECT_TIMEOUT = 10.0
+# 等待连接池空闲连接的超时（秒），与请求超时分开计算
+POOL_TIMEOUT = float(os.getenv('LLM_HTTP_POOL_TIMEOUT', '10'))
+
+
+def request_timeout(value: Optional[float]) -> float:
+    """配置中的请求超时，未设置时使用 LLM_REQUEST_TIMEOUT"""
+    return float(value) if value else DEFAULT_REQUEST_TIMEOUT
+
+
+def max_concurrency(value: Optional[int]) -> int:
+    """配置中的并发上限，未设置时使用 LLM_MAX_CONCURRENCY"""
+    return DEFAULT_MAX_CONCURRENCY if value is None else int(value)
+
+
+def _timeout(seconds: float) -> httpx.Timeout:
+    # 排队等待空闲连接不占用请求超时
+    return httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds), pool=POOL_TIMEOUT)
+
+
+class LLMClientPool:
+    """共享HTTP连接池和按配置的并发上限（每个进程一个）
+
+    同步客户端共用一个 httpx.Client；异步客户端共用所在事件循环的 httpx.AsyncClient
+    （异步连接绑定事件循环）。连接数超过 max_connections 时请求在池中排队等待空闲连接。
+
+    Args:
+        max_connections: 每个连接池的最大连接数
+        max_keepalive: 保持空闲的长连接数
+        http2: 是否启用 HTTP/2（需要 httpx[http2]，未安装时记录警告并使用 HTTP/1.1）
+        queue_size: 等待配置并发名额的队列容量
+        max_wait: 等待配置并发名额的最长秒数
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 20, http2: bool = False,
+                 queue_size: int = 256, max_wait: float = 15.0):
+        if http2 and not HTTP2_AVAILABLE:
+            mcp_logger.warning("LLM_HTTP2 is enabled but the h2 package is not installed "
+                               "(pip install 'httpx[http2]'); LLM calls fall back to HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[Tuple[str, str, float], OpenAI] = {}
+        self._async_clients: Dict[Tuple[str, str, float], AsyncOpenAI] = {}
+        self._limiters: Dict[Hashable, AdmissionController] = {}
+
+        # 统计信息
+        self.clients_created = 0
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive)
+
+    def reset_after_fork(self):
+        """子进程中丢弃继承的连接（套接字不能在进程间共享），首次使用时重新建立"""
+        self._lock = threading.Lock()
+        self._http_client = None
+        self._async_http_client = None
+        self._async_loop = None
+        self._clients = {}
+        self._async_clients = {}
+        self._limiters = {}
+
+    def _http_client_for(self) -> httpx.Client:
+        """进程共享的同步HTTP客户端（需持有锁）"""
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits(), http2=self.http2,
+                                             timeout=_timeout(DEFAULT_REQUEST_TIMEOUT))
+        return self._http_client
+
+    def _async_http_client_for(self, loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+        """当前事件循环共享的异步HTTP客户端（需持有锁，事件循环变化时重新创建）"""
+        if self._async_loop is not loop:
+            self._async_http_client = httpx.AsyncClient(limits=self._limits(), http2=self.http2,
+                                                        timeout=_timeout(DEFAULT_REQUEST_TIMEOUT))
+            self._async_loop = loop
+            self._async_clients = {}
+        return self._async_http_client
+
+    def openai_client(self, api_key: str, base_url: str, timeout: float) -> OpenAI:
+        """使用共享连接池的同步客户端（相同配置复用同一客户端）"""
+        key = (api_key, base_url, timeout)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    self.clients_created += 1
+                    client = self._clients[key] = OpenAI(
+                        api_key=api_key, base_url=base_url, timeout=_timeout(timeout),
+                        http_client=self._http_client_for()
+                    )
+        return client
+
+    def async_openai_client(self, api_key: str, base_url: str, timeout: float) -> AsyncOpenAI:
+        """使用当前事件循环共享连接池的异步客户端（必须在事件循环中调用）"""
+        loop = asyncio.get_running_loop()
+        key = (api_key, base_url, timeout)
+        with self._lock:
+            http_client = self._async_http_client_for(loop)
+            client = self._async_clients.get(key)
+            if client is None:
+                self.clients_created += 1
+                client = self._async_clients[key] = AsyncOpenAI(
+                    api_key=api_key, base_url=base_url, timeout=_timeout(timeout), http_client=http_client
+                )
+        return client
+
+    def limiter(self, config_key: Hashable, limit: int) -> AdmissionController:
+        """配置的并发上限（limit 为 0 时不限制），上限修改后新调用使用新的计数"""
+        limiter = self._limiters.get(config_key)
+        if limiter is None or limiter.max_active != limit:
+            with self._lock:
+                limiter = self._limiters.get(config_key)
+                if limiter is None or limiter.max_active != limit:
+                    limiter = self._limiters[config_key] = AdmissionController(
+                        max_active=limit, queue_size=self.queue_size, max_wait=self.max_wait
+                    )
+        return limiter
+
+    def active_by_config(self) -> Dict[str, int]:
+        """各配置进行中的大模型调用数"""
+        return {str(key): limiter.active() for key, limiter in list(self._limiters.items())}
+
+    def stats(self) -> Dict[str, Any]:
+        """获取连接池配置和各配置的并发统计"""
+        return {
+            'max_connections': self.max_connections,
+            'max_keepalive': self.max_keepalive,
+            'http2': self.http2,
+            'clients_created': self.clients_created,
+            'configs': {str(key): limiter.stats() for key, limiter in list(self._limiters.items())}
+        }
+
+
+def pool_size(configured: int, http2: bool, admitted: int) -> int:
+    """连接池最大连接数：HTTP/1.1 每个连接同时只承载一个请求，不低于准入控制放行的并发调用数"""
+    if http2 or admitted <= 0:
+        return configured
+    return max(configured, admitted)
+
+
+_http2 = os.getenv('LLM_HTTP2', 'true').lower() == 'true'
+_max_connections = pool_size(int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', '20')),
+                             _http2 and HTTP2_AVAILABLE, llm_admission.max_active)
+
+# 全局大模型客户端连接池
+llm_pool = LLMClientPool(
+    max_connections=_max_connections,
+    max_keepalive=int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', str(_max_connections))),
+    http2=_http2,
+    queue_size=int(os.getenv('LLM_ADMISSION_QUEUE_SIZE', '256')),
+    max_wait=float(os.getenv('LLM_ADMISSION_MAX_WAIT', '15'))
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=llm_pool.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_llm_config_active', 'LLM calls in flight per LLM config', llm_pool.active_by_config, ('config',)
+)
@@ -5,12 +5,12 @@
 """
 
 import os
-import json
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
+import json_codec
 
 load_dotenv()
 
@@ -109,10 +109,10 @@ class MCPLogger:
         if success:
             self.logger.info(f"{log_msg} - SUCCESS")
             if self.debug_enabled:
-                self.logger.debug(f"MCP Request Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+                self.logger.debug(f"MCP Request Details: {json_codec.dumps_str(log_data)}")
         else:
             self.logger.error(f"{log_msg} - FAILED: {error}")
-            self.logger.error(f"MCP Request Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+            self.logger.error(f"MCP Request Details: {json_codec.dumps_str(log_data)}")
 
     def log_ai_call(self, provider: str, model: str, prompt: str,
                    response: Optional[str] = None, success: bool = True,
@@ -140,10 +140,10 @@ class MCPLogger:
         if success:
             self.logger.info(f"{log_msg} - SUCCESS (duration: {duration:.2f}s)" if duration else f"{log_msg} - SUCCESS")
             if self.debug_enabled:
-                self.logger.debug(f"AI Call Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+                self.logger.debug(f"AI Call Details: {json_codec.dumps_str(log_data)}")
         else:
             self.logger.error(f"{log_msg} - FAILED: {error}")
-            self.logger.error(f"AI Call Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+            self.logger.error(f"AI Call Details: {json_codec.dumps_str(log_data)}")
 
     def log_tool_call(self, tool_name: str, arguments: Dict[str, Any],
                      result: Optional[Any] = None, success: bool = True,
@@ -171,10 +171,10 @@ class MCPLogger:
         if success:
             self.logger.info(f"{log_msg} - SUCCESS")
             if self.debug_enabled:
-                self.logger.debug(f"Tool Call Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+                self.logger.debug(f"Tool Call Details: {json_codec.dumps_str(log_data)}")
         else:
             self.logger.error(f"{log_msg} - FAILED: {error}")
-            self.logger.error(f"Tool Call Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+            self.logger.error(f"Tool Call Details: {json_codec.dumps_str(log_data)}")
 
     def log_auth_failure(self, reason: str, token: Optional[str] = None,
                         path: Optional[str] = None, ip: Optional[str] = None):
@@ -193,7 +193,7 @@ class MCPLogger:
             log_data['full_token'] = token
 
         self.logger.warning(f"Auth Failure: {reason} (path: {path}, ip: {ip})")
-        self.logger.warning(f"Auth Failure Details: {json.dumps(log_data, ensure_ascii=False)}")
+        self.logger.warning(f"Auth Failure Details: {json_codec.dumps_str(log_data)}")
 
     def log_database_operation(self, operation: str, details: Dict[str, Any],
                               success: bool = True, error: Optional[str] = None):
@@ -217,7 +217,7 @@ class MCPLogger:
         else:
             self.logger.error(f"{log_msg} - FAILED: {error}")
 
-        self.logger.debug(f"DB Operation Details: {json.dumps(log_data, ensure_ascii=False, indent=2)}")
+        self.logger.debug(f"DB Operation Details: {json_codec.dumps_str(log_data)}")
 
     def info(self, message: str):
         """信息日志"""
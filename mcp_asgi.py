@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+UniMCPSim MCP服务器 - ASGI服务模式
+基于 Starlette + uvicorn，tools/call 在事件循环中等待大模型响应，
+并发请求数不再受限于线程数。启用方式：MCP_SERVER_MODE=asgi
+"""
+
+import time
+import asyncio
+from typing import Callable
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from mcp_server import (
+    AGGREGATE_PATH, SSE_STREAM_HEADERS, acquire_quota, aggregate_auth_cached, authorize_aggregate_request,
+    authorize_product_request, build_aggregate_info, build_app_info, build_sse_message, collect_batch_async,
+    encode_jsonrpc_batch, get_progress_token, handle_mcp_request_async, get_version, health_status,
+    issue_session_id, log_mcp_post, open_notification_stream, product_auth_cached, route_aggregate_call,
+    stream_batch_async, stream_notifications_async, stream_tool_call_async, validate_batch, wants_event_stream
+)
+from logger_utils import mcp_logger
+from request_timing import TimingASGIMiddleware
+from compression import CompressionASGIMiddleware
+from metrics import metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from rate_limiter import QuotaLease
+from health_probes import health_monitor, liveness
+
+
+def _is_json_request(request: Request) -> bool:
+    """与 Flask request.is_json 一致的判断"""
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    return mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+
+class QuotaReleasingResponse:
+    """包装响应：响应发送完毕（或客户端断开）后释放并发配额"""
+
+    def __init__(self, response: Response, lease: QuotaLease):
+        self.response = response
+        self.lease = lease
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self.lease.release()
+
+
+async def aggregate_endpoint(request: Request) -> Response:
+    """处理聚合端点：一个连接访问Token有权限的全部应用"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=200)
+
+    token = request.query_params.get('token')
+    remote_addr = request.client.host if request.client else None
+
+    if aggregate_auth_cached(token):
+        aggregate, error = authorize_aggregate_request(token, remote_addr)
+    else:
+        aggregate, error = await asyncio.to_thread(authorize_aggregate_request, token, remote_addr)
+    if error:
+        body, status = error
+        return JSONResponse(body, status_code=status)
+
+    return await serve_mcp_endpoint(request, AGGREGATE_PATH, token, {'aggregate': aggregate},
+                                    lambda: build_aggregate_info(aggregate))
+
+
+async def product_endpoint(request: Request) -> Response:
+    """处理产品特定的端点"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=200)
+
+    product_path = request.path_params['product_path']
+    token = request.query_params.get('token')
+    headers = dict(request.headers)
+    remote_addr = request.client.host if request.client else None
+
+    # 授权信息命中缓存时不访问数据库，直接在事件循环中执行；未命中时在线程池中查询数据库
+    if product_auth_cached(product_path, token):
+        app_obj, error = authorize_product_request(product_path, token, request.method, headers, remote_addr)
+    else:
+        app_obj, error = await asyncio.to_thread(
+            authorize_product_request, product_path, token, request.method, headers, remote_addr
+        )
+    if error:
+        body, status = error
+        return JSONResponse(body, status_code=status)
+
+    return await serve_mcp_endpoint(request, product_path, token, {'app': app_obj}, lambda: build_app_info(app_obj))
+
+
+async def serve_mcp_endpoint(request: Request, product_path: str, token: str, target: dict,
+                             build_info: Callable[[], dict]) -> Response:
+    """处理已通过鉴权的MCP端点请求：GET 返回端点信息或打开通知流，POST 处理MCP协议"""
+    headers = dict(request.headers)
+    session_id = request.headers.get('mcp-session-id')
+
+    app_context = {
+        **target,
+        'token': token,
+        'ip_address': request.client.host if request.client else None
+    }
+
+    if request.method == 'GET':
+        lease, quota_error = acquire_quota(app_context, token, None, request.method, product_path, headers)
+        if quota_error:
+            body, status, quota_headers = quota_error
+            return JSONResponse(body, status_code=status, headers=quota_headers)
+
+        if wants_event_stream(request.headers.get('accept')):
+            # 会话的服务端通知流（长连接不占用并发配额）
+            with lease:
+                subscription, error = open_notification_stream(
+                    session_id, app_context, product_path, token, headers, asyncio.get_running_loop()
+                )
+            if error:
+                body, status = error
+                return JSONResponse(body, status_code=status)
+            return StreamingResponse(
+                stream_notifications_async(subscription),
+                media_type='text/event-stream',
+                headers=SSE_STREAM_HEADERS
+            )
+
+        with lease:
+            response_data = build_info()
+        mcp_logger.log_mcp_request(
+            method=request.method,
+            path=f"/{product_path}",
+            token=token,
+            headers=headers,
+            success=True,
+            response=response_data
+        )
+        return JSONResponse(response_data)
+
+    # POST请求处理MCP协议
+    if not _is_json_request(request):
+        mcp_logger.log_mcp_request(
+            method=request.method,
+            path=f"/{product_path}",
+            token=token,
+            headers=headers,
+            success=False,
+            error="Content-Type must be application/json"
+        )
+        return JSONResponse({"error": "Content-Type must be application/json"}, status_code=400)
+
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+
+    if isinstance(data, list):
+        batch_error = validate_batch(data)
+        if batch_error:
+            body, status = batch_error
+            return JSONResponse(body, status_code=status)
+
+    # 配额检查在任何数据库和大模型处理之前完成
+    lease, quota_error = acquire_quota(app_context, token, data, request.method, product_path, headers)
+    if quota_error:
+        body, status, quota_headers = quota_error
+        return JSONResponse(body, status_code=status, headers=quota_headers)
+
+    try:
+        response = await dispatch_product_post(request, data, session_id, app_context, product_path, token, headers)
+    except BaseException:
+        lease.release()
+        raise
+    # 流式响应发送完毕（或客户端断开）后才释放并发配额
+    return QuotaReleasingResponse(response, lease)
+
+
+async def dispatch_product_post(request: Request, data, session_id, app_context: dict,
+                                product_path: str, token: str, headers: dict) -> Response:
+    """处理产品端点的MCP POST请求（已通过鉴权和配额检查）"""
+    # JSON-RPC 批量请求：鉴权只做一次，各调用并发执行
+    if isinstance(data, list):
+        if wants_event_stream(request.headers.get('accept')):
+            return StreamingResponse(
+                stream_batch_async(data, session_id, app_context, product_path, headers),
+                media_type='text/event-stream',
+                headers=SSE_STREAM_HEADERS
+            )
+        responses = await collect_batch_async(data, session_id, app_context, product_path, headers)
+        if not responses:
+            # 批次中全部是通知
+            return Response(status_code=202)
+        return Response(encode_jsonrpc_batch(responses), media_type='application/json')
+
+    # 聚合端点的工具调用路由到目标应用
+    data, app_context, product_path = route_aggregate_call(data, app_context, product_path)
+
+    # 客户端请求进度通知时，边生成边推送
+    progress_token = get_progress_token(data, app_context)
+    if progress_token is not None:
+        return StreamingResponse(
+            stream_tool_call_async(data, app_context, progress_token, product_path, headers),
+            media_type='text/event-stream',
+            headers=SSE_STREAM_HEADERS
+        )
+
+    # initialize请求在处理前分配会话ID，与本次请求绑定
+    new_session_id = issue_session_id(data, session_id)
+    started = time.perf_counter()
+
+    try:
+        response = await handle_mcp_request_async(data, new_session_id or session_id, app_context)
+        log_mcp_post(data, product_path, token, headers, response=response, started=started)
+
+        resp = Response(build_sse_message(response), media_type='text/event-stream')
+        if new_session_id:
+            resp.headers['mcp-session-id'] = new_session_id
+        return resp
+
+    except Exception as e:
+        error_msg = str(e)
+        log_mcp_post(data, product_path, token, headers, error=error_msg, started=started)
+        mcp_logger.error(f"MCP request processing error: {error_msg}", exc_info=True)
+        return JSONResponse({"error": f"Internal server error: {error_msg}"}, status_code=500)
+
+
+async def health_endpoint(request: Request) -> Response:
+    """健康检查端点"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=200)
+
+    if not health_monitor.started:
+        # 首轮探针访问数据库，在线程池中执行
+        await asyncio.to_thread(health_monitor.results)
+    body, status = health_status()
+    return JSONResponse(body, status_code=status)
+
+
+async def liveness_endpoint(request: Request) -> Response:
+    """存活检查（不访问数据库）"""
+    return JSONResponse(liveness("UniMCPSim", get_version()))
+
+
+async def readiness_endpoint(request: Request) -> Response:
+    """就绪检查（返回缓存的探针结果）"""
+    if not health_monitor.started:
+        await asyncio.to_thread(health_monitor.results)
+    body, status = health_monitor.readiness()
+    return JSONResponse(body, status_code=status)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus 指标端点"""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+asgi_app = Starlette(
+    routes=[
+        Route('/health', health_endpoint, methods=['GET', 'HEAD', 'OPTIONS']),
+        Route('/livez', liveness_endpoint, methods=['GET', 'HEAD']),
+        Route('/readyz', readiness_endpoint, methods=['GET', 'HEAD']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+        Route(f'/{AGGREGATE_PATH}', aggregate_endpoint, methods=['GET', 'POST', 'OPTIONS']),
+        Route('/{product_path:path}', product_endpoint, methods=['GET', 'POST', 'OPTIONS']),
+    ],
+    middleware=[
+        # 请求耗时分解（Server-Timing 响应头 / JSON Lines 追踪文件）
+        Middleware(TimingASGIMiddleware),
+        # 按 Accept-Encoding 压缩响应（SSE 逐帧刷新）
+        Middleware(CompressionASGIMiddleware),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type", "Accept", "Authorization", "mcp-session-id"]
+        )
+    ]
+)
+
@@ -9,10 +9,13 @@ import json
 import asyncio
 import threading
 import uuid
-from typing import Dict, Any, Optional, List
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from typing import Dict, Any, Callable, Optional, List, Iterator, AsyncIterator, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import re
 
@@ -20,6 +23,24 @@ from fastmcp import FastMCP
 from pydantic import BaseModel
 from models import db_manager, ApplicationTemplate, Action, ActionParameter, Application
 from ai_generator import ai_generator
+from auth_cache import auth_cache
+from audit_writer import audit_writer
+from template_cache import AggregateTemplate, namespaced_tool_name, template_registry
+from prompt_registry import prompt_registry
+from json_codec import PreSerializedResult, preserialize
+import json_codec
+from request_timing import span, TimingWSGIMiddleware
+from compression import CompressionWSGIMiddleware
+from metrics import metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from session_store import session_store
+from rate_limiter import QuotaLease, quota_limiter
+from admission import llm_admission
+from health_probes import health_monitor, liveness
+from tool_notifications import KEEPALIVE_INTERVAL, Subscription, tool_notifier
+from response_cache import response_cache
+from response_recorder import response_recorder
+from llm_pool import llm_pool
+from singleflight import llm_flights
 from version import get_version
 from logger_utils import mcp_logger
 
@@ -29,9 +50,8 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app, origins="*", methods=["GET", "POST", "OPTIONS"],
      allow_headers=["Content-Type", "Accept", "Authorization", "mcp-session-id"])
-
-# 会话管理
-sessions = {}
+# 请求耗时分解（Server-Timing 响应头 / JSON Lines 追踪文件），内层按 Accept-Encoding 压缩响应
+app.wsgi_app = TimingWSGIMiddleware(CompressionWSGIMiddleware(app.wsgi_app))
 
 # 创建FastMCP实例（用于MCP协议处理）
 mcp = FastMCP(
@@ -60,70 +80,143 @@ class SimulatorEngine:
 
     def __init__(self):
         self.db = db_manager
-
-    def process_request(self, category: str, product: str, action: str, params: Dict[str, Any], token: str, ip_address: str = None) -> Dict[str, Any]:
-        """处理模拟请求"""
-
-        # 验证Token
-        token_info = self.db.validate_token(token)
-        if not token_info:
-            return {"error": "Invalid token", "code": 401}
-
-        # 获取应用
-        app = self.db.get_application_by_path(category, product)
-        if not app:
-            return {"error": f"Application {category}/{product} not found", "code": 404}
-
-        # 检查权限
-        apps = self.db.get_token_applications(token)
-        app_ids = [a.id for a in apps]
-        if app.id not in app_ids:
-            return {"error": "Access denied", "code": 403}
-
-        # 解析模板
-        template = app.template if app.template else {}
-        actions = template.get('actions', [])
-
-        # 查找动作
-        action_def = None
-        for act in actions:
-            if act.get('name') == action:
-                action_def = act
-                break
-
-        if not action_def:
-            return {"error": f"Action {action} not found", "code": 404}
-
-        # 验证参数
-        required_params = [p for p in action_def.get('parameters', []) if p.get('required', False)]
-        for param in required_params:
-            if param['key'] not in params:
-                return {"error": f"Missing required parameter: {param['key']}", "code": 400}
-
-        # 准备应用信息（包含完整上下文）
+        self.auth = auth_cache
+
+    def _prepare_request(self, category: str, product: str, action: str, params: Dict[str, Any], token: str):
+        """校验Token、应用、动作和参数
+
+        Returns:
+            (错误响应, None) 或 (None, 调用上下文)
+        """
+
+        with span('auth'):
+            # 验证Token（命中授权缓存时不访问数据库）
+            token_info = self.auth.get_token(token)
+            if not token_info:
+                return {"error": "Invalid token", "code": 401}, None
+
+            # 获取应用
+            app = self.auth.get_application(category, product)
+            if not app:
+                return {"error": f"Application {category}/{product} not found", "code": 404}, None
+
+            # 检查权限
+            if app.id not in token_info['app_ids']:
+                return {"error": "Access denied", "code": 403}, None
+
+        with span('template'):
+            # 查找动作（按模板版本编译的索引）
+            compiled_action = template_registry.get(app).get_action(action)
+            if not compiled_action:
+                return {"error": f"Action {action} not found", "code": 404}, None
+
+        with span('validate'):
+            # 按编译好的校验器检查类型、枚举和必填参数，并填入默认值；不合法的调用不会消耗大模型token
+            arguments, errors = compiled_action.validator.validate(params)
+            if errors:
+                message = errors[0] if len(errors) == 1 else "Invalid parameters: " + "; ".join(errors)
+                return {"error": message, "code": 400}, None
+
+        # 准备应用信息（包含完整上下文，以及响应缓存所需的应用版本、缓存和合并设置）
         app_info = {
             'category': app.category,
             'name': app.name,
             'display_name': app.display_name,
             'description': app.description or '',
-            'ai_notes': app.ai_notes or ''
+            'ai_notes': app.ai_notes or '',
+            'id': app.id,
+            'version': app.updated_at,
+            'response_cache_ttl': app.response_cache_ttl,
+            'response_cache_always_fresh': bool(app.response_cache_always_fresh),
+            'response_distinct': bool(app.response_distinct)
         }
 
+        return None, {
+            'token_info': token_info,
+            'app': app,
+            'app_info': app_info,
+            'action_def': compiled_action.definition,
+            'arguments': arguments
+        }
+
+    async def _prepare_request_async(self, category: str, product: str, action: str,
+                                     params: Dict[str, Any], token: str):
+        """_prepare_request 的异步版本：授权缓存未命中时在线程池中查询数据库，不阻塞事件循环"""
+        if self.auth.is_cached(token, category, product):
+            return self._prepare_request(category, product, action, params, token)
+        return await asyncio.to_thread(self._prepare_request, category, product, action, params, token)
+
+    def _record(self, call: Dict[str, Any], action: str, params: Dict[str, Any],
+                response: Dict[str, Any], ip_address: str = None):
+        """记录日志（异步批量写入，不阻塞响应）"""
+        with span('audit'):
+            audit_writer.submit(
+                token_id=call['token_info']['id'],
+                app_id=call['app'].id,
+                action=action,
+                params=params,
+                response=response,
+                ip=ip_address
+            )
+
+    def process_request(self, category: str, product: str, action: str, params: Dict[str, Any], token: str, ip_address: str = None) -> Dict[str, Any]:
+        """处理模拟请求"""
+        error, call = self._prepare_request(category, product, action, params, token)
+        if error:
+            return error
+
         # 生成响应（传递应用完整信息和动作定义）
-        response = ai_generator.generate_response(app_info, action, params, action_def)
-
-        # 记录日志
-        self.db.log_action(
-            token_id=token_info['id'],
-            app_id=app.id,
-            action=action,
-            params=params,
-            response=response,
-            ip=ip_address
-        )
+        response = ai_generator.generate_response(call['app_info'], action, call['arguments'], call['action_def'])
+
+        # 编码一次，响应帧和审计记录复用同一份编码结果
+        response = preserialize(response)
+        self._record(call, action, call['arguments'], response, ip_address)
+        return response
+
+    async def process_request_async(self, category: str, product: str, action: str, params: Dict[str, Any], token: str, ip_address: str = None) -> Dict[str, Any]:
+        """处理模拟请求（异步版本，用于ASGI服务模式）"""
+        error, call = await self._prepare_request_async(category, product, action, params, token)
+        if error:
+            return error
+
+        response = await ai_generator.generate_response_async(call['app_info'], action, call['arguments'], call['action_def'])
 
+        response = preserialize(response)
+        self._record(call, action, call['arguments'], response, ip_address)
         return response
 
+    def iter_process_request(self, category: str, product: str, action: str, params: Dict[str, Any],
+                             token: str, ip_address: str = None) -> Iterator[Tuple[str, Any]]:
+        """处理模拟请求（生成器版本），以stream模式调用大模型
+
+        Yields:
+            ('delta', 文本片段) 零到多次，最后一次为 ('result', 响应字典)
+        """
+        error, call = self._prepare_request(category, product, action, params, token)
+        if error:
+            yield 'result', error
+            return
+
+        for event, value in ai_generator.iter_response(call['app_info'], action, call['arguments'], call['action_def'], stream=True):
+            if event == 'result':
+                value = preserialize(value)
+                self._record(call, action, call['arguments'], value, ip_address)
+            yield event, value
+
+    async def aiter_process_request(self, category: str, product: str, action: str, params: Dict[str, Any],
+                                    token: str, ip_address: str = None) -> AsyncIterator[Tuple[str, Any]]:
+        """处理模拟请求（异步生成器版本），事件格式同 iter_process_request"""
+        error, call = await self._prepare_request_async(category, product, action, params, token)
+        if error:
+            yield 'result', error
+            return
+
+        async for event, value in ai_generator.aiter_response(call['app_info'], action, call['arguments'], call['action_def'], stream=True):
+            if event == 'result':
+                value = preserialize(value)
+                self._record(call, action, call['arguments'], value, ip_address)
+            yield event, value
+
 
 # 全局模拟器引擎
 simulator = SimulatorEngine()
@@ -146,6 +239,46 @@ async def test_tool() -> str:
 # 认证将通过其他方式处理
 
 
+def build_tool_call_response(request_id: Any, tool_name: str, arguments: Dict[str, Any],
+                             result: Dict[str, Any], app_path: str) -> dict:
+    """记录工具调用并构建 tools/call 的JSON-RPC响应"""
+    # 判断是否成功
+    # 成功条件：没有error字段 且 (没有code字段或code < 400)
+    success = 'error' not in result and result.get('code', 200) < 400
+
+    # 记录工具调用
+    mcp_logger.log_tool_call(
+        tool_name=tool_name,
+        arguments=arguments,
+        result=result,
+        success=success,
+        error=result.get('error') if not success else None,
+        app_path=app_path
+    )
+
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": {
+            "content": [{
+                "type": "text",
+                "text": json_codec.dumps_str(result)
+            }]
+        }
+    }
+
+
+def log_tool_call_error(tool_name: str, arguments: Dict[str, Any], error: Exception, app_path: str):
+    """记录失败的工具调用"""
+    mcp_logger.log_tool_call(
+        tool_name=tool_name,
+        arguments=arguments,
+        success=False,
+        error=str(error),
+        app_path=app_path
+    )
+
+
 # MCP协议处理函数
 def handle_mcp_request(data: dict, session_id: str = None, app_context: dict = None) -> dict:
     """处理MCP协议请求"""
@@ -153,16 +286,13 @@ def handle_mcp_request(data: dict, session_id: str = None, app_context: dict = N
     params = data.get('params', {})
     request_id = data.get('id')
 
+    # 刷新会话的最近活动时间
+    if session_id and method != 'initialize':
+        session_store.touch(session_id)
+
     if method == 'initialize':
-        # 创建新会话
-        if not session_id:
-            session_id = str(uuid.uuid4())
-
-        sessions[session_id] = {
-            'initialized': True,
-            'client_info': params.get('clientInfo', {}),
-            'created_at': datetime.now()
-        }
+        # 创建新会话（会话存储有容量上限和空闲过期）
+        session_store.create(session_id, params.get('clientInfo', {}))
 
         return {
             "jsonrpc": "2.0",
@@ -184,92 +314,32 @@ def handle_mcp_request(data: dict, session_id: str = None, app_context: dict = N
         }
 
     elif method == 'tools/list':
-        tools = []
-
-        # 如果有应用上下文，生成该应用的专用工具
+        # 如果有应用上下文，返回该应用的专用工具（按应用版本缓存的编译结果）
         if app_context and 'app' in app_context:
-            app = app_context['app']
-            token = app_context.get('token')
-
-            # 获取应用的actions
-            template = app.template if app.template else {}
-            actions = template.get('actions', [])
-
-            # 为每个action生成一个MCP工具
-            for action in actions:
-                action_name = action.get('name', '')
-                action_display_name = action.get('display_name', action_name)
-                action_description = action.get('description', '')
-                action_parameters = action.get('parameters', [])
-
-                # 构建输入schema
-                input_schema = {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                }
-
-                for param in action_parameters:
-                    param_key = param.get('key', '')
-                    param_type = param.get('type', 'String').lower()
-                    param_description = param.get('description', '')
-                    param_required = param.get('required', False)
-                    param_default = param.get('default')
-                    param_options = param.get('options', [])
-
-                    # 映射类型
-                    schema_type = "string"
-                    if param_type in ["integer", "int"]:
-                        schema_type = "integer"
-                    elif param_type in ["boolean", "bool"]:
-                        schema_type = "boolean"
-                    elif param_type == "array":
-                        schema_type = "array"
-
-                    prop_schema = {
-                        "type": schema_type,
-                        "description": param_description
-                    }
-
-                    if param_default is not None:
-                        prop_schema["default"] = param_default
-
-                    if param_options:
-                        prop_schema["enum"] = param_options
-
-                    if schema_type == "array":
-                        prop_schema["items"] = {"type": "string"}
-
-                    input_schema["properties"][param_key] = prop_schema
-
-                    if param_required:
-                        input_schema["required"].append(param_key)
-
-                tools.append({
-                    "name": action_name,
-                    "description": f"{action_display_name} - {action_description}",
-                    "inputSchema": input_schema
-                })
-
-        # 仅返回当前应用的专用工具
+            result = template_registry.get(app_context['app']).tools_result
+        elif app_context and 'aggregate' in app_context:
+            # 聚合端点返回全部应用带前缀的工具
+            result = app_context['aggregate'].tools_result
+        else:
+            result = {"tools": []}
 
         return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {
-                "tools": tools
-            }
+            "result": result
         }
 
     elif method == 'tools/call':
         tool_name = params.get('name')
         arguments = params.get('arguments', {})
 
+        if app_context and 'aggregate' in app_context:
+            # 聚合端点的调用已由 route_aggregate_call 改写为目标应用的调用，此处只剩未知工具名
+            return jsonrpc_error(request_id, -32602, f"Unknown tool: {tool_name}")
+
         if app_context and 'app' in app_context:
             # 处理应用特定的工具调用
             app = app_context['app']
-            token = app_context.get('token')
-            ip_address = app_context.get('ip_address')
             app_path = f"{app.category}/{app.name}"
 
             try:
@@ -278,44 +348,13 @@ def handle_mcp_request(data: dict, session_id: str = None, app_context: dict = N
                     app.name,
                     tool_name,  # 工具名称就是action名称
                     arguments,
-                    token,
-                    ip_address
-                )
-
-                # 判断是否成功
-                # 成功条件：没有error字段 且 (没有code字段或code < 400)
-                success = 'error' not in result and result.get('code', 200) < 400
-
-                # 记录工具调用
-                mcp_logger.log_tool_call(
-                    tool_name=tool_name,
-                    arguments=arguments,
-                    result=result,
-                    success=success,
-                    error=result.get('error') if not success else None,
-                    app_path=app_path
+                    app_context.get('token'),
+                    app_context.get('ip_address')
                 )
-
-                return {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [{
-                            "type": "text",
-                            "text": json.dumps(result, ensure_ascii=False, indent=2)
-                        }]
-                    }
-                }
+                return build_tool_call_response(request_id, tool_name, arguments, result, app_path)
 
             except Exception as e:
-                error_msg = str(e)
-                mcp_logger.log_tool_call(
-                    tool_name=tool_name,
-                    arguments=arguments,
-                    success=False,
-                    error=error_msg,
-                    app_path=app_path
-                )
+                log_tool_call_error(tool_name, arguments, e, app_path)
                 raise
 
     # 处理 ping 方法（心跳检测）
@@ -349,167 +388,930 @@ def handle_mcp_request(data: dict, session_id: str = None, app_context: dict = N
     }
 
 
-# Flask路由
-@app.route('/<path:product_path>', methods=['GET', 'POST', 'OPTIONS'])
-def handle_product_endpoint(product_path):
-    """处理产品特定的端点"""
-    if request.method == 'OPTIONS':
-        return '', 200
+async def handle_mcp_request_async(data: dict, session_id: str = None, app_context: dict = None) -> dict:
+    """处理MCP协议请求（异步版本）
+
+    tools/call 在事件循环中等待大模型响应，其余方法不涉及IO，直接复用同步实现。
+    """
+    if data.get('method') != 'tools/call' or not (app_context and 'app' in app_context):
+        return handle_mcp_request(data, session_id, app_context)
+
+    params = data.get('params', {})
+    tool_name = params.get('name')
+    arguments = params.get('arguments', {})
+    app = app_context['app']
+    app_path = f"{app.category}/{app.name}"
+
+    try:
+        result = await simulator.process_request_async(
+            app.category,
+            app.name,
+            tool_name,
+            arguments,
+            app_context.get('token'),
+            app_context.get('ip_address')
+        )
+        return build_tool_call_response(data.get('id'), tool_name, arguments, result, app_path)
+
+    except Exception as e:
+        log_tool_call_error(tool_name, arguments, e, app_path)
+        raise
+
+
+def encode_jsonrpc_response(response: Optional[dict]) -> bytes:
+    """编码JSON-RPC响应，预序列化的结果直接拼接"""
+    if isinstance(response, dict) and isinstance(response.get('result'), PreSerializedResult):
+        request_id = json_codec.dumps(response.get('id'))
+        return b'{"jsonrpc":"2.0","id":' + request_id + b',"result":' + response['result'].json_bytes + b'}'
+    return json_codec.dumps(response)
 
+
+def build_sse_message(response: Optional[dict]) -> bytes:
+    """构建SSE消息帧"""
+    with span('encode'):
+        return b"event: message\ndata: " + encode_jsonrpc_response(response) + b"\n\n"
+
+
+# 流式响应的进度通知最小间隔（秒）
+PROGRESS_INTERVAL = float(os.getenv('MCP_PROGRESS_INTERVAL', '0.25'))
+
+# 流式SSE响应头，避免反向代理缓冲
+SSE_STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+
+def get_progress_token(data: dict, app_context: Optional[dict]):
+    """获取需要流式返回进度通知的 tools/call 请求的 progressToken，不需要时返回 None
+
+    按MCP规范，仅当客户端在 params._meta 中提供 progressToken 时才发送进度通知。
+    """
+    if not isinstance(data, dict) or data.get('method') != 'tools/call':
+        return None
+    if not (app_context and 'app' in app_context):
+        return None
+    params = data.get('params') or {}
+    meta = params.get('_meta') or {}
+    return meta.get('progressToken')
+
+
+class ToolCallStream:
+    """将工具调用的生成事件转换为SSE帧：节流的进度通知，最后是调用结果"""
+
+    def __init__(self, data: dict, app_context: dict, progress_token: Any,
+                 product_path: str, headers: Dict[str, str]):
+        self.data = data
+        self.app_context = app_context
+        self.progress_token = progress_token
+        self.product_path = product_path
+        self.headers = headers
+
+        params = data.get('params', {})
+        self.tool_name = params.get('name')
+        self.arguments = params.get('arguments', {})
+        app = app_context['app']
+        self.app_path = f"{app.category}/{app.name}"
+        self.call_args = (app.category, app.name, self.tool_name, self.arguments,
+                          app_context.get('token'), app_context.get('ip_address'))
+
+        self.received = 0
+        self._last_sent = None
+        self.started = time.perf_counter()
+
+    def feed(self, event: str, value: Any) -> Optional[bytes]:
+        """处理一个生成事件，返回需要发送的SSE帧（无需发送时返回 None）"""
+        if event == 'delta':
+            self.received += len(value)
+            now = time.monotonic()
+            # 第一个片段立即发送，之后按间隔节流
+            if self._last_sent is not None and now - self._last_sent < PROGRESS_INTERVAL:
+                return None
+            self._last_sent = now
+            return build_sse_message({
+                "jsonrpc": "2.0",
+                "method": "notifications/progress",
+                "params": {
+                    "progressToken": self.progress_token,
+                    "progress": self.received,
+                    "message": f"Generating response ({self.received} chars)"
+                }
+            })
+
+        response = build_tool_call_response(self.data.get('id'), self.tool_name, self.arguments, value, self.app_path)
+        log_mcp_post(self.data, self.product_path, self.app_context.get('token'), self.headers,
+                     response=response, started=self.started)
+        return build_sse_message(response)
+
+    def fail(self, error: Exception) -> bytes:
+        """响应头已发送，以JSON-RPC错误帧结束流"""
+        error_msg = str(error)
+        log_tool_call_error(self.tool_name, self.arguments, error, self.app_path)
+        log_mcp_post(self.data, self.product_path, self.app_context.get('token'), self.headers,
+                     error=error_msg, started=self.started)
+        mcp_logger.error(f"MCP request processing error: {error_msg}", exc_info=True)
+        return build_sse_message({
+            "jsonrpc": "2.0",
+            "id": self.data.get('id'),
+            "error": {
+                "code": -32603,
+                "message": f"Internal server error: {error_msg}"
+            }
+        })
+
+
+def stream_tool_call(data: dict, app_context: dict, progress_token: Any,
+                     product_path: str, headers: Dict[str, str]) -> Iterator[bytes]:
+    """以SSE流的形式执行工具调用，大模型生成期间发送进度通知"""
+    stream = ToolCallStream(data, app_context, progress_token, product_path, headers)
+    try:
+        for event, value in simulator.iter_process_request(*stream.call_args):
+            frame = stream.feed(event, value)
+            if frame:
+                yield frame
+    except Exception as e:
+        yield stream.fail(e)
+
+
+async def stream_tool_call_async(data: dict, app_context: dict, progress_token: Any,
+                                 product_path: str, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    """以SSE流的形式执行工具调用（异步版本）"""
+    stream = ToolCallStream(data, app_context, progress_token, product_path, headers)
+    try:
+        async for event, value in simulator.aiter_process_request(*stream.call_args):
+            frame = stream.feed(event, value)
+            if frame:
+                yield frame
+    except Exception as e:
+        yield stream.fail(e)
+
+
+# 工具列表变更通知及通知流的保活帧（SSE注释行，客户端忽略）
+TOOLS_LIST_CHANGED = {"jsonrpc": "2.0", "method": "notifications/tools/list_changed"}
+SSE_KEEPALIVE = b': keepalive\n\n'
+
+
+def notification_target(app_context: dict):
+    """通知流的订阅目标和客户端当前看到的工具列表（tools/list 的序列化结果）"""
+    if 'aggregate' in app_context:
+        return ('token', app_context['token']), app_context['aggregate'].tools_result.json_bytes
+    app_obj = app_context['app']
+    return ('app', app_obj.category, app_obj.name), template_registry.get(app_obj).tools_result.json_bytes
+
+
+def open_notification_stream(session_id: Optional[str], app_context: dict, product_path: str,
+                             token: str, headers: Dict[str, str],
+                             loop: Optional[asyncio.AbstractEventLoop] = None):
+    """为已初始化的会话打开 tools/list_changed 通知流
+
+    Returns:
+        (Subscription, None) 或 (None, (错误响应体, HTTP状态码))
+    """
+    subscription = None
+    if not session_id:
+        error, status = "mcp-session-id header required", 400
+    elif session_store.resume(session_id) is None:
+        error, status = "Session not found", 404
+    else:
+        target, version = notification_target(app_context)
+        subscription = tool_notifier.subscribe(session_id, target, version, loop)
+        error, status = (None, 200) if subscription else ("Too many notification streams", 503)
+
+    mcp_logger.log_mcp_request(
+        method="GET:notifications",
+        path=f"/{product_path}",
+        token=token,
+        headers=headers,
+        success=error is None,
+        error=error
+    )
+    if error:
+        return None, ({"error": error}, status)
+    return subscription, None
+
+
+def stream_notifications(subscription: Subscription) -> Iterator[bytes]:
+    """通知流：工具列表变更时发送 list_changed，空闲时发送保活帧并刷新会话活动时间
+
+    会话过期、同一会话打开了新的通知流或客户端断开时结束。
+    """
+    try:
+        yield SSE_KEEPALIVE
+        while not subscription.closed:
+            if subscription.wait(KEEPALIVE_INTERVAL):
+                yield build_sse_message(TOOLS_LIST_CHANGED)
+            elif subscription.closed or session_store.resume(subscription.session_id) is None:
+                break
+            else:
+                yield SSE_KEEPALIVE
+    finally:
+        subscription.close()
+
+
+async def stream_notifications_async(subscription: Subscription) -> AsyncIterator[bytes]:
+    """通知流（异步版本）"""
+    try:
+        yield SSE_KEEPALIVE
+        while not subscription.closed:
+            if await subscription.wait_async(KEEPALIVE_INTERVAL):
+                yield build_sse_message(TOOLS_LIST_CHANGED)
+            elif subscription.closed or session_store.resume(subscription.session_id) is None:
+                break
+            else:
+                yield SSE_KEEPALIVE
+    finally:
+        subscription.close()
+
+
+# JSON-RPC 批量请求：单个批次的最大调用数和并发上限
+BATCH_MAX_SIZE = int(os.getenv('MCP_BATCH_MAX_SIZE', '100'))
+BATCH_CONCURRENCY = int(os.getenv('MCP_BATCH_CONCURRENCY', '8'))
+
+
+def jsonrpc_error(request_id: Any, code: int, message: str) -> dict:
+    """构建JSON-RPC错误响应"""
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {
+            "code": code,
+            "message": message
+        }
+    }
+
+
+def validate_batch(batch: list):
+    """校验批量请求，返回 None 或 (错误响应体, HTTP状态码)"""
+    if not batch:
+        return jsonrpc_error(None, -32600, "Invalid Request: empty batch"), 400
+    if len(batch) > BATCH_MAX_SIZE:
+        return {"error": f"Batch size {len(batch)} exceeds limit of {BATCH_MAX_SIZE}"}, 400
+    return None
+
+
+def wants_event_stream(accept: Optional[str]) -> bool:
+    """客户端是否接受SSE流（批量请求据此选择多路复用SSE流或JSON数组）"""
+    return 'text/event-stream' in (accept or '').lower()
+
+
+def handle_batch_item(item: Any, session_id: Optional[str], app_context: dict,
+                      product_path: str, headers: Dict[str, str]) -> Optional[dict]:
+    """处理批量请求中的单个调用，异常转换为该调用的JSON-RPC错误响应"""
+    if not isinstance(item, dict):
+        return jsonrpc_error(None, -32600, "Invalid Request")
+    item, app_context, product_path = route_aggregate_call(item, app_context, product_path)
+    started = time.perf_counter()
+    try:
+        response = handle_mcp_request(item, session_id, app_context)
+        log_mcp_post(item, product_path, app_context.get('token'), headers, response=response, started=started)
+        return response
+    except Exception as e:
+        log_mcp_post(item, product_path, app_context.get('token'), headers, error=str(e), started=started)
+        mcp_logger.error(f"MCP batch item processing error: {e}", exc_info=True)
+        return jsonrpc_error(item.get('id'), -32603, f"Internal server error: {e}")
+
+
+async def handle_batch_item_async(item: Any, session_id: Optional[str], app_context: dict,
+                                  product_path: str, headers: Dict[str, str]) -> Optional[dict]:
+    """处理批量请求中的单个调用（异步版本）"""
+    if not isinstance(item, dict):
+        return jsonrpc_error(None, -32600, "Invalid Request")
+    item, app_context, product_path = route_aggregate_call(item, app_context, product_path)
+    started = time.perf_counter()
+    try:
+        response = await handle_mcp_request_async(item, session_id, app_context)
+        log_mcp_post(item, product_path, app_context.get('token'), headers, response=response, started=started)
+        return response
+    except Exception as e:
+        log_mcp_post(item, product_path, app_context.get('token'), headers, error=str(e), started=started)
+        mcp_logger.error(f"MCP batch item processing error: {e}", exc_info=True)
+        return jsonrpc_error(item.get('id'), -32603, f"Internal server error: {e}")
+
+
+def iter_batch(batch: list, session_id: Optional[str], app_context: dict,
+               product_path: str, headers: Dict[str, str]) -> Iterator[Tuple[int, dict]]:
+    """在线程池中并发处理批量请求，按完成顺序产出 (序号, 响应)，通知不产出响应"""
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(batch)),
+                            thread_name_prefix='mcp-batch') as pool:
+        # 复制上下文，使各调用的耗时记录到本次请求的追踪中
+        futures = {
+            pool.submit(contextvars.copy_context().run, handle_batch_item,
+                        item, session_id, app_context, product_path, headers): index
+            for index, item in enumerate(batch)
+        }
+        for future in as_completed(futures):
+            response = future.result()
+            if response is not None:
+                yield futures[future], response
+
+
+async def aiter_batch(batch: list, session_id: Optional[str], app_context: dict,
+                      product_path: str, headers: Dict[str, str]) -> AsyncIterator[Tuple[int, dict]]:
+    """在事件循环中并发处理批量请求（信号量限制并发），按完成顺序产出 (序号, 响应)"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index: int, item: Any):
+        async with semaphore:
+            return index, await handle_batch_item_async(item, session_id, app_context, product_path, headers)
+
+    for next_done in asyncio.as_completed([run(index, item) for index, item in enumerate(batch)]):
+        index, response = await next_done
+        if response is not None:
+            yield index, response
+
+
+def encode_jsonrpc_batch(responses: List[dict]) -> bytes:
+    """编码JSON-RPC批量响应数组"""
+    return b'[' + b','.join(encode_jsonrpc_response(response) for response in responses) + b']'
+
+
+def collect_batch(batch: list, session_id: Optional[str], app_context: dict,
+                  product_path: str, headers: Dict[str, str]) -> List[dict]:
+    """处理批量请求，按请求顺序返回响应列表"""
+    return [response for _, response in sorted(
+        iter_batch(batch, session_id, app_context, product_path, headers), key=lambda pair: pair[0]
+    )]
+
+
+async def collect_batch_async(batch: list, session_id: Optional[str], app_context: dict,
+                              product_path: str, headers: Dict[str, str]) -> List[dict]:
+    """处理批量请求（异步版本），按请求顺序返回响应列表"""
+    results = [pair async for pair in aiter_batch(batch, session_id, app_context, product_path, headers)]
+    return [response for _, response in sorted(results, key=lambda pair: pair[0])]
+
+
+def stream_batch(batch: list, session_id: Optional[str], app_context: dict,
+                 product_path: str, headers: Dict[str, str]) -> Iterator[bytes]:
+    """以多路复用SSE流返回批量响应，每个调用完成即发送一帧"""
+    for _, response in iter_batch(batch, session_id, app_context, product_path, headers):
+        yield build_sse_message(response)
+
+
+async def stream_batch_async(batch: list, session_id: Optional[str], app_context: dict,
+                             product_path: str, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    """以多路复用SSE流返回批量响应（异步版本）"""
+    async for _, response in aiter_batch(batch, session_id, app_context, product_path, headers):
+        yield build_sse_message(response)
+
+
+def authorize_product_request(product_path: str, token: Optional[str], http_method: str,
+                              headers: Dict[str, str], remote_addr: Optional[str]):
+    """校验产品端点的路径、Token和应用访问权限
+
+    Returns:
+        (应用对象, None) 或 (None, (错误响应体, HTTP状态码))
+    """
     # 解析路径：/Category/Product
     path_parts = product_path.strip('/').split('/')
     if len(path_parts) != 2:
         mcp_logger.log_mcp_request(
-            method=request.method,
+            method=http_method,
             path=f"/{product_path}",
-            token=request.args.get('token'),
-            headers=dict(request.headers),
+            token=token,
+            headers=headers,
             success=False,
             error="Invalid path format. Expected: /Category/Product"
         )
-        return jsonify({"error": "Invalid path format. Expected: /Category/Product"}), 400
+        auth_rejections_total.inc(status='400')
+        return None, ({"error": "Invalid path format. Expected: /Category/Product"}, 400)
 
     category, product = path_parts
-    token = request.args.get('token')
 
     if not token:
         mcp_logger.log_auth_failure(
             reason="Token required",
             path=f"/{product_path}",
-            ip=request.remote_addr
+            ip=remote_addr
         )
-        return jsonify({"error": "Token required"}), 401
+        auth_rejections_total.inc(status='401')
+        return None, ({"error": "Token required"}, 401)
 
     # 验证应用是否存在
-    app_obj = db_manager.get_application_by_path(category, product)
+    with span('auth'):
+        app_obj = auth_cache.get_application(category, product)
     if not app_obj:
         mcp_logger.log_mcp_request(
-            method=request.method,
+            method=http_method,
             path=f"/{product_path}",
             token=token,
-            headers=dict(request.headers),
+            headers=headers,
             success=False,
             error=f"Application {category}/{product} not found"
         )
-        return jsonify({"error": f"Application {category}/{product} not found"}), 404
+        auth_rejections_total.inc(status='404')
+        return None, ({"error": f"Application {category}/{product} not found"}, 404)
 
-    # 获取或创建会话ID
-    session_id = request.headers.get('mcp-session-id')
+    # 验证Token权限（GET与POST使用相同的安全检查）
+    with span('auth'):
+        authorized = auth_cache.is_authorized(token, app_obj.id)
+    if not authorized:
+        mcp_logger.log_auth_failure(
+            reason="Access denied - token not authorized for this app",
+            token=token,
+            path=f"/{product_path}",
+            ip=remote_addr
+        )
+        auth_rejections_total.inc(status='403')
+        return None, ({"error": "Access denied"}, 403)
 
-    if request.method == 'GET':
-        # GET请求返回应用信息
-        apps = db_manager.get_token_applications(token)
-        app_ids = [app.id for app in apps]
-        if app_obj.id not in app_ids:
-            mcp_logger.log_auth_failure(
-                reason="Access denied - token not authorized for this app",
-                token=token,
-                path=f"/{product_path}",
-                ip=request.remote_addr
-            )
-            return jsonify({"error": "Access denied"}), 403
+    return app_obj, None
+
+
+def product_auth_cached(product_path: str, token: Optional[str]) -> bool:
+    """产品端点的鉴权能否只用授权缓存完成（ASGI模式未命中时在线程池中鉴权）"""
+    path_parts = product_path.strip('/').split('/')
+    if len(path_parts) != 2:
+        return True
+    return auth_cache.is_cached(token, path_parts[0], path_parts[1])
+
+
+# 聚合端点路径：/mcp?token=<token>，一个连接提供Token有权限的全部应用的工具
+AGGREGATE_PATH = 'mcp'
+
+
+def aggregate_auth_cached(token: Optional[str]) -> bool:
+    """聚合端点的鉴权能否只用授权缓存完成"""
+    return auth_cache.is_cached(token, token_apps=True)
+
+
+def authorize_aggregate_request(token: Optional[str], remote_addr: Optional[str]):
+    """校验聚合端点的Token，获取其有权限的全部应用合并后的工具列表
+
+    Returns:
+        (聚合模板, None) 或 (None, (错误响应体, HTTP状态码))
+    """
+    if not token:
+        mcp_logger.log_auth_failure(reason="Token required", path=f"/{AGGREGATE_PATH}", ip=remote_addr)
+        auth_rejections_total.inc(status='401')
+        return None, ({"error": "Token required"}, 401)
+
+    with span('auth'):
+        token_info = auth_cache.get_token(token)
+        apps = auth_cache.get_token_applications(token) if token_info else ()
+    if not token_info:
+        mcp_logger.log_auth_failure(
+            reason="Access denied - invalid token",
+            token=token,
+            path=f"/{AGGREGATE_PATH}",
+            ip=remote_addr
+        )
+        auth_rejections_total.inc(status='403')
+        return None, ({"error": "Access denied"}, 403)
+
+    with span('template'):
+        aggregate = template_registry.get_aggregate(apps)
+    return aggregate, None
+
+
+def _tool_call_name(data: Any) -> Any:
+    """tools/call 请求的工具名，其他请求返回 None"""
+    if not isinstance(data, dict) or data.get('method') != 'tools/call':
+        return None
+    params = data.get('params')
+    return params.get('name') if isinstance(params, dict) else None
+
+
+def route_aggregate_call(data: Any, app_context: dict, product_path: str):
+    """将聚合端点的 tools/call 路由到目标应用
+
+    按带前缀的工具名找到应用和动作，改写为该应用的普通调用，日志和指标记录在应用路径下；
+    其他请求和未知工具名原样返回。
+
+    Returns:
+        (请求, 应用上下文, 产品路径)
+    """
+    aggregate = app_context.get('aggregate')
+    if aggregate is None:
+        return data, app_context, product_path
+    target = aggregate.resolve(_tool_call_name(data))
+    if target is None:
+        return data, app_context, product_path
+
+    app_obj, action_name = target
+    data = {**data, 'params': {**data['params'], 'name': action_name}}
+    routed_context = {key: value for key, value in app_context.items() if key != 'aggregate'}
+    routed_context['app'] = app_obj
+    return data, routed_context, f"{app_obj.category}/{app_obj.name}"
+
+
+def aggregate_app_costs(aggregate: AggregateTemplate, data: Any) -> Dict[Application, int]:
+    """聚合端点请求中各目标应用的调用数，用于执行应用级配额"""
+    costs: Dict[Application, int] = {}
+    for item in data if isinstance(data, list) else [data]:
+        target = aggregate.resolve(_tool_call_name(item))
+        if target is not None:
+            costs[target[0]] = costs.get(target[0], 0) + 1
+    return costs
+
+
+# 配额超限的JSON-RPC错误码（实现自定义的服务器错误范围 -32000 ~ -32099）
+QUOTA_EXCEEDED_CODE = -32029
+
+
+def acquire_quota(app_context: dict, token: str, data: Any, http_method: str,
+                  product_path: str, headers: Dict[str, str]):
+    """在处理请求前检查并占用Token/应用配额
+
+    批量请求按调用数消耗令牌，按实际并发数占用并发配额；
+    聚合端点按各调用路由到的应用分别检查应用配额。
+
+    Returns:
+        (QuotaLease, None) 或 (None, (错误响应体, HTTP状态码, 响应头))；
+        QuotaLease 需在响应发送完毕后释放
+    """
+    token_info = auth_cache.get_token(token)
+    if token_info is None:
+        # 鉴权后Token恰好被禁用，交由后续处理
+        return QuotaLease(quota_limiter, {}), None
+
+    if isinstance(data, list):
+        cost, slots = len(data), min(len(data), BATCH_CONCURRENCY)
+    else:
+        cost, slots = 1, 1
+
+    aggregate = app_context.get('aggregate')
+    app_costs = aggregate_app_costs(aggregate, data) if aggregate is not None else None
+
+    with span('quota'):
+        lease, exceeded = quota_limiter.acquire(token_info, app_context.get('app'), cost, slots, app_costs)
+    if exceeded is None:
+        return lease, None
+
+    quota_rejections_total.inc(scope=exceeded.scope, reason=exceeded.reason)
+    mcp_logger.log_mcp_request(
+        method=http_method,
+        path=f"/{product_path}",
+        token=token,
+        headers=headers,
+        success=False,
+        error=exceeded.message
+    )
+    request_id = data.get('id') if isinstance(data, dict) else None
+    body = jsonrpc_error(request_id, QUOTA_EXCEEDED_CODE, exceeded.message)
+    body['error']['data'] = exceeded.to_dict()
+    return None, (body, 429, {'Retry-After': exceeded.retry_after_header()})
+
+
+# ===== Prometheus 指标 =====
+
+# 已知的MCP方法，其他方法归为 other，避免客户端输入导致标签基数膨胀
+KNOWN_MCP_METHODS = {'initialize', 'tools/list', 'tools/call', 'ping', 'notifications/initialized'}
+
+mcp_requests_total = metrics_registry.counter(
+    'unimcp_mcp_requests_total', 'MCP JSON-RPC requests', ('app', 'method', 'action', 'status')
+)
+mcp_request_duration = metrics_registry.histogram(
+    'unimcp_mcp_request_duration_seconds', 'MCP JSON-RPC request latency in seconds', ('app', 'method', 'action')
+)
+auth_rejections_total = metrics_registry.counter(
+    'unimcp_auth_rejections_total', 'Product endpoint requests rejected before dispatch', ('status',)
+)
+quota_rejections_total = metrics_registry.counter(
+    'unimcp_quota_rejections_total', 'Product endpoint requests rejected by token/app quotas', ('scope', 'reason')
+)
+
+
+def _action_label(data: dict, product_path: str) -> str:
+    """tools/call 的动作标签，仅使用模板中存在的动作名"""
+    if data.get('method') != 'tools/call':
+        return ''
+    name = (data.get('params') or {}).get('name')
+    category, _, product = product_path.strip('/').partition('/')
+    app_obj = auth_cache.get_application(category, product)
+    if app_obj and isinstance(name, str) and template_registry.get(app_obj).get_action(name):
+        return name
+    return 'unknown'
+
+
+def observe_mcp_request(data: dict, product_path: str, response: Optional[dict],
+                        error: Optional[str], started: Optional[float]):
+    """记录一次MCP调用的请求数和耗时"""
+    method = data.get('method')
+    method = method if method in KNOWN_MCP_METHODS else 'other'
+    app_label = product_path.strip('/')
+    action = _action_label(data, product_path)
+    failed = error is not None or (isinstance(response, dict) and 'error' in response)
+    mcp_requests_total.inc(app=app_label, method=method, action=action, status='error' if failed else 'ok')
+    if started is not None:
+        mcp_request_duration.observe(time.perf_counter() - started, app=app_label, method=method, action=action)
+
+
+def _cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        'auth_tokens': auth_cache.tokens.stats(),
+        'auth_apps': auth_cache.apps.stats(),
+        'auth_token_apps': auth_cache.token_apps.stats(),
+        'llm_responses': response_cache.stats(),
+        'templates': template_registry.stats(),
+        'prompts': prompt_registry.stats()
+    }
+
+
+metrics_registry.callback(
+    'unimcp_cache_hit_ratio', 'Cache hit ratio since process start', lambda: {
+        name: stats['hit_ratio'] for name, stats in _cache_stats().items()
+    }, ('cache',)
+)
+metrics_registry.callback(
+    'unimcp_cache_lookups_total', 'Cache lookups by result', lambda: {
+        (name, result): stats[key] for name, stats in _cache_stats().items()
+        for result, key in (('hit', 'hits'), ('miss', 'misses'))
+    }, ('cache', 'result'), kind='counter'
+)
+metrics_registry.callback(
+    'unimcp_cache_entries', 'Current cache entries', lambda: {
+        name: stats['size'] for name, stats in _cache_stats().items()
+    }, ('cache',)
+)
+metrics_registry.callback(
+    'unimcp_audit_queue_depth', 'Audit log rows waiting to be written', audit_writer.queue_depth
+)
+metrics_registry.callback(
+    'unimcp_audit_rows_total', 'Audit log rows by outcome', lambda: {
+        outcome: audit_writer.stats()[outcome] for outcome in ('enqueued', 'written', 'dropped', 'failed')
+    }, ('outcome',), kind='counter'
+)
+metrics_registry.callback(
+    'unimcp_sessions_active', 'Live MCP sessions', lambda: session_store.stats()['live']
+)
+metrics_registry.callback(
+    'unimcp_sessions_removed_total', 'MCP sessions removed by reason', lambda: {
+        reason: session_store.stats()[reason] for reason in ('evicted', 'expired')
+    }, ('reason',), kind='counter'
+)
+metrics_registry.callback(
+    'unimcp_quota_in_flight', 'Requests holding a concurrency quota slot', quota_limiter.in_flight, ('scope',)
+)
+
+
+def build_app_info(app_obj: Application) -> dict:
+    """构建GET请求返回的应用信息"""
+    template = app_obj.template if app_obj.template else {}
+    return {
+        "category": app_obj.category,
+        "name": app_obj.name,
+        "display_name": app_obj.display_name,
+        "description": app_obj.description,
+        "actions": template.get('actions', [])
+    }
 
-        template = app_obj.template if app_obj.template else {}
-        actions = template.get('actions', [])
 
-        response_data = {
+def build_aggregate_info(aggregate: AggregateTemplate) -> dict:
+    """构建聚合端点GET请求返回的应用和工具列表"""
+    return {
+        "apps": [{
             "category": app_obj.category,
             "name": app_obj.name,
             "display_name": app_obj.display_name,
             "description": app_obj.description,
-            "actions": actions
-        }
+            "tools": [namespaced_tool_name(app_obj.name, action)
+                      for action in template_registry.get(app_obj).actions]
+        } for app_obj in aggregate.apps]
+    }
+
+
+def log_mcp_post(data: dict, product_path: str, token: str, headers: Dict[str, str],
+                 response: Optional[dict] = None, error: Optional[str] = None,
+                 started: Optional[float] = None):
+    """记录MCP POST调用结果（日志和请求指标）"""
+    observe_mcp_request(data, product_path, response, error, started)
+    mcp_logger.log_mcp_request(
+        method=f"POST:{data.get('method', 'unknown')}",
+        path=f"/{product_path}",
+        params=data.get('params', {}),
+        token=token,
+        headers=headers,
+        success=error is None,
+        response=response,
+        error=error
+    )
+
+
+def issue_session_id(data: dict, session_id: Optional[str]) -> Optional[str]:
+    """为未携带会话ID的initialize请求分配会话ID（需在响应头 mcp-session-id 中返回）"""
+    if data.get('method') == 'initialize' and not session_id:
+        return session_store.new_id()
+    return None
+
+
+def check_audit_queue():
+    """审计队列探针：队列接近满时后续审计记录会被丢弃"""
+    stats = audit_writer.stats()
+    ok = stats['queue_depth'] < stats['queue_capacity'] * 0.9
+    return ok, {key: stats[key] for key in ('queue_depth', 'queue_capacity', 'dropped', 'failed')}
+
+
+health_monitor.register('audit_queue', check_audit_queue, critical=False)
+
+
+def health_status():
+    """检查服务健康状态，返回 (响应体, HTTP状态码)
+
+    数据库状态取自定期执行的探针缓存，轮询本端点不访问数据库。
+    """
+    database_ok, error = health_monitor.is_ok('database')
+    if database_ok:
+        return {
+            "status": "healthy",
+            "service": "UniMCPSim",
+            "version": get_version(),
+            # 多进程部署时以下统计只来自响应本次请求的工作进程
+            "worker": {"pid": os.getpid(), "workers": int(os.getenv('MCP_WORKERS', '1'))},
+            "sessions": session_store.stats(),
+            "llm_admission": llm_admission.stats(),
+            "llm_pool": llm_pool.stats(),
+            "coalescing": llm_flights.stats(),
+            "notifications": tool_notifier.stats(),
+            "response_cache": response_cache.stats(),
+            "recordings": response_recorder.stats(),
+            "timestamp": datetime.now().isoformat()
+        }, 200
+    return {
+        "status": "unhealthy",
+        "error": error,
+        "timestamp": datetime.now().isoformat()
+    }, 500
+
+
+# Flask路由
+@app.route('/mcp', methods=['GET', 'POST', 'OPTIONS'])
+def handle_aggregate_endpoint():
+    """处理聚合端点：一个连接访问Token有权限的全部应用"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    token = request.args.get('token')
+    aggregate, error = authorize_aggregate_request(token, request.remote_addr)
+    if error:
+        body, status = error
+        return jsonify(body), status
+
+    return serve_mcp_endpoint(AGGREGATE_PATH, token, {'aggregate': aggregate},
+                              lambda: build_aggregate_info(aggregate))
+
+
+@app.route('/<path:product_path>', methods=['GET', 'POST', 'OPTIONS'])
+def handle_product_endpoint(product_path):
+    """处理产品特定的端点"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    token = request.args.get('token')
+    headers = dict(request.headers)
+
+    app_obj, error = authorize_product_request(product_path, token, request.method, headers, request.remote_addr)
+    if error:
+        body, status = error
+        return jsonify(body), status
+
+    return serve_mcp_endpoint(product_path, token, {'app': app_obj}, lambda: build_app_info(app_obj))
+
+
+def serve_mcp_endpoint(product_path: str, token: str, target: dict, build_info: Callable[[], dict]):
+    """处理已通过鉴权的MCP端点请求：GET 返回端点信息或打开通知流，POST 处理MCP协议
+
+    Args:
+        target: 调用目标，产品端点为 {'app': 应用}，聚合端点为 {'aggregate': 聚合模板}
+        build_info: 构建GET响应的函数
+    """
+    headers = dict(request.headers)
+
+    # 获取或创建会话ID
+    session_id = request.headers.get('mcp-session-id')
+
+    # 创建应用上下文
+    app_context = {
+        **target,
+        'token': token,
+        'ip_address': request.remote_addr
+    }
+
+    if request.method == 'GET':
+        # GET请求返回应用信息
+        lease, quota_error = acquire_quota(app_context, token, None, request.method, product_path, headers)
+        if quota_error:
+            body, status, quota_headers = quota_error
+            return jsonify(body), status, quota_headers
+
+        if wants_event_stream(request.headers.get('Accept')):
+            # 会话的服务端通知流（长连接不占用并发配额）
+            with lease:
+                subscription, error = open_notification_stream(session_id, app_context, product_path, token, headers)
+            if error:
+                body, status = error
+                return jsonify(body), status
+            return Response(
+                stream_with_context(stream_notifications(subscription)),
+                content_type='text/event-stream',
+                headers=SSE_STREAM_HEADERS
+            )
+
+        with lease:
+            response_data = build_info()
 
         mcp_logger.log_mcp_request(
             method=request.method,
             path=f"/{product_path}",
             token=token,
-            headers=dict(request.headers),
+            headers=headers,
             success=True,
             response=response_data
         )
 
         return jsonify(response_data)
 
-    elif request.method == 'POST':
-        # POST请求处理MCP协议
-
-        # 验证Token权限（与GET请求保持一致的安全检查）
-        apps = db_manager.get_token_applications(token)
-        app_ids = [app.id for app in apps]
-        if app_obj.id not in app_ids:
-            mcp_logger.log_auth_failure(
-                reason="Access denied - token not authorized for this app",
-                token=token,
-                path=f"/{product_path}",
-                ip=request.remote_addr
-            )
-            return jsonify({"error": "Access denied"}), 403
-
-        if not request.is_json:
-            mcp_logger.log_mcp_request(
-                method=request.method,
-                path=f"/{product_path}",
-                token=token,
-                headers=dict(request.headers),
-                success=False,
-                error="Content-Type must be application/json"
-            )
-            return jsonify({"error": "Content-Type must be application/json"}), 400
+    # POST请求处理MCP协议
+    if not request.is_json:
+        mcp_logger.log_mcp_request(
+            method=request.method,
+            path=f"/{product_path}",
+            token=token,
+            headers=headers,
+            success=False,
+            error="Content-Type must be application/json"
+        )
+        return jsonify({"error": "Content-Type must be application/json"}), 400
 
-        data = request.get_json()
-        mcp_method = data.get('method', 'unknown')
+    data = request.get_json()
 
-        # 创建应用上下文
-        app_context = {
-            'app': app_obj,
-            'token': token,
-            'ip_address': request.remote_addr
-        }
+    if isinstance(data, list):
+        batch_error = validate_batch(data)
+        if batch_error:
+            body, status = batch_error
+            return jsonify(body), status
 
-        try:
-            # 处理MCP请求
-            response = handle_mcp_request(data, session_id, app_context)
-
-            # 记录成功的MCP调用
-            mcp_logger.log_mcp_request(
-                method=f"POST:{mcp_method}",
-                path=f"/{product_path}",
-                params=data.get('params', {}),
-                token=token,
-                headers=dict(request.headers),
-                success=True,
-                response=response
-            )
+    # 配额检查在任何数据库和大模型处理之前完成
+    lease, quota_error = acquire_quota(app_context, token, data, request.method, product_path, headers)
+    if quota_error:
+        body, status, quota_headers = quota_error
+        return jsonify(body), status, quota_headers
 
-            # 设置响应头
-            resp = Response(
-                f"event: message\ndata: {json.dumps(response, ensure_ascii=False)}\n\n",
-                content_type='text/event-stream'
+    try:
+        resp = app.make_response(
+            dispatch_product_post(data, session_id, app_context, product_path, token, headers)
+        )
+    except BaseException:
+        lease.release()
+        raise
+    # 流式响应发送完毕（或客户端断开）后才释放并发配额
+    resp.call_on_close(lease.release)
+    return resp
+
+
+def dispatch_product_post(data: Any, session_id: Optional[str], app_context: dict,
+                          product_path: str, token: str, headers: Dict[str, str]):
+    """处理产品端点的MCP POST请求（已通过鉴权和配额检查）"""
+    # JSON-RPC 批量请求：鉴权只做一次，各调用并发执行
+    if isinstance(data, list):
+        if wants_event_stream(request.headers.get('Accept')):
+            return Response(
+                stream_with_context(stream_batch(data, session_id, app_context, product_path, headers)),
+                content_type='text/event-stream',
+                headers=SSE_STREAM_HEADERS
             )
+        responses = collect_batch(data, session_id, app_context, product_path, headers)
+        if not responses:
+            # 批次中全部是通知
+            return '', 202
+        return Response(encode_jsonrpc_batch(responses), content_type='application/json')
+
+    # 聚合端点的工具调用路由到目标应用
+    data, app_context, product_path = route_aggregate_call(data, app_context, product_path)
+
+    # 客户端请求进度通知时，边生成边推送
+    progress_token = get_progress_token(data, app_context)
+    if progress_token is not None:
+        return Response(
+            stream_with_context(stream_tool_call(data, app_context, progress_token, product_path, headers)),
+            content_type='text/event-stream',
+            headers=SSE_STREAM_HEADERS
+        )
 
-            # 如果是initialize请求，设置session ID
-            if data.get('method') == 'initialize' and not session_id:
-                new_session_id = list(sessions.keys())[-1] if sessions else str(uuid.uuid4())
-                resp.headers['mcp-session-id'] = new_session_id
-
-            return resp
-
-        except Exception as e:
-            error_msg = str(e)
-            mcp_logger.log_mcp_request(
-                method=f"POST:{mcp_method}",
-                path=f"/{product_path}",
-                params=data.get('params', {}),
-                token=token,
-                headers=dict(request.headers),
-                success=False,
-                error=error_msg
-            )
-            mcp_logger.error(f"MCP request processing error: {error_msg}", exc_info=True)
-            return jsonify({"error": f"Internal server error: {error_msg}"}), 500
+    # initialize请求在处理前分配会话ID，与本次请求绑定
+    new_session_id = issue_session_id(data, session_id)
+    started = time.perf_counter()
 
+    try:
+        # 处理MCP请求
+        response = handle_mcp_request(data, new_session_id or session_id, app_context)
 
+        # 记录成功的MCP调用
+        log_mcp_post(data, product_path, token, headers, response=response, started=started)
+
+        # 设置响应头
+        resp = Response(build_sse_message(response), content_type='text/event-stream')
+
+        # 如果是initialize请求，设置session ID
+        if new_session_id:
+            resp.headers['mcp-session-id'] = new_session_id
+
+        return resp
+
+    except Exception as e:
+        error_msg = str(e)
+        log_mcp_post(data, product_path, token, headers, error=error_msg, started=started)
+        mcp_logger.error(f"MCP request processing error: {error_msg}", exc_info=True)
+        return jsonify({"error": f"Internal server error: {error_msg}"}), 500
 
 
 @app.route('/health', methods=['GET', 'HEAD', 'OPTIONS'])
@@ -518,29 +1320,45 @@ def health_check():
     if request.method == 'OPTIONS':
         return '', 200
 
-    try:
-        # 检查数据库连接
-        session = db_manager.get_session()
-        session.query(Application).first()
-        session.close()
-        return jsonify({
-            "status": "healthy",
-            "service": "UniMCPSim",
-            "version": get_version(),
-            "timestamp": datetime.now().isoformat()
-        }), 200
-    except Exception as e:
-        return jsonify({
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+    body, status = health_status()
+    return jsonify(body), status
+
 
+@app.route('/livez', methods=['GET', 'HEAD'])
+def liveness_check():
+    """存活检查（不访问数据库）"""
+    return jsonify(liveness("UniMCPSim", get_version()))
 
-def run_mcp_server():
-    """运行MCP服务器"""
+
+@app.route('/readyz', methods=['GET', 'HEAD'])
+def readiness_check():
+    """就绪检查（返回缓存的探针结果）"""
+    body, status = health_monitor.readiness()
+    return jsonify(body), status
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 指标端点"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+def run_mcp_server(workers: Optional[int] = None):
+    """运行MCP服务器
+
+    Args:
+        workers: 工作进程数，默认读取 MCP_WORKERS 环境变量（默认1）
+    """
     # 获取端口配置
     port = int(os.getenv('MCP_SERVER_PORT', '9090'))
+    workers = workers or int(os.getenv('MCP_WORKERS', '1'))
+    if workers > 1:
+        # 会话只保存在处理 initialize 的工作进程中，通知流请求可能分发到其他工作进程，
+        # 由该进程校验会话ID签名后接纳；预派生的工作进程继承 session_store，
+        # uvicorn 的工作进程重新导入模块时从环境变量读取工作进程数和签名密钥
+        os.environ['MCP_WORKERS'] = str(workers)
+        os.environ['MCP_SESSION_SECRET'] = session_store.secret
+        session_store.adopt_unknown = True
     print(f"Starting UniMCPSim MCP Server on port {port}...")
 
     # 初始化数据库
@@ -549,11 +1367,36 @@ def run_mcp_server():
     print("Server endpoints:")
     print(f"- Product-specific: http://localhost:{port}/<Category>/<Product>?token=<token>")
     print(f"- Example: http://localhost:{port}/IM/WeChat?token=<token>")
+    print(f"- Aggregate (all apps of a token): http://localhost:{port}/mcp?token=<token>")
     print("- CORS enabled for all origins")
-
-    # 运行Flask服务器
-    app.run(host='0.0.0.0', port=port, debug=False)
+    if workers > 1:
+        print(f"- Workers: {workers}")
+
+    # 服务模式：flask（默认，线程模型）或 asgi（异步模型，大模型等待不占用线程）
+    mode = os.getenv('MCP_SERVER_MODE', 'flask').lower()
+    if mode == 'asgi':
+        import uvicorn
+        print("- Serving mode: ASGI (uvicorn)")
+        if workers > 1:
+            # 多进程需要以导入字符串的形式传入应用，由uvicorn管理工作进程
+            uvicorn.run('mcp_asgi:asgi_app', host='0.0.0.0', port=port, workers=workers, log_level='warning')
+        else:
+            from mcp_asgi import asgi_app
+            uvicorn.run(asgi_app, host='0.0.0.0', port=port, log_level='warning')
+    elif workers > 1:
+        # 预派生多进程，共享同一监听socket
+        from prefork import serve_prefork
+        serve_prefork(app, '0.0.0.0', port, workers)
+    else:
+        # 运行Flask服务器
+        app.run(host='0.0.0.0', port=port, debug=False)
 
 
 if __name__ == "__main__":
-    run_mcp_server()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="UniMCPSim MCP Server")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="工作进程数（默认读取 MCP_WORKERS 环境变量，默认1）")
+    args = parser.parse_args()
+    run_mcp_server(workers=args.workers)
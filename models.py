@@ -3,13 +3,18 @@
 数据库模型定义
 """
 
+import os
 import json
 import uuid
+import atexit
+import threading
 from datetime import datetime, timezone
 from typing import Optional, List, Dict, Any
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Boolean, Integer, ForeignKey, JSON
+from sqlalchemy import create_engine, update, bindparam, Column, String, Text, DateTime, Boolean, Integer, Float, ForeignKey, JSON
 from sqlalchemy.orm import sessionmaker, relationship, Session, declarative_base
 from pydantic import BaseModel, Field
+import json_codec
+from prompt_registry import validate_prompt_template
 
 Base = declarative_base()
 
@@ -38,6 +43,10 @@ class Token(Base):
     enabled = Column(Boolean, default=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     last_used = Column(DateTime, nullable=True)
+    # 配额：为空表示使用全局默认值（MCP_TOKEN_RATE_LIMIT 等），0 表示不限制
+    rate_limit_per_minute = Column(Integer, nullable=True)  # 每分钟请求数（令牌桶速率）
+    rate_limit_burst = Column(Integer, nullable=True)  # 突发容量，为空时等于每分钟请求数
+    max_concurrency = Column(Integer, nullable=True)  # 最大并发（进行中）请求数
 
     user = relationship("User", back_populates="tokens")
     app_permissions = relationship("AppPermission", back_populates="token", cascade="all, delete-orphan")
@@ -55,6 +64,15 @@ class Application(Base):
     ai_notes = Column(Text, nullable=True)  # AI生成备注：对格式、风格等要求，样例数据等
     template = Column(JSON)  # 存储应用的动作和参数定义
     enabled = Column(Boolean, default=True)
+    # 应用级配额（所有Token合计），为空或0表示不限制
+    rate_limit_per_minute = Column(Integer, nullable=True)
+    rate_limit_burst = Column(Integer, nullable=True)
+    max_concurrency = Column(Integer, nullable=True)
+    # 大模型响应缓存：缓存秒数（为空使用全局默认值，0 表示不缓存），always_fresh 为真时总是调用大模型
+    response_cache_ttl = Column(Integer, nullable=True)
+    response_cache_always_fresh = Column(Boolean, default=False)
+    # 为真时同时到达的相同调用各自生成（默认合并为一次大模型生成并共享结果）
+    response_distinct = Column(Boolean, default=False)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -117,6 +135,8 @@ class LLMConfig(Base):
     model_name = Column(String(100), default='gpt-4o-mini')
     enable_thinking = Column(Boolean, default=False)  # 是否启用thinking模式
     enable_stream = Column(Boolean, default=False)  # 是否启用stream模式
+    request_timeout = Column(Float, nullable=True)  # 请求超时（秒），为空使用 LLM_REQUEST_TIMEOUT
+    max_concurrency = Column(Integer, nullable=True)  # 同时进行中的调用数上限，为空使用 LLM_MAX_CONCURRENCY，0 表示不限制
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -149,22 +169,120 @@ class ApplicationTemplate(BaseModel):
     actions: List[Action] = []
 
 
+class TokenUsageBuffer:
+    """Token最近使用时间的写回缓冲
+
+    在内存中记录每个Token的最近使用时间，由后台线程每隔 flush_interval 秒
+    用一次批量UPDATE写回数据库，进程退出时也会写回，避免每次调用都争用SQLite写锁。
+    """
+
+    def __init__(self, db_manager: 'DatabaseManager', flush_interval: float = 5.0):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def reset_after_fork(self):
+        """子进程中重置状态（后台线程不会随fork复制）"""
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def record(self, token_id: int):
+        """记录Token使用（仅写内存）"""
+        with self._lock:
+            self._pending[token_id] = datetime.now(timezone.utc)
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        """启动后台写回线程（需持有锁）"""
+        self._thread = threading.Thread(target=self._run, name='token-usage-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Token last_used flush failed: {e}")
+
+    def flush(self) -> int:
+        """将缓冲的使用时间批量写回数据库，返回写回条数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        session = self.db_manager.get_session()
+        try:
+            # 使用Core层executemany，已删除的Token会被忽略而不是报错
+            tokens_table = Token.__table__
+            session.execute(
+                update(tokens_table)
+                .where(tokens_table.c.id == bindparam('token_id'))
+                .values(last_used=bindparam('used_at')),
+                [{'token_id': token_id, 'used_at': used_at} for token_id, used_at in pending.items()]
+            )
+            session.commit()
+            return len(pending)
+        except Exception:
+            session.rollback()
+            # 写回失败时放回缓冲，保留较新的时间
+            with self._lock:
+                for token_id, last_used in pending.items():
+                    self._pending.setdefault(token_id, last_used)
+            raise
+        finally:
+            session.close()
+
+    def close(self):
+        """停止后台线程并写回剩余数据"""
+        self._stop_event.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Token last_used flush failed: {e}")
+
+
 class DatabaseManager:
     """数据库管理器"""
 
     def __init__(self, db_url: str = 'sqlite:///data/unimcp.db'):
         # 确保 data 目录存在
-        import os
         db_dir = os.path.dirname(db_url.replace('sqlite:///', ''))
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir, exist_ok=True)
 
-        self.engine = create_engine(db_url, echo=False)
+        # JSON列使用统一的编解码层，预序列化的结果直接复用其编码
+        self.engine = create_engine(db_url, echo=False,
+                                    json_serializer=json_codec.dumps_str,
+                                    json_deserializer=json_codec.loads)
         Base.metadata.create_all(self.engine)
         self.SessionLocal = sessionmaker(bind=self.engine)
 
+        # Token最近使用时间写回缓冲
+        self.token_usage = TokenUsageBuffer(
+            self, flush_interval=float(os.getenv('TOKEN_LAST_USED_FLUSH_INTERVAL', '5'))
+        )
+
+        # 多进程模式下，子进程不能复用父进程的数据库连接
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
         # 数据库迁移：为旧表添加新字段
         self._migrate_llm_config_table()
+        self._migrate_quota_columns()
+        self._migrate_response_cache_columns()
+
+    def _after_fork_in_child(self):
+        """fork后在子进程中丢弃继承的连接池和写回缓冲状态"""
+        self.engine.dispose(close=False)
+        self.token_usage.reset_after_fork()
 
     def _migrate_llm_config_table(self):
         """迁移 llm_config 表，添加新字段"""
@@ -190,6 +308,51 @@ class DatabaseManager:
                 conn.execute(text("UPDATE llm_config SET is_active = 1 WHERE id = (SELECT MIN(id) FROM llm_config)"))
                 conn.commit()
 
+            # 添加请求超时和并发上限字段
+            if 'request_timeout' not in columns:
+                conn.execute(text("ALTER TABLE llm_config ADD COLUMN request_timeout FLOAT"))
+                conn.commit()
+            if 'max_concurrency' not in columns:
+                conn.execute(text("ALTER TABLE llm_config ADD COLUMN max_concurrency INTEGER"))
+                conn.commit()
+
+    def _migrate_quota_columns(self):
+        """迁移 tokens / applications 表，添加配额字段"""
+        from sqlalchemy import text, inspect
+
+        inspector = inspect(self.engine)
+        table_names = inspector.get_table_names()
+
+        with self.engine.connect() as conn:
+            for table in ('tokens', 'applications'):
+                if table not in table_names:
+                    continue
+                columns = [col['name'] for col in inspector.get_columns(table)]
+                for column in ('rate_limit_per_minute', 'rate_limit_burst', 'max_concurrency'):
+                    if column not in columns:
+                        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER"))
+                        conn.commit()
+
+    def _migrate_response_cache_columns(self):
+        """迁移 applications 表，添加响应缓存和相同调用合并字段"""
+        from sqlalchemy import text, inspect
+
+        inspector = inspect(self.engine)
+        if 'applications' not in inspector.get_table_names():
+            return
+
+        columns = [col['name'] for col in inspector.get_columns('applications')]
+        with self.engine.connect() as conn:
+            if 'response_cache_ttl' not in columns:
+                conn.execute(text("ALTER TABLE applications ADD COLUMN response_cache_ttl INTEGER"))
+                conn.commit()
+            if 'response_cache_always_fresh' not in columns:
+                conn.execute(text("ALTER TABLE applications ADD COLUMN response_cache_always_fresh BOOLEAN DEFAULT 0"))
+                conn.commit()
+            if 'response_distinct' not in columns:
+                conn.execute(text("ALTER TABLE applications ADD COLUMN response_distinct BOOLEAN DEFAULT 0"))
+                conn.commit()
+
     def get_session(self) -> Session:
         """获取数据库会话"""
         return self.SessionLocal()
@@ -217,13 +380,12 @@ class DatabaseManager:
         self.create_default_prompts()
 
     def validate_token(self, token_str: str) -> Optional[dict]:
-        """验证Token，返回Token信息字典"""
+        """验证Token，返回Token信息字典（只读，最近使用时间由写回缓冲批量更新）"""
         session = self.get_session()
         try:
             token = session.query(Token).filter_by(token=token_str, enabled=True).first()
             if token:
-                token.last_used = datetime.now(timezone.utc)
-                session.commit()
+                self.token_usage.record(token.id)
                 # 返回Token的基本信息而不是对象，避免session问题
                 return {
                     'id': token.id,
@@ -235,6 +397,32 @@ class DatabaseManager:
         finally:
             session.close()
 
+    def get_token_auth(self, token_str: str) -> Optional[dict]:
+        """验证Token并返回授权信息（包含可访问的应用ID集合），供授权缓存使用"""
+        session = self.get_session()
+        try:
+            token = session.query(Token).filter_by(token=token_str, enabled=True).first()
+            if not token:
+                return None
+
+            app_ids = session.query(Application.id).join(AppPermission).filter(
+                AppPermission.token_id == token.id,
+                Application.enabled == True
+            ).all()
+
+            return {
+                'id': token.id,
+                'token': token.token,
+                'name': token.name,
+                'user_id': token.user_id,
+                'app_ids': frozenset(row[0] for row in app_ids),
+                'rate_limit_per_minute': token.rate_limit_per_minute,
+                'rate_limit_burst': token.rate_limit_burst,
+                'max_concurrency': token.max_concurrency
+            }
+        finally:
+            session.close()
+
     def get_token_applications(self, token_str: str) -> List[Application]:
         """获取Token可访问的应用列表"""
         session = self.get_session()
@@ -304,7 +492,9 @@ class DatabaseManager:
 
     def save_prompt_template(self, name: str, display_name: str, description: str,
                            template: str, variables: List[Dict[str, str]]) -> PromptTemplate:
-        """保存或更新提示词模板"""
+        """保存或更新提示词模板（模板占位符无效时抛出 ValueError，不写入数据库）"""
+        validate_prompt_template(name, template, variables)
+
         session = self.get_session()
         try:
             existing = session.query(PromptTemplate).filter_by(name=name).first()
@@ -326,6 +516,10 @@ class DatabaseManager:
                 session.add(result)
 
             session.commit()
+
+            # 刷新并分离对象，避免 session 关闭后无法访问属性
+            session.refresh(result)
+            session.expunge(result)
             return result
         finally:
             session.close()
@@ -411,7 +605,9 @@ class DatabaseManager:
             session.close()
 
     def create_llm_config(self, name: str, api_key: str, api_base_url: str,
-                          model_name: str, enable_thinking: bool, enable_stream: bool) -> LLMConfig:
+                          model_name: str, enable_thinking: bool, enable_stream: bool,
+                          request_timeout: Optional[float] = None,
+                          max_concurrency: Optional[int] = None) -> LLMConfig:
         """创建新的大模型配置"""
         session = self.get_session()
         try:
@@ -425,7 +621,9 @@ class DatabaseManager:
                 api_base_url=api_base_url,
                 model_name=model_name,
                 enable_thinking=enable_thinking,
-                enable_stream=enable_stream
+                enable_stream=enable_stream,
+                request_timeout=request_timeout,
+                max_concurrency=max_concurrency
             )
             session.add(config)
             session.commit()
@@ -439,7 +637,9 @@ class DatabaseManager:
 
     def update_llm_config(self, config_id: int, name: str, api_key: Optional[str],
                           api_base_url: str, model_name: str,
-                          enable_thinking: bool, enable_stream: bool) -> Optional[LLMConfig]:
+                          enable_thinking: bool, enable_stream: bool,
+                          request_timeout: Optional[float] = None,
+                          max_concurrency: Optional[int] = None) -> Optional[LLMConfig]:
         """更新大模型配置"""
         session = self.get_session()
         try:
@@ -454,6 +654,8 @@ class DatabaseManager:
             config.model_name = model_name
             config.enable_thinking = enable_thinking
             config.enable_stream = enable_stream
+            config.request_timeout = request_timeout
+            config.max_concurrency = max_concurrency
             config.updated_at = datetime.now(timezone.utc)
 
             session.commit()
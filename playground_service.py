@@ -6,8 +6,8 @@ Playground 服务 - 处理对话和工具调用
 import json
 import time
 from typing import Dict, Any, Optional, List
-from openai import OpenAI
 from models import DatabaseManager
+from llm_pool import llm_pool, request_timeout
 from mcp_client import MCPClient, MCPClientError, parse_mcp_config, test_mcp_connection
 from logger_utils import mcp_logger
 
@@ -67,6 +67,7 @@ class PlaygroundService:
             self.model = db_config.model_name or 'gpt-4o-mini'
             self.enable_stream = db_config.enable_stream
             self.enable_thinking = db_config.enable_thinking
+            self.request_timeout = request_timeout(db_config.request_timeout)
             self._config_id = db_config.id
             self._config_updated_at = db_config.updated_at
         else:
@@ -78,11 +79,12 @@ class PlaygroundService:
             self.model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
             self.enable_stream = os.getenv('OPENAI_STREAM', 'false').lower() == 'true'
             self.enable_thinking = os.getenv('OPENAI_ENABLE_THINKING', 'false').lower() == 'true'
+            self.request_timeout = request_timeout(None)
             self._config_id = None
             self._config_updated_at = None
 
         if self.api_key:
-            self.client = OpenAI(api_key=self.api_key, base_url=self.api_base)
+            self.client = llm_pool.openai_client(self.api_key, self.api_base, self.request_timeout)
             self.enabled = True
         else:
             self.client = None
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+预派生（pre-fork）多进程服务
+父进程创建监听socket后派生N个工作进程，各工作进程共享同一socket接受连接，
+进程异常退出时按指数退避重新派生，短时间内连续失败过多时放弃。各进程缓存互不共享，通过缓存代数文件跨进程失效。
+"""
+
+import os
+import sys
+import atexit
+import time
+import signal
+import socket
+from typing import Callable, Dict
+from werkzeug.serving import make_server
+
+from logger_utils import mcp_logger
+
+# 工作进程意外退出后重新派生的等待：首次 RESPAWN_BASE_DELAY 秒，连续失败时翻倍，最多 RESPAWN_MAX_DELAY 秒
+RESPAWN_BASE_DELAY = 0.5
+RESPAWN_MAX_DELAY = 30.0
+# 运行超过该秒数后退出的工作进程不计为连续失败
+RESPAWN_STABLE_UPTIME = 60.0
+# 连续失败超过该次数后不再重新派生该工作进程
+RESPAWN_MAX_FAILURES = 10
+
+
+def _create_listen_socket(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    """创建可被子进程继承的监听socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def _run_worker(wsgi_app: Callable, host: str, port: int, sock: socket.socket):
+    """工作进程：在继承的socket上运行线程化WSGI服务器"""
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    server = make_server(host, port, wsgi_app, threaded=True, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+
+
+def _exit_worker(code: int):
+    """结束工作进程，不返回父进程的调用栈
+
+    先执行 atexit 钩子（审计日志、Token使用时间写回），再以 os._exit 退出
+    """
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(code)
+
+
+def serve_prefork(wsgi_app: Callable, host: str, port: int, workers: int):
+    """以预派生多进程方式运行WSGI应用
+
+    Args:
+        wsgi_app: WSGI应用
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+    """
+    if not hasattr(os, 'fork'):
+        mcp_logger.warning("os.fork is not available on this platform, falling back to a single worker")
+        make_server(host, port, wsgi_app, threaded=True).serve_forever()
+        return
+
+    sock = _create_listen_socket(host, port)
+    children: Dict[int, int] = {}  # pid -> worker序号
+    started: Dict[int, float] = {}  # worker序号 -> 启动时间
+    failures: Dict[int, int] = {}  # worker序号 -> 连续失败次数
+    pending: Dict[int, float] = {}  # worker序号 -> 计划重新派生的时间
+    stopping = False
+
+    def spawn(index: int):
+        started[index] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            # 子进程无论如何都不能继续执行父进程的派生循环
+            code = 1
+            try:
+                _run_worker(wsgi_app, host, port, sock)
+                code = 0
+            except SystemExit as exc:
+                code = exc.code if isinstance(exc.code, int) else 0
+            except KeyboardInterrupt:
+                code = 0
+            except BaseException:
+                mcp_logger.error(f"Worker {index} (pid {os.getpid()}) failed", exc_info=True)
+            finally:
+                _exit_worker(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    mcp_logger.info(f"Pre-fork server started with {workers} workers on {host}:{port} (pids: {sorted(children)})")
+
+    while children or pending:
+        if stopping:
+            pending.clear()
+        now = time.monotonic()
+        for index, due in list(pending.items()):
+            if due <= now:
+                del pending[index]
+                spawn(index)
+
+        try:
+            if pending:
+                # 有待重新派生的工作进程时轮询，到期后派生
+                pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+                if pid == 0:
+                    time.sleep(min(0.1, max(0.0, min(pending.values()) - time.monotonic())))
+                    continue
+            else:
+                pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+
+        # 工作进程意外退出，退避后重新派生
+        if time.monotonic() - started.get(index, 0.0) >= RESPAWN_STABLE_UPTIME:
+            failures[index] = 0
+        failures[index] = failures.get(index, 0) + 1
+        if failures[index] > RESPAWN_MAX_FAILURES:
+            mcp_logger.error(f"Worker {index} (pid {pid}) exited with status {status} after "
+                             f"{RESPAWN_MAX_FAILURES} consecutive failures, not respawning")
+            continue
+        delay = min(RESPAWN_MAX_DELAY, RESPAWN_BASE_DELAY * 2 ** (failures[index] - 1))
+        mcp_logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, respawning in {delay:.1f}s")
+        pending[index] = time.monotonic() + delay
+
+    if not stopping:
+        mcp_logger.error("All pre-fork workers have stopped")
+    sock.close()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+提示词模板注册表
+提示词模板一次性载入内存并预先解析占位符，按 (名称, updated_at) 复用编译结果；
+渲染提示词不再访问数据库，管理后台修改提示词后通过跨进程缓存代数通知各进程重新载入
+"""
+
+import os
+import string
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from cache_utils import CacheGeneration, cache_generation
+
+# 内置提示词渲染时提供的变量，模板只能引用这些占位符
+PROMPT_VARIABLES: Dict[str, Tuple[str, ...]] = {
+    'action_generation': ('prompt', 'category', 'name', 'display_name', 'description'),
+    'response_simulation': ('app_category', 'app_name', 'app_display_name', 'app_description',
+                            'ai_notes', 'action', 'parameters', 'action_definition'),
+}
+
+_CONVERSIONS = (None, 's', 'r', 'a')
+
+
+def parse_placeholders(template: str) -> Tuple[str, ...]:
+    """解析模板中的占位符（按首次出现的顺序），模板格式错误时抛出 ValueError
+
+    只允许 {变量名} 形式的具名占位符（可带 !s/!r/!a 转换和格式说明），
+    不允许位置参数 {} / {0}、属性或下标访问 {a.b} / {a[0]} 以及嵌套占位符；
+    字面量花括号需写作 {{ 和 }}。
+    """
+    try:
+        fields = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise ValueError(f"模板格式错误: {e}（字面量花括号请写作 {{{{ 和 }}}}）") from None
+
+    placeholders: List[str] = []
+    for _, field_name, format_spec, conversion in fields:
+        if field_name is None:
+            continue
+        if not field_name.isidentifier():
+            raise ValueError(f"不支持的占位符 {{{field_name}}}：只能使用具名变量（字面量花括号请写作 {{{{ 和 }}}}）")
+        if conversion not in _CONVERSIONS:
+            raise ValueError(f"占位符 {{{field_name}}} 的转换 !{conversion} 无效")
+        if format_spec and '{' in format_spec:
+            raise ValueError(f"占位符 {{{field_name}}} 的格式说明中不能嵌套占位符")
+        if field_name not in placeholders:
+            placeholders.append(field_name)
+    return tuple(placeholders)
+
+
+def validate_prompt_template(name: str, template: str,
+                             variables: Optional[Iterable[Mapping[str, Any]]] = None) -> Tuple[str, ...]:
+    """保存前校验提示词模板，返回占位符列表；校验失败时抛出 ValueError
+
+    内置提示词的占位符必须是渲染时提供的变量，其他提示词的占位符必须在变量列表中声明。
+    """
+    placeholders = parse_placeholders(template)
+    if name in PROMPT_VARIABLES:
+        allowed = PROMPT_VARIABLES[name]
+    else:
+        allowed = tuple(v.get('name') for v in (variables or []) if isinstance(v, Mapping))
+    unknown = [p for p in placeholders if p not in allowed]
+    if unknown:
+        raise ValueError(
+            f"未知的占位符: {', '.join('{' + p + '}' for p in unknown)}"
+            f"（可用变量: {', '.join(allowed) or '无'}）"
+        )
+
+    # 以空字符串试渲染一次，提前发现无效的格式说明
+    try:
+        template.format_map({p: '' for p in placeholders})
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"模板格式错误: {e}") from None
+    return placeholders
+
+
+class CompiledPrompt:
+    """预解析的提示词模板（只读）"""
+
+    __slots__ = ('name', 'version', 'template', 'placeholders')
+
+    def __init__(self, name: str, version: Tuple[Any, Any], template: str):
+        self.name = name
+        # (模板 id, updated_at)，用于响应缓存键
+        self.version = version
+        self.template = template
+        self.placeholders = frozenset(parse_placeholders(template))
+
+    def uses(self, variable: str) -> bool:
+        """模板是否引用了该变量（未引用的变量无需计算）"""
+        return variable in self.placeholders
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        """渲染提示词（缺少变量时抛出 KeyError）"""
+        return self.template.format_map(variables)
+
+
+def _load_prompt_templates() -> List[Any]:
+    # models 在保存时调用本模块校验模板，延迟导入避免循环依赖
+    from models import db_manager
+    return db_manager.get_all_prompt_templates()
+
+
+class PromptRegistry:
+    """提示词模板注册表（每个进程一个）
+
+    首次使用时一次查询载入全部启用的提示词；跨进程缓存代数变化时重新载入，
+    updated_at 未变化的提示词沿用已解析的结果。数据库中保存了无法解析的模板
+    （旧版本未做校验）时该提示词视为不存在，调用方使用内置提示词。
+
+    Args:
+        loader: 读取全部提示词模板的函数
+        generation: 跨进程缓存代数
+    """
+
+    def __init__(self, loader: Callable[[], List[Any]] = _load_prompt_templates,
+                 generation: Optional[CacheGeneration] = None):
+        self._loader = loader
+        self._generation = generation
+        self._seen_generation = None
+        self._prompts: Optional[Dict[str, CompiledPrompt]] = None
+        self._compiled: Dict[Tuple[str, Any], CompiledPrompt] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.invalid = 0
+
+    def reset_after_fork(self):
+        """子进程中重建锁（已载入的提示词只读，随fork共享）"""
+        self._lock = threading.Lock()
+
+    def stale(self) -> bool:
+        """下次 get 是否需要从数据库重新载入"""
+        return self._prompts is None or (
+            self._generation is not None and self._generation.current() != self._seen_generation
+        )
+
+    def _reload(self):
+        """重新载入全部提示词（需持有锁）"""
+        seen_generation = self._generation.current() if self._generation else None
+        prompts: Dict[str, CompiledPrompt] = {}
+        compiled: Dict[Tuple[str, Any], CompiledPrompt] = {}
+        for row in self._loader():
+            if not row.enabled:
+                continue
+            key = (row.name, row.updated_at)
+            prompt = self._compiled.get(key)
+            if prompt is None or prompt.template != row.template:
+                try:
+                    prompt = CompiledPrompt(row.name, (row.id, row.updated_at), row.template)
+                except ValueError:
+                    self.invalid += 1
+                    continue
+            prompts[row.name] = compiled[key] = prompt
+        self._prompts = prompts
+        self._compiled = compiled
+        self._seen_generation = seen_generation
+        self.loads += 1
+
+    def get(self, name: str) -> Optional[CompiledPrompt]:
+        """获取启用的提示词模板，不存在时返回 None"""
+        prompts = self._prompts
+        if self.stale():
+            with self._lock:
+                if self.stale():
+                    self.misses += 1
+                    self._reload()
+                else:
+                    self.hits += 1
+                prompts = self._prompts
+        else:
+            self.hits += 1
+        return prompts.get(name)
+
+    def invalidate(self):
+        """丢弃已载入的提示词并通知其他进程（提示词保存或删除后调用）"""
+        with self._lock:
+            self._prompts = None
+        if self._generation is not None:
+            self._generation.bump()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取注册表统计信息"""
+        prompts = self._prompts
+        total = self.hits + self.misses
+        return {
+            'size': len(prompts) if prompts is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+            'invalid': self.invalid,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+# 全局提示词模板注册表
+prompt_registry = PromptRegistry(generation=cache_generation)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=prompt_registry.reset_after_fork)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Token / 应用配额
+按Token（以及可选的按应用）执行令牌桶限速和最大并发数限制，
+在产品端点进入数据库和大模型处理之前完成判断，超出配额的请求直接拒绝并给出重试时间
+"""
+
+import os
+import math
+import time
+import threading
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 并发数超限时建议的重试等待时间（秒），进行中请求的结束时间无法预知
+CONCURRENCY_RETRY_AFTER = float(os.getenv('MCP_QUOTA_CONCURRENCY_RETRY_AFTER', '1'))
+
+
+class TokenBucket:
+    """令牌桶
+
+    以 rate_per_minute / 60 的速率补充令牌，最多累积 burst 个。
+    单次消耗超过桶容量（如大批量请求）时，桶满即可放行并记为欠账，
+    长期速率仍受 rate_per_minute 约束。
+    """
+
+    def __init__(self, rate_per_minute: int, burst: int):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def configure(self, rate_per_minute: int, burst: int):
+        """配额被修改时更新速率和容量，保留当前令牌数"""
+        if rate_per_minute != self.rate_per_minute or burst != self.burst:
+            self.rate_per_minute = rate_per_minute
+            self.burst = burst
+            self.tokens = min(self.tokens, float(burst))
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, cost: int, now: float) -> float:
+        """获取消耗 cost 个令牌需等待的秒数，0 表示可立即放行（不消耗令牌）"""
+        self._refill(now)
+        required = min(float(cost), float(self.burst))
+        if self.tokens >= required:
+            return 0.0
+        return (required - self.tokens) * 60.0 / self.rate_per_minute
+
+    def consume(self, cost: int):
+        self.tokens -= cost
+
+
+class QuotaExceeded:
+    """配额超限信息
+
+    Attributes:
+        scope: 超限的配额范围（token / app）
+        reason: 超限原因（rate：速率超限 / concurrency：并发数超限）
+        limit: 对应的配额值
+        retry_after: 建议的重试等待时间（秒）
+    """
+
+    def __init__(self, scope: str, reason: str, limit: int, retry_after: float):
+        self.scope = scope
+        self.reason = reason
+        self.limit = limit
+        self.retry_after = retry_after
+
+    @property
+    def message(self) -> str:
+        if self.reason == 'rate':
+            return f"Rate limit exceeded for {self.scope}: {self.limit} requests per minute"
+        return f"Concurrency limit exceeded for {self.scope}: {self.limit} requests in flight"
+
+    def retry_after_header(self) -> str:
+        """Retry-After 响应头取值（整数秒，至少1秒）"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'scope': self.scope,
+            'reason': self.reason,
+            'limit': self.limit,
+            'retryAfter': round(self.retry_after, 3)
+        }
+
+
+class QuotaLease:
+    """已占用的并发配额，请求结束时释放（可重复调用，只释放一次）"""
+
+    def __init__(self, limiter: 'QuotaLimiter', slots: Dict[Tuple[str, int], int]):
+        self._limiter = limiter
+        self._slots = slots
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._slots:
+            self._limiter._release(self._slots)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class QuotaLimiter:
+    """线程安全的配额执行器（每个进程独立统计）
+
+    Token 的配额字段为空时使用全局默认值，0 表示不限制；
+    应用的配额字段为所有Token合计的上限，为空或0表示不限制。
+
+    Args:
+        default_rate: Token默认每分钟请求数，0 表示不限制
+        default_burst: Token默认突发容量，0 表示等于每分钟请求数
+        default_concurrency: Token默认最大并发数，0 表示不限制
+    """
+
+    def __init__(self, default_rate: int = 0, default_burst: int = 0, default_concurrency: int = 0):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.default_concurrency = default_concurrency
+        self._buckets: Dict[Tuple[str, int], TokenBucket] = {}
+        self._in_flight: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.allowed = 0
+        self.rejected: Dict[Tuple[str, str], int] = {}
+
+    def reset_after_fork(self):
+        """子进程中重置状态（配额按进程统计）"""
+        self._buckets = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _value(value: Optional[int], default: int) -> int:
+        return default if value is None else int(value)
+
+    def _scopes(self, token_info: Dict[str, Any], app_costs: Dict[Any, int], cost: int, slots: int):
+        """生成 (范围, 键, 每分钟请求数, 突发容量, 最大并发数, 消耗令牌数, 占用并发数)"""
+        rate = self._value(token_info.get('rate_limit_per_minute'), self.default_rate)
+        burst = self._value(token_info.get('rate_limit_burst'), self.default_burst)
+        concurrency = self._value(token_info.get('max_concurrency'), self.default_concurrency)
+        yield 'token', ('token', token_info['id']), rate, burst, concurrency, cost, slots
+
+        for app_obj, app_cost in app_costs.items():
+            yield ('app', ('app', app_obj.id),
+                   getattr(app_obj, 'rate_limit_per_minute', None) or 0,
+                   getattr(app_obj, 'rate_limit_burst', None) or 0,
+                   getattr(app_obj, 'max_concurrency', None) or 0,
+                   app_cost, min(slots, app_cost))
+
+    def acquire(self, token_info: Dict[str, Any], app_obj: Any = None,
+                cost: int = 1, slots: int = 1,
+                app_costs: Optional[Dict[Any, int]] = None) -> Tuple[Optional[QuotaLease], Optional[QuotaExceeded]]:
+        """检查并占用配额
+
+        Args:
+            token_info: 授权缓存中的Token信息（包含 id 和配额字段）
+            app_obj: 被访问的应用，为 None 时只检查Token配额
+            cost: 消耗的令牌数（批量请求为调用数）
+            slots: 占用的并发数
+            app_costs: 聚合端点的请求涉及多个应用时，各应用的调用数（给出时忽略 app_obj）
+
+        Returns:
+            (QuotaLease, None) 或 (None, QuotaExceeded)；所有范围都满足时才会消耗令牌和占用并发
+        """
+        if app_costs is None:
+            app_costs = {app_obj: cost} if app_obj is not None else {}
+        now = time.monotonic()
+        with self._lock:
+            consumed = []
+            held: Dict[Tuple[str, int], int] = {}
+            for scope, key, rate, burst, concurrency, scope_cost, scope_slots in self._scopes(
+                    token_info, app_costs, cost, slots):
+                if concurrency > 0:
+                    # 占用数不超过上限，否则大批量请求永远无法放行
+                    need = min(scope_slots, concurrency)
+                    if self._in_flight.get(key, 0) + need > concurrency:
+                        return None, self._reject(scope, 'concurrency', concurrency, CONCURRENCY_RETRY_AFTER)
+                    held[key] = need
+
+                if rate > 0:
+                    burst = burst if burst > 0 else rate
+                    bucket = self._buckets.get(key)
+                    if bucket is None:
+                        bucket = self._buckets[key] = TokenBucket(rate, burst)
+                    else:
+                        bucket.configure(rate, burst)
+                    wait = bucket.wait_time(scope_cost, now)
+                    if wait > 0:
+                        return None, self._reject(scope, 'rate', rate, wait)
+                    consumed.append((bucket, scope_cost))
+
+            for bucket, scope_cost in consumed:
+                bucket.consume(scope_cost)
+            for key, need in held.items():
+                self._in_flight[key] = self._in_flight.get(key, 0) + need
+            self.allowed += 1
+        return QuotaLease(self, held), None
+
+    def _reject(self, scope: str, reason: str, limit: int, retry_after: float) -> QuotaExceeded:
+        """记录一次拒绝（需持有锁）"""
+        self.rejected[(scope, reason)] = self.rejected.get((scope, reason), 0) + 1
+        return QuotaExceeded(scope, reason, limit, retry_after)
+
+    def _release(self, slots: Dict[Tuple[str, int], int]):
+        with self._lock:
+            for key, count in slots.items():
+                remaining = self._in_flight.get(key, 0) - count
+                if remaining > 0:
+                    self._in_flight[key] = remaining
+                else:
+                    self._in_flight.pop(key, None)
+
+    def in_flight(self) -> Dict[str, int]:
+        """各范围当前进行中的请求数合计"""
+        with self._lock:
+            totals = {'token': 0, 'app': 0}
+            for (scope, _), count in self._in_flight.items():
+                totals[scope] += count
+            return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """获取配额统计信息"""
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'rejected': {f"{scope}_{reason}": count for (scope, reason), count in self.rejected.items()},
+                'buckets': len(self._buckets),
+                'in_flight': sum(self._in_flight.values())
+            }
+
+
+# 全局配额执行器
+quota_limiter = QuotaLimiter(
+    default_rate=int(os.getenv('MCP_TOKEN_RATE_LIMIT', '0')),
+    default_burst=int(os.getenv('MCP_TOKEN_RATE_BURST', '0')),
+    default_concurrency=int(os.getenv('MCP_TOKEN_MAX_CONCURRENCY', '0'))
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=quota_limiter.reset_after_fork)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+请求耗时分解
+为每个请求记录命名的耗时区间（span），以 Server-Timing 响应头返回，
+并可写入 JSON Lines 追踪文件，用于分析每次调用的延迟构成
+"""
+
+import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+import json_codec
+
+load_dotenv()
+
+# 是否返回 Server-Timing 响应头（默认开启）
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+# JSON Lines 追踪文件路径，为空表示不写入
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# 不记录耗时的路径（健康检查等）
+SKIP_PATHS = {'/health', '/livez', '/readyz', '/metrics'}
+
+_current_trace: ContextVar[Optional['RequestTrace']] = ContextVar('current_trace', default=None)
+
+
+class TraceFileWriter:
+    """追踪文件写入器（每个请求一行JSON）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: Dict[str, Any]):
+        line = json_codec.dumps(record) + b'\n'
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'ab', buffering=0)
+            self._file.write(line)
+
+    def reset_after_fork(self):
+        """子进程中重新打开文件"""
+        self._lock = threading.Lock()
+        self._file = None
+
+
+trace_writer = TraceFileWriter(TRACE_FILE) if TRACE_FILE else None
+
+if trace_writer and hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=trace_writer.reset_after_fork)
+
+
+class RequestTrace:
+    """单个请求的耗时记录"""
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.status: Optional[int] = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def add(self, name: str, start: float, duration_ms: float, **attrs):
+        """记录一个span（start 为 time.perf_counter() 取值）"""
+        span = {
+            'name': name,
+            'start_ms': round((start - self._start) * 1000, 3),
+            'duration_ms': round(duration_ms, 3)
+        }
+        if attrs:
+            span.update(attrs)
+        # list.append 是原子操作，批量请求的并发调用可安全写入同一追踪
+        self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """生成 Server-Timing 头（同名span累加），末尾附带总耗时"""
+        totals: Dict[str, float] = {}
+        for span in list(self.spans):
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['duration_ms']
+        metrics = [f"{name};dur={duration:.1f}" for name, duration in totals.items()]
+        metrics.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ', '.join(metrics)
+
+    def finish(self):
+        """请求结束，写入追踪文件"""
+        if trace_writer is None:
+            return
+        try:
+            trace_writer.write({
+                'trace_id': self.trace_id,
+                'timestamp': self.started_at.isoformat(),
+                'method': self.method,
+                'path': self.path,
+                'status': self.status,
+                'total_ms': round(self.elapsed_ms(), 3),
+                'spans': list(self.spans)
+            })
+        except Exception:
+            # 追踪写入失败不影响请求
+            pass
+
+
+def tracing_enabled() -> bool:
+    return SERVER_TIMING_ENABLED or trace_writer is not None
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录代码块耗时，当前没有追踪时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, (time.perf_counter() - start) * 1000, **attrs)
+
+
+def record_span(name: str, start: float, **attrs):
+    """记录从 start（time.perf_counter() 取值）到现在的耗时，用于跨越多段代码的区间"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, start, (time.perf_counter() - start) * 1000, **attrs)
+
+
+class TimingWSGIMiddleware:
+    """WSGI中间件：为请求建立追踪，添加 Server-Timing 头，响应体发送完毕后写入追踪文件"""
+
+    def __init__(self, wsgi_app: Callable):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not tracing_enabled() or path in SKIP_PATHS:
+            return self.wsgi_app(environ, start_response)
+
+        trace = RequestTrace(environ.get('REQUEST_METHOD', ''), path)
+        token = _current_trace.set(trace)
+
+        def timing_start_response(status, headers, exc_info=None):
+            trace.status = int(status.split(' ', 1)[0])
+            if SERVER_TIMING_ENABLED:
+                headers = list(headers) + [('Server-Timing', trace.server_timing())]
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, timing_start_response)
+        except BaseException:
+            _current_trace.reset(token)
+            trace.finish()
+            raise
+        return _TracedBody(body, trace, token)
+
+
+class _TracedBody:
+    """包装WSGI响应体：流式响应在服务器迭代时仍可记录span，关闭时结束追踪"""
+
+    def __init__(self, body: Iterable[bytes], trace: RequestTrace, token):
+        self._body = body
+        self._trace = trace
+        self._token = token
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            try:
+                _current_trace.reset(self._token)
+            except ValueError:
+                # 在其他上下文中关闭时无法重置，直接清除
+                _current_trace.set(None)
+            self._trace.finish()
+
+
+class TimingASGIMiddleware:
+    """ASGI中间件：为请求建立追踪，添加 Server-Timing 头，响应发送完毕后写入追踪文件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not tracing_enabled() or scope.get('path') in SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope.get('method', ''), scope.get('path', ''))
+        token = _current_trace.set(trace)
+
+        async def timing_send(message):
+            if message['type'] == 'http.response.start':
+                trace.status = message.get('status')
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get('headers', []))
+                    headers.append((b'server-timing', trace.server_timing().encode('latin-1')))
+                    message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+大模型响应缓存
+相同应用、动作和参数的调用复用已生成的模拟响应，测试循环中重复的查询不再等待大模型。
+缓存键包含应用版本、提示词模板版本和模型，模板或提示词修改后自动使用新条目；
+按应用开启（缓存秒数），并可为应用设置总是实时生成
+"""
+
+import os
+import json
+import threading
+from typing import Any, Dict, Hashable, Optional
+from dotenv import load_dotenv
+from cache_utils import TTLCache
+
+load_dotenv()
+
+
+def canonical_parameters(parameters: Dict[str, Any]) -> str:
+    """参数的规范化编码（键排序、紧凑分隔符），键顺序不同的相同参数得到相同结果"""
+    return json.dumps(parameters, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class ResponseCache:
+    """LRU + 按应用TTL的响应缓存（每个进程独立）
+
+    应用的 response_cache_ttl 为空时使用 default_ttl，为 0 时不缓存；
+    response_cache_always_fresh 为真的应用总是调用大模型。default_ttl 默认为 0，
+    即只有显式设置了缓存秒数的应用才会缓存。
+
+    Args:
+        maxsize: 最大缓存条目数，0 表示关闭缓存
+        default_ttl: 应用未设置缓存秒数时的默认值
+    """
+
+    def __init__(self, maxsize: int = 1024, default_ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._cache = TTLCache(maxsize=max(maxsize, 1), ttl=None)
+        self._lock = threading.Lock()
+
+        # 统计信息（按应用路径）
+        self.bypassed = 0
+        self._app_stats: Dict[str, Dict[str, int]] = {}
+
+    def ttl_for(self, app_info: Dict[str, Any]) -> Optional[float]:
+        """应用的缓存秒数，不缓存时返回 None"""
+        if self.maxsize <= 0 or app_info.get('response_cache_always_fresh'):
+            return None
+        ttl = app_info.get('response_cache_ttl')
+        ttl = self.default_ttl if ttl is None else ttl
+        return float(ttl) if ttl > 0 else None
+
+    @staticmethod
+    def make_key(app_info: Dict[str, Any], action: str, parameters: Dict[str, Any],
+                 prompt_version: Any, model: str) -> Hashable:
+        """缓存键：应用、应用版本（模板修改时更新）、动作、规范化参数、提示词模板版本和模型"""
+        return (
+            app_info.get('id'), app_info.get('version'), action,
+            canonical_parameters(parameters), prompt_version, model
+        )
+
+    def _count(self, app_path: str, result: str):
+        with self._lock:
+            stats = self._app_stats.get(app_path)
+            if stats is None:
+                stats = self._app_stats[app_path] = {'hits': 0, 'misses': 0, 'bypassed': 0}
+            stats[result] += 1
+            if result == 'bypassed':
+                self.bypassed += 1
+
+    def get(self, key: Hashable, app_path: str) -> Optional[Dict[str, Any]]:
+        """查找缓存的响应（返回对象只读，请勿修改）"""
+        response = self._cache.get(key)
+        self._count(app_path, 'misses' if response is None else 'hits')
+        return response
+
+    def bypass(self, app_path: str):
+        """记录一次未使用缓存的调用（应用未开启缓存或设置为总是实时生成）"""
+        self._count(app_path, 'bypassed')
+
+    def set(self, key: Hashable, response: Dict[str, Any], ttl: float):
+        """缓存大模型生成的响应"""
+        self._cache.set(key, response, ttl=ttl)
+
+    def clear(self):
+        """清空缓存"""
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息（含各应用的命中情况）"""
+        stats = self._cache.stats()
+        stats['maxsize'] = self.maxsize
+        stats['enabled'] = self.maxsize > 0
+        stats['default_ttl'] = self.default_ttl
+        stats['bypassed'] = self.bypassed
+        with self._lock:
+            stats['apps'] = {path: dict(app_stats) for path, app_stats in self._app_stats.items()}
+        return stats
+
+
+# 全局大模型响应缓存
+response_cache = ResponseCache(
+    maxsize=int(os.getenv('LLM_RESPONSE_CACHE_SIZE', '1024')),
+    default_ttl=float(os.getenv('LLM_RESPONSE_CACHE_TTL', '0'))
+)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+大模型响应录制与回放
+录制模式下把每次大模型生成的（应用、动作、参数 → 解析后的响应）追加写入 JSON Lines 文件；
+回放模式从该文件读取响应直接返回，CI 中的智能体测试得到确定的结果且不等待大模型
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+import json_codec
+from response_cache import canonical_parameters
+from metrics import metrics_registry
+
+load_dotenv()
+
+# 运行模式：off 不录制也不回放，record 录制大模型响应，replay 回放已录制的响应
+RECORD_MODES = ('off', 'record', 'replay')
+# 回放未命中时的处理方式：fail 返回错误结果，llm 调用大模型，default 返回默认模拟响应
+MISS_POLICIES = ('fail', 'llm', 'default')
+
+
+def replay_key(app_path: str, action: str, parameters: Dict[str, Any]) -> Tuple[str, str, str]:
+    """回放键：应用路径、动作和规范化参数（不含数据库ID，重建数据库后录制仍然可用）"""
+    return app_path, action, canonical_parameters(parameters)
+
+
+class ResponseRecorder:
+    """大模型响应录制器（录制文件只追加，多个进程可同时录制到同一文件）
+
+    回放模式在首次查找时把整个录制文件载入内存索引，同一调用有多条录制时使用最后一条；
+    录制文件末尾不完整的行（进程在写入时退出）会被跳过。
+
+    Args:
+        path: 录制文件路径（JSON Lines，每次调用一行）
+        mode: off / record / replay
+        miss_policy: 回放未命中时的处理方式 fail / llm / default
+    """
+
+    def __init__(self, path: str, mode: str = 'off', miss_policy: str = 'fail'):
+        if mode not in RECORD_MODES:
+            raise ValueError(f"LLM_RECORD_MODE must be one of {', '.join(RECORD_MODES)}, got {mode!r}")
+        if miss_policy not in MISS_POLICIES:
+            raise ValueError(f"LLM_REPLAY_MISS must be one of {', '.join(MISS_POLICIES)}, got {miss_policy!r}")
+        self.path = path
+        self.mode = mode
+        self.miss_policy = miss_policy
+        self._lock = threading.Lock()
+        self._file = None
+        self._index: Optional[Dict[Tuple[str, str, str], Dict[str, Any]]] = None
+
+        # 统计信息
+        self.recorded = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped_lines = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def reset_after_fork(self):
+        """子进程中重新打开录制文件（回放索引是只读的，随fork共享）"""
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, app_path: str, action: str, parameters: Dict[str, Any],
+               response: Dict[str, Any], model: Optional[str] = None):
+        """追加一条录制（整行一次写入，O_APPEND 保证多进程写入不会交错）"""
+        line = json_codec.dumps({
+            'app': app_path,
+            'action': action,
+            'parameters': parameters,
+            'response': response,
+            'model': model,
+            'recorded_at': datetime.now(timezone.utc).isoformat()
+        }) + b'\n'
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'ab', buffering=0)
+            self._file.write(line)
+            self.recorded += 1
+
+    def iter_records(self, app_path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """按录制顺序读取录制文件（app_path 不为空时只返回该应用的录制）"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json_codec.loads(line)
+                except ValueError:
+                    self.skipped_lines += 1
+                    continue
+                if app_path is None or record.get('app') == app_path:
+                    yield record
+
+    def _load(self) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = {}
+                    for record in self.iter_records():
+                        if not isinstance(record, dict) or 'response' not in record:
+                            self.skipped_lines += 1
+                            continue
+                        key = replay_key(record.get('app'), record.get('action'), record.get('parameters') or {})
+                        index[key] = record['response']
+                    self._index = index
+        return self._index
+
+    def lookup(self, app_path: str, action: str, parameters: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """查找录制的响应（返回对象只读，请勿修改），未命中时返回 None"""
+        response = self._load().get(replay_key(app_path, action, parameters))
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def reload(self):
+        """丢弃回放索引，下次查找时重新读取录制文件"""
+        with self._lock:
+            self._index = None
+
+    def export(self, app_path: str) -> bytes:
+        """导出一个应用的录制（JSON Lines，可直接作为回放文件使用）"""
+        return b''.join(json_codec.dumps(record) + b'\n' for record in self.iter_records(app_path))
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """录制文件中各应用的录制条数和动作列表"""
+        apps: Dict[str, Dict[str, Any]] = {}
+        for record in self.iter_records():
+            entry = apps.setdefault(record.get('app'), {'records': 0, 'actions': set(), 'last_recorded_at': None})
+            entry['records'] += 1
+            entry['actions'].add(record.get('action'))
+            entry['last_recorded_at'] = record.get('recorded_at')
+        for entry in apps.values():
+            entry['actions'] = sorted(entry['actions'])
+        return apps
+
+    def stats(self) -> Dict[str, Any]:
+        """获取录制与回放统计信息"""
+        index = self._index
+        return {
+            'mode': self.mode,
+            'miss_policy': self.miss_policy,
+            'path': self.path,
+            'recorded': self.recorded,
+            'replay_entries': len(index) if index is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'skipped_lines': self.skipped_lines
+        }
+
+
+# 全局大模型响应录制器
+response_recorder = ResponseRecorder(
+    os.getenv('LLM_RECORD_FILE', 'data/llm_recordings.jsonl'),
+    mode=os.getenv('LLM_RECORD_MODE', 'off').lower(),
+    miss_policy=os.getenv('LLM_REPLAY_MISS', 'fail').lower()
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=response_recorder.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_llm_recorded_total', 'LLM responses written to the recording file', lambda: response_recorder.recorded,
+    kind='counter'
+)
+metrics_registry.callback(
+    'unimcp_llm_replay_total', 'Replay lookups by result', lambda: {
+        'hit': response_recorder.hits, 'miss': response_recorder.misses
+    }, ('result',), kind='counter'
+)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+MCP会话存储
+有界的会话表：超过容量时淘汰最久未活动的会话，空闲超过 TTL 的会话自动过期，
+长时间运行的模拟器不会因 initialize 请求累积而泄漏内存
+"""
+
+import os
+import hmac
+import time
+import uuid
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class SessionStore:
+    """线程安全的会话存储（LRU容量上限 + 空闲TTL）
+
+    会话按最近活动时间排序，最久未活动的会话位于队首，
+    过期清理只需从队首开始检查，创建和访问会话均为 O(1)。
+
+    服务器签发的会话ID带有 HMAC 签名。多进程时会话只保存在处理 initialize 的工作进程中，
+    其他工作进程通过 resume 接纳签名有效的会话ID；接纳的会话放在独立的小容量表中，
+    不会挤掉本进程初始化的会话。
+
+    Args:
+        maxsize: 最大会话数，超出后淘汰最久未活动的会话
+        idle_ttl: 会话空闲过期时间（秒），None 表示不过期
+        adopt_unknown: 是否接纳其他工作进程签发的会话ID（多进程模式下为真）
+        adopt_maxsize: 接纳会话表的容量
+        secret: 会话ID签名密钥，各工作进程必须相同
+    """
+
+    def __init__(self, maxsize: int = 10000, idle_ttl: Optional[float] = 3600.0,
+                 adopt_unknown: bool = False, adopt_maxsize: int = 1000, secret: Optional[str] = None):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.adopt_unknown = adopt_unknown
+        self.adopt_maxsize = adopt_maxsize
+        self.secret = secret or secrets.token_hex(32)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._adopted: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.created = 0
+        self.adopted = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _signature(self, raw_id: str) -> str:
+        return hmac.new(self.secret.encode(), raw_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def new_id(self) -> str:
+        """生成带签名的新会话ID"""
+        raw_id = uuid.uuid4().hex
+        return f"{raw_id}.{self._signature(raw_id)}"
+
+    def verify_id(self, session_id: Optional[str]) -> bool:
+        """会话ID是否由持有相同密钥的进程签发"""
+        raw_id, _, signature = (session_id or '').partition('.')
+        return bool(raw_id and signature) and hmac.compare_digest(signature, self._signature(raw_id))
+
+    def _expire(self, sessions: OrderedDict, now: float):
+        """从队首清理空闲过期的会话（需持有锁）"""
+        if self.idle_ttl is None:
+            return
+        while sessions:
+            session_id, session = next(iter(sessions.items()))
+            if now - session['last_seen'] < self.idle_ttl:
+                break
+            del sessions[session_id]
+            self.expired += 1
+
+    def _store(self, sessions: OrderedDict, maxsize: int, session_id: str,
+               client_info: Dict[str, Any]) -> Dict[str, Any]:
+        """写入会话并按容量淘汰同一张表中的会话（需持有锁）"""
+        now = time.monotonic()
+        self._expire(sessions, now)
+        session = sessions[session_id] = {
+            'initialized': True,
+            'client_info': client_info,
+            'created_at': datetime.now(),
+            'last_seen': now
+        }
+        sessions.move_to_end(session_id)
+        while len(sessions) > maxsize:
+            sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def _touch(self, sessions: OrderedDict, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """记录会话活动（需持有锁）"""
+        session = sessions.get(session_id)
+        if session is None:
+            return None
+        if self.idle_ttl is not None and now - session['last_seen'] >= self.idle_ttl:
+            del sessions[session_id]
+            self.expired += 1
+            return None
+        session['last_seen'] = now
+        sessions.move_to_end(session_id)
+        return session
+
+    def create(self, session_id: Optional[str] = None, client_info: Optional[Dict[str, Any]] = None) -> str:
+        """创建（或重新初始化）会话，返回会话ID"""
+        session_id = session_id or self.new_id()
+        with self._lock:
+            if session_id not in self._sessions:
+                self.created += 1
+            self._adopted.pop(session_id, None)
+            self._store(self._sessions, self.maxsize, session_id, client_info or {})
+        return session_id
+
+    def touch(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """记录会话活动并返回会话信息，会话不存在或已过期时返回 None"""
+        with self._lock:
+            return self._touch(self._sessions, session_id, time.monotonic())
+
+    def resume(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """记录会话活动并返回会话信息（用于通知流）
+
+        adopt_unknown 为真时，本进程中不存在但签名有效的会话ID视为在其他工作进程中初始化，
+        登记到接纳会话表；否则与 touch 相同，会话不存在时返回 None。
+        """
+        now = time.monotonic()
+        with self._lock:
+            session = self._touch(self._sessions, session_id, now)
+            if session is not None or not self.adopt_unknown:
+                return session
+            session = self._touch(self._adopted, session_id, now)
+            if session is None and self.verify_id(session_id):
+                self.adopted += 1
+                session = self._store(self._adopted, self.adopt_maxsize, session_id, {})
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        """删除会话"""
+        with self._lock:
+            removed = self._adopted.pop(session_id, None) is not None
+            return self._sessions.pop(session_id, None) is not None or removed
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取会话统计信息"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(self._sessions, now)
+            self._expire(self._adopted, now)
+            return {
+                'live': len(self._sessions),
+                'maxsize': self.maxsize,
+                'created': self.created,
+                'adopted': self.adopted,
+                'adopted_live': len(self._adopted),
+                'evicted': self.evicted,
+                'expired': self.expired
+            }
+
+
+def _optional_ttl(value: str) -> Optional[float]:
+    """解析TTL配置，0 或负数表示不过期"""
+    ttl = float(value)
+    return ttl if ttl > 0 else None
+
+
+# 全局会话存储
+session_store = SessionStore(
+    maxsize=int(os.getenv('MCP_SESSION_MAX', '10000')),
+    idle_ttl=_optional_ttl(os.getenv('MCP_SESSION_IDLE_TTL', '3600')),
+    adopt_unknown=int(os.getenv('MCP_WORKERS', '1')) > 1,
+    adopt_maxsize=int(os.getenv('MCP_SESSION_ADOPT_MAX', '1000')),
+    secret=os.getenv('MCP_SESSION_SECRET')
+)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+相同调用合并（singleflight）
+多个智能体同时以相同参数调用同一动作时，只有第一个调用请求大模型，
+同时到达的相同调用等待并共享它的结果，不再各自触发一次生成
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from metrics import metrics_registry
+
+load_dotenv()
+
+
+class Flight:
+    """一次进行中的生成，等待者在生成结束时被唤醒（同步等待者使用 Event，异步等待者使用 Future）"""
+
+    def __init__(self):
+        self.result: Optional[Dict[str, Any]] = None
+        self.done = False
+        self._event = threading.Event()
+        self._futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = threading.Lock()
+
+    def _complete(self, result: Optional[Dict[str, Any]]):
+        with self._lock:
+            self.result = result
+            self.done = True
+            futures, self._futures = self._futures, []
+        self._event.set()
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def wait(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """等待生成结果，超时或生成者未产出结果时返回 None"""
+        self._event.wait(timeout)
+        return self.result
+
+    async def wait_async(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """等待生成结果（异步版本）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.done:
+                return self.result
+            future = loop.create_future()
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.result
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class SingleFlight:
+    """进行中生成的登记表（每个进程一个）
+
+    第一个调用成为生成者（leader），生成结束后必须调用 finish；
+    同时到达的相同调用成为等待者，获得生成者的结果（返回对象只读，请勿修改）。
+    生成者未产出结果（客户端断开等）或等待超时时，等待者自行生成。
+
+    Args:
+        enabled: 是否合并相同调用
+        max_wait: 等待者最多等待的秒数
+    """
+
+    def __init__(self, enabled: bool = True, max_wait: float = 300.0):
+        self.enabled = enabled
+        self.max_wait = max_wait
+        self._flights: Dict[Hashable, Flight] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+
+    def reset_after_fork(self):
+        """子进程中重置状态（父进程进行中的生成不会随fork复制）"""
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """加入相同调用的生成，返回 (flight, 是否为生成者)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                return flight, True
+            self.followers += 1
+            return flight, False
+
+    def finish(self, key: Hashable, flight: Flight, result: Optional[Dict[str, Any]]):
+        """生成者结束生成（result 为 None 表示未产出结果），唤醒所有等待者"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight._complete(result)
+
+    def fallback(self):
+        """记录一次等待者未获得结果而自行生成"""
+        with self._lock:
+            self.fallbacks += 1
+
+    def in_flight(self) -> int:
+        """当前进行中的生成数"""
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'fallbacks': self.fallbacks
+            }
+
+
+# 全局相同调用合并
+llm_flights = SingleFlight(
+    enabled=os.getenv('LLM_COALESCE_ENABLED', 'true').lower() == 'true',
+    max_wait=float(os.getenv('LLM_COALESCE_MAX_WAIT', '300'))
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=llm_flights.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_llm_coalesced_total', 'Tool calls that shared an identical in-flight LLM generation',
+    lambda: llm_flights.stats()['followers'], kind='counter'
+)
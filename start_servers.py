@@ -6,6 +6,7 @@
 import os
 import sys
 import time
+import argparse
 import threading
 import subprocess
 from dotenv import load_dotenv
@@ -14,15 +15,20 @@ from init_simulators import init_default_simulators
 # 加载环境变量
 load_dotenv()
 
-def run_mcp_server():
+def run_mcp_server(workers: int = 1):
     """运行MCP服务器"""
-    subprocess.run([sys.executable, 'mcp_server.py'])
+    subprocess.run([sys.executable, 'mcp_server.py', '--workers', str(workers)])
 
 def run_admin_server():
     """运行管理后台服务器"""
     subprocess.run([sys.executable, 'admin_server.py'])
 
 def main():
+    parser = argparse.ArgumentParser(description="启动UniMCPSim服务器")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MCP_WORKERS', '1')),
+                        help="MCP服务器工作进程数（默认读取 MCP_WORKERS 环境变量，默认1）")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("UniMCPSim - Universal MCP Simulator")
     print("=" * 60)
@@ -38,7 +44,7 @@ def main():
     print("-" * 60)
 
     # 启动MCP服务器线程
-    mcp_thread = threading.Thread(target=run_mcp_server)
+    mcp_thread = threading.Thread(target=run_mcp_server, args=(args.workers,))
     mcp_thread.daemon = True
     mcp_thread.start()
 
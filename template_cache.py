@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+应用模板编译缓存
+按应用版本 (app id, updated_at) 将模板编译一次，缓存动作索引、参数校验器，
+以及 tools/list 的工具定义及其序列化结果；聚合端点按应用集合缓存合并后的工具列表
+"""
+
+import os
+import re
+import copy
+import math
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from cache_utils import TTLCache
+from json_codec import PreSerializedResult
+from logger_utils import mcp_logger
+
+load_dotenv()
+
+
+def map_param_type(param_type: Optional[str]) -> str:
+    """将模板中的参数类型映射为 JSON Schema 类型"""
+    param_type = (param_type or 'String').lower()
+    if param_type in ["integer", "int"]:
+        return "integer"
+    elif param_type in ["boolean", "bool"]:
+        return "boolean"
+    elif param_type == "array":
+        return "array"
+    return "string"
+
+
+_INTEGER_PATTERN = re.compile(r'^[+-]?\d+$')
+_NUMBER_PATTERN = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
+
+def _coerce_string(value: Any) -> Any:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError("expected string")
+
+
+def _coerce_integer(value: Any) -> Any:
+    if isinstance(value, bool):
+        raise ValueError("expected integer")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and _INTEGER_PATTERN.match(value.strip()):
+        return int(value.strip())
+    raise ValueError("expected integer")
+
+
+def _coerce_number(value: Any) -> Any:
+    # Number 参数在工具定义中声明为 string，数值字符串只做校验、原样传给大模型（"007" 不会变成 7.0）
+    if isinstance(value, bool):
+        raise ValueError("expected number")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and math.isfinite(value):
+        return value
+    if isinstance(value, str) and _NUMBER_PATTERN.match(value.strip()) and math.isfinite(float(value)):
+        return value
+    raise ValueError("expected number")
+
+
+def _coerce_boolean(value: Any) -> Any:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise ValueError("expected boolean")
+
+
+def _coerce_array(value: Any) -> Any:
+    if isinstance(value, list):
+        return value
+    raise ValueError("expected array")
+
+
+def _coerce_object(value: Any) -> Any:
+    # Object 参数在工具定义中声明为 string，字符串和对象均可接受
+    if isinstance(value, (dict, str)):
+        return value
+    raise ValueError("expected object")
+
+
+# 模板参数类型 -> 类型转换函数（数值字符串等无歧义的输入会被转换为声明的类型，Number 参数除外）
+_COERCERS: Dict[str, Callable[[Any], Any]] = {
+    'string': _coerce_string, 'str': _coerce_string, 'text': _coerce_string,
+    'integer': _coerce_integer, 'int': _coerce_integer,
+    'number': _coerce_number, 'float': _coerce_number, 'double': _coerce_number,
+    'boolean': _coerce_boolean, 'bool': _coerce_boolean,
+    'array': _coerce_array, 'list': _coerce_array,
+    'object': _coerce_object, 'dict': _coerce_object, 'json': _coerce_object,
+}
+
+
+class ParamSpec(NamedTuple):
+    """参数规格（编译后的类型转换函数、默认值和枚举查找表）"""
+    key: str
+    schema_type: str
+    required: bool
+    default: Any
+    options: Tuple[Any, ...]
+    coerce: Optional[Callable[[Any], Any]]
+    allowed: Any  # 枚举值集合（可哈希时为 frozenset），无枚举时为 None
+    is_array: bool
+
+
+def _in_options(spec: ParamSpec, value: Any) -> bool:
+    """检查取值是否在枚举范围内（数组参数逐项检查）"""
+    items = value if spec.is_array else (value,)
+    try:
+        # 枚举值与参数类型不一致（如 Integer 参数的枚举写成字符串）时按字符串比较
+        return all(item in spec.allowed or str(item) in spec.allowed for item in items)
+    except TypeError:
+        # 不可哈希的取值不可能出现在枚举中
+        return False
+
+
+def compile_param(param: Dict[str, Any], action_name: str = '') -> ParamSpec:
+    """编译单个参数定义，校验默认值是否符合类型和枚举"""
+    key = param.get('key', '')
+    raw_type = str(param.get('type') or 'String').lower()
+    coerce = _COERCERS.get(raw_type)
+    options = tuple(param.get('options') or ())
+    allowed = None
+    if options and raw_type not in ('object', 'dict', 'json'):
+        try:
+            allowed = frozenset(options) | frozenset(str(option) for option in options)
+        except TypeError:
+            allowed = options + tuple(str(option) for option in options)
+
+    spec = ParamSpec(
+        key=key,
+        schema_type=map_param_type(param.get('type', 'String')),
+        required=bool(param.get('required', False)),
+        default=param.get('default'),
+        options=options,
+        coerce=coerce,
+        allowed=allowed,
+        is_array=coerce is _coerce_array
+    )
+
+    # 默认值不合法时忽略，避免把错误的默认值填入调用参数
+    if spec.default is not None:
+        try:
+            default = coerce(spec.default) if coerce else spec.default
+            if allowed is not None and not _in_options(spec, default):
+                raise ValueError(f"not one of {list(options)}")
+            spec = spec._replace(default=default)
+        except ValueError as e:
+            mcp_logger.warning(f"Ignoring invalid default for parameter {action_name}.{key}: {e}")
+            spec = spec._replace(default=None)
+    return spec
+
+
+class ArgumentValidator:
+    """编译后的参数校验器
+
+    按参数定义逐个检查：必填参数是否存在、类型是否匹配（无歧义时转换类型）、
+    取值是否在枚举范围内，并为缺省的可选参数填入默认值。未声明的参数原样保留。
+    校验只遍历该动作自身的参数，耗时与应用的动作数量无关。
+    """
+
+    __slots__ = ('specs',)
+
+    def __init__(self, specs: Tuple[ParamSpec, ...]):
+        self.specs = specs
+
+    def validate(self, arguments: Any) -> Tuple[Dict[str, Any], List[str]]:
+        """校验调用参数
+
+        Returns:
+            (规范化后的参数副本, 错误信息列表)，错误列表为空表示校验通过
+        """
+        if not isinstance(arguments, dict):
+            return {}, ["Arguments must be an object"]
+
+        result = dict(arguments)
+        errors: List[str] = []
+        for spec in self.specs:
+            value = result.get(spec.key)
+            if value is None:
+                if spec.required:
+                    errors.append(f"Missing required parameter: {spec.key}")
+                elif spec.default is not None:
+                    result[spec.key] = copy.copy(spec.default)
+                continue
+
+            if spec.coerce is not None:
+                try:
+                    value = spec.coerce(value)
+                except ValueError as e:
+                    errors.append(f"Invalid parameter {spec.key}: {e}")
+                    continue
+
+            if spec.allowed is not None and not _in_options(spec, value):
+                errors.append(f"Invalid parameter {spec.key}: must be one of {list(spec.options)}")
+                continue
+
+            result[spec.key] = value
+        return result, errors
+
+
+def build_tool_schema(action: Dict[str, Any]) -> Dict[str, Any]:
+    """根据动作定义构建 MCP 工具定义"""
+    action_name = action.get('name', '')
+    action_display_name = action.get('display_name', action_name)
+    action_description = action.get('description', '')
+    action_parameters = action.get('parameters', [])
+
+    # 构建输入schema
+    input_schema = {
+        "type": "object",
+        "properties": {},
+        "required": []
+    }
+
+    for param in action_parameters:
+        param_key = param.get('key', '')
+        param_description = param.get('description', '')
+        param_required = param.get('required', False)
+        param_default = param.get('default')
+        param_options = param.get('options', [])
+
+        # 映射类型
+        schema_type = map_param_type(param.get('type', 'String'))
+
+        prop_schema = {
+            "type": schema_type,
+            "description": param_description
+        }
+
+        if param_default is not None:
+            prop_schema["default"] = param_default
+
+        if param_options:
+            prop_schema["enum"] = param_options
+
+        if schema_type == "array":
+            prop_schema["items"] = {"type": "string"}
+
+        input_schema["properties"][param_key] = prop_schema
+
+        if param_required:
+            input_schema["required"].append(param_key)
+
+    return {
+        "name": action_name,
+        "description": f"{action_display_name} - {action_description}",
+        "inputSchema": input_schema
+    }
+
+
+class CompiledAction:
+    """编译后的动作：原始定义、参数查找表、参数校验器和工具定义"""
+
+    __slots__ = ('name', 'definition', 'params', 'validator', 'tool')
+
+    def __init__(self, action: Dict[str, Any]):
+        self.name: str = action.get('name', '')
+        self.definition = action
+        self.params: Dict[str, ParamSpec] = {}
+        for param in action.get('parameters', []):
+            spec = compile_param(param, self.name)
+            self.params[spec.key] = spec
+        self.validator = ArgumentValidator(tuple(self.params.values()))
+        self.tool = build_tool_schema(action)
+
+
+class CompiledTemplate:
+    """编译后的应用模板，按动作名称O(1)查找"""
+
+    def __init__(self, template: Optional[Dict[str, Any]]):
+        template = template or {}
+        compiled_actions = [CompiledAction(action) for action in template.get('actions', [])]
+
+        # 动作索引（同名动作以第一个为准，与线性查找的行为一致）
+        self.actions: Dict[str, CompiledAction] = {}
+        for compiled in compiled_actions:
+            self.actions.setdefault(compiled.name, compiled)
+
+        # 为每个action生成一个MCP工具，并预先序列化 tools/list 结果
+        self.tools: List[Dict[str, Any]] = [compiled.tool for compiled in compiled_actions]
+        self.tools_result = PreSerializedResult({"tools": self.tools})
+
+    def get_action(self, name: str) -> Optional[CompiledAction]:
+        """根据名称查找动作"""
+        return self.actions.get(name)
+
+
+# 聚合端点的工具名为 "<应用名>__<动作名>"（应用名唯一，且只含字母、数字、_ 和 -）
+AGGREGATE_TOOL_SEPARATOR = '__'
+
+
+def namespaced_tool_name(app_name: str, action_name: str) -> str:
+    """聚合端点中带应用名前缀的工具名"""
+    return f"{app_name}{AGGREGATE_TOOL_SEPARATOR}{action_name}"
+
+
+class AggregateTemplate:
+    """多个应用合并的工具列表，按带前缀的工具名O(1)路由到应用和动作
+
+    Args:
+        apps: Token可访问的应用
+        compiled: 各应用的编译模板（与 apps 一一对应）
+    """
+
+    def __init__(self, apps: List[Any], compiled: List[CompiledTemplate]):
+        self.apps = apps
+        self.routes: Dict[str, Tuple[Any, str]] = {}
+        self.tools: List[Dict[str, Any]] = []
+        for app, template in zip(apps, compiled):
+            for action in template.actions.values():
+                name = namespaced_tool_name(app.name, action.name)
+                if name in self.routes:
+                    # 应用名可以包含 _，如应用 a 的动作 b__c 与应用 a__b 的动作 c 同名，只保留先出现的工具
+                    kept_app, kept_action = self.routes[name]
+                    mcp_logger.warning(
+                        f"Aggregate tool name {name} is ambiguous: {app.category}/{app.name} action {action.name} "
+                        f"is hidden by {kept_app.category}/{kept_app.name} action {kept_action}; "
+                        f"rename one of them to expose both"
+                    )
+                    continue
+                self.routes[name] = (app, action.name)
+                self.tools.append({
+                    **action.tool,
+                    "name": name,
+                    "description": f"[{app.display_name}] {action.tool['description']}"
+                })
+        self.tools_result = PreSerializedResult({"tools": self.tools})
+
+    def resolve(self, tool_name: Any) -> Optional[Tuple[Any, str]]:
+        """根据带前缀的工具名查找 (应用, 动作名)"""
+        if not isinstance(tool_name, str):
+            return None
+        return self.routes.get(tool_name)
+
+
+class TemplateRegistry:
+    """模板编译缓存，以 (app id, updated_at) 为键，模板修改后自动使用新版本"""
+
+    def __init__(self, maxsize: int = 1024):
+        self._cache = TTLCache(maxsize=maxsize, ttl=None)
+        # 聚合模板以各应用版本的组合为键，拥有相同应用集合的Token共用
+        self._aggregates = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, app) -> CompiledTemplate:
+        """获取应用的编译模板（返回对象只读，请勿修改）"""
+        key = (app.id, app.updated_at)
+        compiled = self._cache.get(key)
+        if compiled is None:
+            compiled = CompiledTemplate(app.template)
+            self._cache.set(key, compiled)
+        return compiled
+
+    def get_aggregate(self, apps: List[Any]) -> AggregateTemplate:
+        """获取多个应用的聚合模板（返回对象只读，请勿修改）"""
+        apps = sorted(apps, key=lambda app: (app.category, app.name))
+        key = tuple((app.id, app.updated_at) for app in apps)
+        aggregate = self._aggregates.get(key)
+        if aggregate is None:
+            aggregate = AggregateTemplate(apps, [self.get(app) for app in apps])
+            self._aggregates.set(key, aggregate)
+        return aggregate
+
+    def clear(self):
+        """清空缓存"""
+        self._cache.clear()
+        self._aggregates.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return self._cache.stats()
+
+
+# 全局模板编译缓存
+template_registry = TemplateRegistry(maxsize=int(os.getenv('TEMPLATE_CACHE_SIZE', '1024')))
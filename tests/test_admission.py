@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 大模型调用准入控制
+测试 AdmissionController 的并发上限、有界等待队列、降载和名额移交（不需要启动服务器）
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_disabled_controller_admits_everything():
+    controller = AdmissionController(max_active=0)
+    tickets = [controller.admit() for _ in range(100)]
+    for ticket in tickets:
+        ticket.release()
+    assert controller.stats()['active'] == 0
+
+
+def test_full_queue_is_shed_immediately():
+    controller = AdmissionController(max_active=1, queue_size=0, max_wait=5)
+    ticket = controller.admit()
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit()
+    assert rejected.value.reason == 'queue_full'
+    assert rejected.value.retry_after >= 1.0
+    assert time.monotonic() - started < 1.0
+    ticket.release()
+    assert controller.stats()['shed'] == {'queue_full': 1, 'timeout': 0}
+
+
+def test_zero_max_wait_disables_queueing():
+    controller = AdmissionController(max_active=1, queue_size=10, max_wait=0)
+    with controller.admit():
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.admit()
+    assert rejected.value.reason == 'queue_full'
+
+
+def test_waiter_times_out_and_leaves_queue():
+    controller = AdmissionController(max_active=1, queue_size=10, max_wait=0.05)
+    with controller.admit():
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.admit()
+        assert rejected.value.reason == 'timeout'
+        assert controller.queue_depth() == 0
+    assert controller.active() == 0
+
+
+def test_release_hands_slot_to_waiters_in_order():
+    controller = AdmissionController(max_active=1, queue_size=10, max_wait=5)
+    first = controller.admit()
+    order = []
+
+    def call(name):
+        with controller.admit():
+            order.append(name)
+
+    threads = []
+    for name in ('a', 'b'):
+        thread = threading.Thread(target=call, args=(name,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: controller.queue_depth() == len(threads))
+
+    assert controller.active() == 1
+    first.release()
+    first.release()  # 重复释放只生效一次
+    for thread in threads:
+        thread.join(2)
+    assert order == ['a', 'b']
+    assert controller.active() == 0
+    assert controller.stats()['queued'] == 2
+
+
+def test_active_calls_never_exceed_limit():
+    controller = AdmissionController(max_active=3, queue_size=100, max_wait=5)
+    lock = threading.Lock()
+    active = {'now': 0, 'peak': 0}
+
+    def call():
+        with controller.admit():
+            with lock:
+                active['now'] += 1
+                active['peak'] = max(active['peak'], active['now'])
+            time.sleep(0.01)
+            with lock:
+                active['now'] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert active['peak'] == 3
+    assert controller.stats()['admitted'] == 20
+
+
+def test_async_waiter_is_admitted_on_release():
+    async def scenario():
+        controller = AdmissionController(max_active=1, queue_size=10, max_wait=5)
+        first = await controller.admit_async()
+        waiting = asyncio.ensure_future(controller.admit_async())
+        await asyncio.sleep(0.01)
+        assert controller.queue_depth() == 1
+        first.release()
+        ticket = await asyncio.wait_for(waiting, 1)
+        assert controller.active() == 1
+        ticket.release()
+        assert controller.active() == 0
+
+    asyncio.run(scenario())
+
+
+def test_async_waiter_times_out():
+    async def scenario():
+        controller = AdmissionController(max_active=1, queue_size=10, max_wait=0.05)
+        ticket = await controller.admit_async()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit_async()
+        assert rejected.value.reason == 'timeout'
+        ticket.release()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_async_waiter_leaves_queue():
+    async def scenario():
+        controller = AdmissionController(max_active=1, queue_size=10, max_wait=5)
+        ticket = await controller.admit_async()
+        waiting = asyncio.ensure_future(controller.admit_async())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert controller.queue_depth() == 0
+        ticket.release()
+        assert controller.active() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 大模型配置热切换
+测试缓存代数不变时不查询数据库、代数变化后重新载入，以及异步生成只在需要访问数据库时进入线程池（不需要启动服务器）
+"""
+
+import os
+import sys
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_generator as generator_module
+from ai_generator import AIResponseGenerator
+
+
+class FakeGeneration:
+    """可手动推进的跨进程缓存代数"""
+
+    def __init__(self):
+        self.value = 0
+
+    def current(self):
+        return self.value
+
+    def bump(self):
+        self.value += 1
+
+
+class FakeDatabase:
+    """记录查询次数的大模型配置来源"""
+
+    config = None
+    queries = 0
+
+    def get_llm_config(self):
+        FakeDatabase.queries += 1
+        return FakeDatabase.config
+
+
+class FakePrompts:
+    def stale(self):
+        return False
+
+    def get(self, name):
+        return None
+
+
+def llm_config(model='model-a', updated_at=datetime(2026, 1, 1)):
+    return SimpleNamespace(id=1, api_key='sk-test', api_base_url='http://127.0.0.1:1/v1', model_name=model,
+                           enable_thinking=False, enable_stream=False, request_timeout=None,
+                           max_concurrency=None, updated_at=updated_at)
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    generation = FakeGeneration()
+    monkeypatch.setattr(generator_module, 'cache_generation', generation)
+    monkeypatch.setattr(generator_module, 'DatabaseManager', FakeDatabase)
+    monkeypatch.setattr(generator_module, 'prompt_registry', FakePrompts())
+    monkeypatch.setattr(FakeDatabase, 'queries', 0)
+    monkeypatch.setattr(FakeDatabase, 'config', llm_config())
+    return generation
+
+
+def test_unchanged_generation_skips_database(generation):
+    generator = AIResponseGenerator()
+    for _ in range(10):
+        generator._check_and_reload_config()
+    assert FakeDatabase.queries == 1
+    assert generator.model == 'model-a'
+
+
+def test_generation_change_reloads_updated_config(generation):
+    generator = AIResponseGenerator()
+    # 代数变化但配置未修改：查询一次后不再查询
+    generation.bump()
+    generator._check_and_reload_config()
+    generator._check_and_reload_config()
+    assert FakeDatabase.queries == 2
+    assert generator.model == 'model-a'
+
+    FakeDatabase.config = llm_config('model-b', datetime(2026, 1, 2))
+    generation.bump()
+    generator._check_and_reload_config()
+    assert generator.model == 'model-b'
+    generator._check_and_reload_config()
+    assert FakeDatabase.queries == 4
+
+
+def test_reload_config_notifies_other_processes(generation):
+    generator = AIResponseGenerator()
+    generator.reload_config()
+    assert generation.value == 1
+    generator._check_and_reload_config()
+    assert FakeDatabase.queries == 2
+
+
+def test_async_generation_uses_thread_only_when_stale(generation, monkeypatch):
+    FakeDatabase.config = None
+    monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+    threaded = []
+    real_to_thread = asyncio.to_thread
+
+    async def counting_to_thread(func, *args):
+        threaded.append(func.__name__)
+        return await real_to_thread(func, *args)
+
+    monkeypatch.setattr(generator_module.asyncio, 'to_thread', counting_to_thread)
+    generator = AIResponseGenerator()
+    app_info = {'category': 'IM', 'name': 'WeChat', 'display_name': 'WeChat'}
+
+    async def generate():
+        return [event async for event in generator.aiter_response(app_info, 'send', {})]
+
+    events = asyncio.run(generate())
+    assert events[-1][0] == 'result' and events[-1][1]['success'] is True
+    assert threaded == []
+
+    generation.bump()
+    asyncio.run(generate())
+    asyncio.run(generate())
+    assert threaded == ['_prepare_generation']
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 动作参数校验器
+测试编译后的 ArgumentValidator：必填参数、类型转换、默认值和枚举检查（不需要启动服务器）
+"""
+
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from template_cache import CompiledAction
+
+
+def compile_action(*parameters):
+    return CompiledAction({'name': 'block_ip', 'parameters': list(parameters)})
+
+
+def validate(action, arguments):
+    return action.validator.validate(arguments)
+
+
+def test_missing_required_parameter():
+    action = compile_action({'key': 'ip', 'type': 'String', 'required': True})
+    _, errors = validate(action, {})
+    assert errors == ["Missing required parameter: ip"]
+
+
+def test_explicit_null_counts_as_missing():
+    action = compile_action({'key': 'ip', 'type': 'String', 'required': True})
+    _, errors = validate(action, {'ip': None})
+    assert errors == ["Missing required parameter: ip"]
+
+
+def test_arguments_must_be_object():
+    action = compile_action({'key': 'ip', 'type': 'String'})
+    assert validate(action, ['1.2.3.4']) == ({}, ["Arguments must be an object"])
+
+
+def test_unambiguous_inputs_are_coerced():
+    action = compile_action(
+        {'key': 'port', 'type': 'Integer'},
+        {'key': 'ratio', 'type': 'Number'},
+        {'key': 'permanent', 'type': 'Boolean'},
+        {'key': 'name', 'type': 'String'},
+    )
+    arguments, errors = validate(action, {'port': ' 8080 ', 'ratio': 0.5, 'permanent': 'TRUE', 'name': 42})
+    assert errors == []
+    assert arguments == {'port': 8080, 'ratio': 0.5, 'permanent': True, 'name': '42'}
+
+
+def test_number_strings_are_validated_but_kept():
+    # Number 参数在 tools/list 中声明为 string，数值字符串原样保留
+    action = compile_action({'key': 'ratio', 'type': 'Number'})
+    for value in ('007', '0.5', '-1e3', ' 2 '):
+        assert validate(action, {'ratio': value}) == ({'ratio': value}, [])
+
+
+def test_non_finite_numbers_are_rejected():
+    action = compile_action({'key': 'ratio', 'type': 'Float'})
+    for value in ('nan', 'inf', '-Infinity', '1e309', '1_000', '0x10', float('nan'), float('inf'), True):
+        assert validate(action, {'ratio': value})[1] == ["Invalid parameter ratio: expected number"]
+
+
+def test_mistyped_arguments_are_rejected():
+    action = compile_action(
+        {'key': 'port', 'type': 'Integer'},
+        {'key': 'permanent', 'type': 'Boolean'},
+        {'key': 'ips', 'type': 'Array'},
+    )
+    _, errors = validate(action, {'port': 'eighty', 'permanent': 'yes', 'ips': '1.2.3.4'})
+    assert errors == [
+        "Invalid parameter port: expected integer",
+        "Invalid parameter permanent: expected boolean",
+        "Invalid parameter ips: expected array",
+    ]
+
+
+def test_boolean_is_not_an_integer():
+    action = compile_action({'key': 'port', 'type': 'Integer'})
+    _, errors = validate(action, {'port': True})
+    assert errors == ["Invalid parameter port: expected integer"]
+
+
+def test_defaults_fill_missing_optional_parameters():
+    action = compile_action(
+        {'key': 'duration', 'type': 'Integer', 'default': '3600'},
+        {'key': 'reason', 'type': 'String'},
+    )
+    arguments, errors = validate(action, {})
+    assert errors == []
+    assert arguments == {'duration': 3600}
+
+
+def test_default_is_copied_per_call():
+    action = compile_action({'key': 'tags', 'type': 'Array', 'default': ['a']})
+    first, _ = validate(action, {})
+    first['tags'].append('b')
+    second, _ = validate(action, {})
+    assert second == {'tags': ['a']}
+
+
+def test_invalid_default_is_ignored():
+    action = compile_action({'key': 'level', 'type': 'String', 'default': 'extreme', 'options': ['low', 'high']})
+    arguments, errors = validate(action, {})
+    assert errors == []
+    assert 'level' not in arguments
+
+
+def test_enum_options():
+    action = compile_action({'key': 'level', 'type': 'String', 'options': ['low', 'high']})
+    assert validate(action, {'level': 'high'}) == ({'level': 'high'}, [])
+    _, errors = validate(action, {'level': 'medium'})
+    assert errors == ["Invalid parameter level: must be one of ['low', 'high']"]
+
+
+def test_enum_options_compare_as_strings():
+    # Integer 参数的枚举写成字符串时仍按取值匹配
+    action = compile_action({'key': 'port', 'type': 'Integer', 'options': ['80', '443']})
+    assert validate(action, {'port': 443}) == ({'port': 443}, [])
+    assert validate(action, {'port': '80'}) == ({'port': 80}, [])
+
+
+def test_array_enum_checks_each_item():
+    action = compile_action({'key': 'levels', 'type': 'Array', 'options': ['low', 'high']})
+    assert validate(action, {'levels': ['low', 'high']})[1] == []
+    assert validate(action, {'levels': ['low', 'medium']})[1] != []
+
+
+def test_undeclared_arguments_are_kept():
+    action = compile_action({'key': 'ip', 'type': 'String'})
+    arguments, errors = validate(action, {'ip': '1.2.3.4', 'extra': {'x': 1}})
+    assert errors == []
+    assert arguments == {'ip': '1.2.3.4', 'extra': {'x': 1}}
+
+
+def test_input_is_not_modified():
+    action = compile_action({'key': 'port', 'type': 'Integer', 'default': 80}, {'key': 'n', 'type': 'Integer'})
+    original = {'n': '5'}
+    validate(action, original)
+    assert original == {'n': '5'}
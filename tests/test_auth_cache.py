@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 授权缓存失效
+模拟管理后台与MCP服务器两个进程：管理后台删除、禁用Token或修改Token的应用权限后，
+MCP服务器通过缓存代数文件感知变化，下一次请求即被拒绝（不需要启动服务器）
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth_cache import AuthCache
+from cache_utils import CacheGeneration
+
+
+class FakeDatabase:
+    """内存中的 Token / 应用 / 权限表，记录查询次数"""
+
+    def __init__(self):
+        self.apps = {1: SimpleNamespace(id=1, category='IM', name='WeChat'),
+                     2: SimpleNamespace(id=2, category='IM', name='Slack')}
+        self.tokens = {'tok': {'id': 7, 'enabled': True, 'app_ids': {1}}}
+        self.queries = 0
+        self.token_usage = SimpleNamespace(record=lambda token_id: None)
+
+    def get_token_auth(self, token_str):
+        self.queries += 1
+        token = self.tokens.get(token_str)
+        if not token or not token['enabled']:
+            return None
+        return {'id': token['id'], 'app_ids': frozenset(token['app_ids'])}
+
+    def get_application_by_path(self, category, name):
+        self.queries += 1
+        return next((app for app in self.apps.values() if (app.category, app.name) == (category, name)), None)
+
+    def get_token_applications(self, token_str):
+        self.queries += 1
+        token = self.tokens.get(token_str)
+        if not token or not token['enabled']:
+            return []
+        return [self.apps[app_id] for app_id in sorted(token['app_ids'])]
+
+
+@pytest.fixture
+def processes(tmp_path):
+    """共用一个数据库和缓存代数文件的管理后台缓存与MCP服务器缓存（各自独立的 CacheGeneration）"""
+    path = str(tmp_path / '.cache_generation')
+    db = FakeDatabase()
+    admin = AuthCache(db=db, ttl=3600, maxsize=64, generation=CacheGeneration(path, check_interval=0))
+    mcp = AuthCache(db=db, ttl=3600, maxsize=64, generation=CacheGeneration(path, check_interval=0))
+    return db, admin, mcp
+
+
+def test_hot_token_is_served_from_cache(processes):
+    db, _, mcp = processes
+    assert mcp.is_authorized('tok', 1)
+    queries = db.queries
+    for _ in range(5):
+        assert mcp.is_authorized('tok', 1)
+    assert db.queries == queries
+
+
+def test_deleted_token_is_rejected_on_next_request(processes):
+    db, admin, mcp = processes
+    assert mcp.is_authorized('tok', 1)
+
+    del db.tokens['tok']
+    # 未失效前命中缓存（说明下面的拒绝来自失效钩子，而不是缓存未生效）
+    assert mcp.is_authorized('tok', 1)
+    admin.invalidate_token('tok')
+    assert not mcp.is_authorized('tok', 1)
+    assert mcp.get_token('tok') is None
+
+
+def test_disabled_token_is_rejected_on_next_request(processes):
+    db, admin, mcp = processes
+    assert mcp.is_authorized('tok', 1)
+    assert [app.id for app in mcp.get_token_applications('tok')] == [1]
+
+    db.tokens['tok']['enabled'] = False
+    admin.invalidate_token('tok')
+    assert not mcp.is_authorized('tok', 1)
+    assert mcp.get_token_applications('tok') == ()
+
+
+def test_changed_token_apps_take_effect_on_next_request(processes):
+    db, admin, mcp = processes
+    assert mcp.is_authorized('tok', 1) and not mcp.is_authorized('tok', 2)
+    assert [app.id for app in mcp.get_token_applications('tok')] == [1]
+
+    # update_token_apps 修改权限后失效全部Token
+    db.tokens['tok']['app_ids'] = {2}
+    admin.invalidate_token()
+    assert not mcp.is_authorized('tok', 1)
+    assert mcp.is_authorized('tok', 2)
+    assert [app.id for app in mcp.get_token_applications('tok')] == [2]
+
+
+def test_negative_cache_is_cleared_when_token_is_created(processes):
+    db, admin, mcp = processes
+    assert mcp.get_token('new') is None
+    queries = db.queries
+    assert mcp.get_token('new') is None
+    assert db.queries == queries
+
+    db.tokens['new'] = {'id': 8, 'enabled': True, 'app_ids': {1}}
+    admin.invalidate_token('new')
+    assert mcp.is_authorized('new', 1)
+
+
+def test_disabled_app_revokes_access(processes):
+    db, admin, mcp = processes
+    assert mcp.get_application('IM', 'WeChat') is db.apps[1]
+    assert mcp.is_authorized('tok', 1)
+
+    # 应用被禁用：数据库中该应用不再出现在Token的可访问集合中
+    db.tokens['tok']['app_ids'] = set()
+    admin.invalidate_app('IM', 'WeChat')
+    assert not mcp.is_authorized('tok', 1)
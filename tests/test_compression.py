@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+单元测试 - HTTP响应压缩
+测试 Accept-Encoding 协商和是否压缩的判断（不需要启动服务器）
+"""
+
+import os
+import sys
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression
+from compression import compressed_headers, negotiate_encoding, should_compress
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, 'AVAILABLE_ENCODINGS', ('br', 'gzip'))
+
+
+@pytest.fixture
+def gzip_only(monkeypatch):
+    monkeypatch.setattr(compression, 'AVAILABLE_ENCODINGS', ('gzip',))
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('br', 'br'),
+    ('gzip, deflate, br', 'br'),          # q 值相同时优先 br
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+    ('*;q=0.5, gzip;q=0.8', 'gzip'),
+    ('*, br;q=0', 'gzip'),
+    ('gzip;q=0, br;q=0', None),
+    ('br;q=abc, gzip;q=0.1', 'gzip'),     # 无法解析的 q 值视为 0
+    (' , gzip ', 'gzip'),
+])
+def test_negotiate_encoding(with_brotli, header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_brotli_not_negotiated_when_unavailable(gzip_only):
+    assert negotiate_encoding('br') is None
+    assert negotiate_encoding('br, gzip;q=0.1') == 'gzip'
+    assert negotiate_encoding('*') == 'gzip'
+
+
+@pytest.mark.parametrize('status, headers, method, expected', [
+    (200, [('Content-Type', 'application/json'), ('Content-Length', '4096')], 'GET', True),
+    (200, [('Content-Type', 'application/json'), ('Content-Length', '10')], 'GET', False),
+    (200, [('Content-Type', 'text/event-stream')], 'POST', True),
+    (200, [('Content-Type', 'application/vnd.api+json')], 'GET', True),
+    (200, [('Content-Type', 'image/png')], 'GET', False),
+    (200, [('Content-Type', 'text/html'), ('Content-Encoding', 'gzip')], 'GET', False),
+    (200, [('Content-Type', 'text/html')], 'HEAD', False),
+    (204, [('Content-Type', 'text/html')], 'GET', False),
+    (304, [('Content-Type', 'text/html')], 'GET', False),
+])
+def test_should_compress(status, headers, method, expected):
+    assert should_compress(status, headers, method) is expected
+
+
+def test_compressed_headers():
+    headers = compressed_headers([
+        ('Content-Type', 'application/json'),
+        ('Content-Length', '4096'),
+        ('ETag', '"abc"'),
+        ('Vary', 'Origin'),
+    ], 'gzip')
+    assert headers == [
+        ('Content-Type', 'application/json'),
+        ('ETag', 'W/"abc"'),
+        ('Content-Encoding', 'gzip'),
+        ('Vary', 'Origin, Accept-Encoding'),
+    ]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 大模型客户端连接池
+测试连接池大小与准入控制的关系、连接池等待超时和 HTTP/2 不可用时的退回（不需要启动服务器）
+"""
+
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_pool as pool_module
+from llm_pool import LLMClientPool, POOL_TIMEOUT, _timeout, pool_size
+
+
+def test_http1_pool_covers_admitted_calls():
+    assert pool_size(20, False, 64) == 64
+    assert pool_size(100, False, 64) == 100
+    # 关闭准入控制或使用 HTTP/2 多路复用时保持配置值
+    assert pool_size(20, False, 0) == 20
+    assert pool_size(20, True, 64) == 20
+
+
+def test_pool_wait_has_its_own_timeout():
+    timeout = _timeout(120)
+    assert timeout.read == 120 and timeout.connect == 10
+    assert timeout.pool == POOL_TIMEOUT
+    assert _timeout(3).connect == 3
+
+
+def test_http2_falls_back_with_warning(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(pool_module, 'HTTP2_AVAILABLE', False)
+    monkeypatch.setattr(pool_module.mcp_logger, 'warning', warnings.append)
+    assert LLMClientPool(http2=True).http2 is False
+    assert len(warnings) == 1 and 'httpx[http2]' in warnings[0]
+    LLMClientPool(http2=False)
+    assert len(warnings) == 1
+
+
+def test_http2_enabled_when_available(monkeypatch):
+    monkeypatch.setattr(pool_module, 'HTTP2_AVAILABLE', True)
+    assert LLMClientPool(http2=True).stats()['http2'] is True
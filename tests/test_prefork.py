@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 预派生多进程服务
+测试工作进程启动失败时不会继续执行父进程的代码，以及重新派生的退避和放弃（不需要启动服务器）
+"""
+
+import os
+import sys
+import signal
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prefork
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="requires os.fork")
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_failing_workers_exit_and_are_given_up(monkeypatch, restore_signals):
+    parent = os.getpid()
+    forks = []
+    real_fork = os.fork
+
+    def counting_fork():
+        pid = real_fork()
+        if pid:
+            forks.append(pid)
+        return pid
+
+    def broken_server(*args, **kwargs):
+        raise OSError("bad fd")
+
+    warnings, errors = [], []
+    monkeypatch.setattr(os, 'fork', counting_fork)
+    monkeypatch.setattr(prefork, 'make_server', broken_server)
+    monkeypatch.setattr(prefork, 'RESPAWN_BASE_DELAY', 0.1)
+    monkeypatch.setattr(prefork, 'RESPAWN_MAX_DELAY', 0.2)
+    monkeypatch.setattr(prefork, 'RESPAWN_MAX_FAILURES', 3)
+    monkeypatch.setattr(prefork.mcp_logger, 'warning', warnings.append)
+    monkeypatch.setattr(prefork.mcp_logger, 'error', lambda message, exc_info=False: errors.append(message))
+
+    prefork.serve_prefork(lambda environ, start_response: [], '127.0.0.1', 0, 2)
+
+    # 子进程以 os._exit 退出，只有测试进程从 serve_prefork 返回
+    assert os.getpid() == parent
+    # 每个工作进程首次派生加 3 次退避后的重新派生，之后放弃
+    assert len(forks) == 2 * (1 + 3)
+    assert sorted(message.rsplit(' ', 1)[-1] for message in warnings) == ['0.1s'] * 2 + ['0.2s'] * 4
+    assert sum('not respawning' in message for message in errors) == 2
+    assert errors[-1] == "All pre-fork workers have stopped"
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 提示词模板注册表
+测试保存前的占位符校验，以及注册表的载入、复用和失效（不需要启动服务器）
+"""
+
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_registry import PromptRegistry, parse_placeholders, validate_prompt_template
+
+
+def test_placeholders_in_order_of_first_use():
+    assert parse_placeholders("{b} and {a} then {b!r:>10}") == ('b', 'a')
+
+
+def test_escaped_braces_are_literal():
+    assert parse_placeholders('返回 {{"success": true}} 给 {action}') == ('action',)
+
+
+@pytest.mark.parametrize('template', [
+    'unclosed {action',
+    'stray } brace',
+    'positional {}',
+    'indexed {0}',
+    'attribute {action.name}',
+    'item {parameters[0]}',
+    'conversion {action!x}',
+    'nested {action:{width}}',
+])
+def test_malformed_templates_are_rejected(template):
+    with pytest.raises(ValueError):
+        parse_placeholders(template)
+
+
+def test_builtin_prompt_only_uses_rendered_variables():
+    assert validate_prompt_template('response_simulation', '{app_name}: {action} {parameters}') == (
+        'app_name', 'action', 'parameters'
+    )
+    with pytest.raises(ValueError, match=r'\{app_version\}'):
+        validate_prompt_template('response_simulation', '{app_name} {app_version}')
+    # 内置提示词的可用变量由渲染代码决定，不受声明的变量列表影响
+    with pytest.raises(ValueError):
+        validate_prompt_template('action_generation', '{extra}', [{'name': 'extra'}])
+
+
+def test_custom_prompt_uses_declared_variables():
+    variables = [{'name': 'target', 'description': '扫描目标'}]
+    assert validate_prompt_template('custom', 'scan {target}', variables) == ('target',)
+    with pytest.raises(ValueError, match=r'\{depth\}'):
+        validate_prompt_template('custom', 'scan {target} to {depth}', variables)
+    with pytest.raises(ValueError):
+        validate_prompt_template('custom', 'scan {target}')
+
+
+def test_invalid_format_spec_is_rejected():
+    with pytest.raises(ValueError):
+        validate_prompt_template('response_simulation', '{action:d}')
+    assert validate_prompt_template('response_simulation', '{action:>20}') == ('action',)
+
+
+class FakeGeneration:
+    """可手动推进的跨进程缓存代数"""
+
+    def __init__(self):
+        self.value = 0
+
+    def current(self):
+        return self.value
+
+    def bump(self):
+        self.value += 1
+
+
+def row(name, template, row_id=1, updated_at=datetime(2026, 1, 1), enabled=True):
+    return SimpleNamespace(id=row_id, name=name, template=template, updated_at=updated_at, enabled=enabled)
+
+
+def test_registry_loads_once_and_renders_from_memory():
+    rows = [row('response_simulation', '{app_name} 调用 {action}'), row('disabled', 'x', 2, enabled=False)]
+    calls = []
+    registry = PromptRegistry(loader=lambda: calls.append(1) or rows, generation=FakeGeneration())
+
+    prompt = registry.get('response_simulation')
+    assert prompt.render({'app_name': 'WeChat', 'action': 'send'}) == 'WeChat 调用 send'
+    assert prompt.uses('action') and not prompt.uses('parameters')
+    assert prompt.version == (1, datetime(2026, 1, 1))
+    assert registry.get('response_simulation') is prompt
+    assert registry.get('disabled') is None
+    assert registry.get('missing') is None
+    assert len(calls) == 1
+    assert registry.stats()['hits'] == 3 and registry.stats()['misses'] == 1
+
+
+def test_generation_change_reloads_and_reuses_unchanged_prompts():
+    generation = FakeGeneration()
+    rows = [row('a', '{x}'), row('b', '{y}', 2)]
+    registry = PromptRegistry(loader=lambda: list(rows), generation=generation)
+    a, b = registry.get('a'), registry.get('b')
+
+    rows[1] = row('b', 'new {y}', 2, updated_at=datetime(2026, 1, 2))
+    generation.bump()
+    assert registry.get('a') is a
+    assert registry.get('b') is not b
+    assert registry.get('b').template == 'new {y}'
+    assert registry.stats()['loads'] == 2
+
+
+def test_invalidate_bumps_generation():
+    generation = FakeGeneration()
+    calls = []
+    registry = PromptRegistry(loader=lambda: calls.append(1) or [row('a', '{x}')], generation=generation)
+    registry.get('a')
+    registry.invalidate()
+    assert generation.value == 1
+    registry.get('a')
+    assert len(calls) == 2
+
+
+def test_unparseable_stored_template_is_skipped():
+    registry = PromptRegistry(loader=lambda: [row('legacy', 'broken {'), row('ok', '{x}', 2)])
+    assert registry.get('legacy') is None
+    assert registry.get('ok') is not None
+    assert registry.stats()['invalid'] == 1
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+单元测试 - Token / 应用配额
+测试令牌桶、QuotaLimiter 的速率和并发限制以及 QuotaLease 的释放（不需要启动服务器）
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limiter
+from rate_limiter import QuotaLimiter, TokenBucket
+
+
+class FakeClock:
+    """可手动推进的 time.monotonic（替换 rate_limiter 模块中的 time）"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def token(token_id=1, **quota):
+    return {'id': token_id, **quota}
+
+
+class FakeApp:
+    """应用对象（配额按 id 统计，作为 app_costs 的键需要可哈希）"""
+
+    def __init__(self, app_id, **quota):
+        self.id = app_id
+        self.__dict__.update(quota)
+
+
+def app(app_id=1, **quota):
+    return FakeApp(app_id, **quota)
+
+
+def test_bucket_starts_full_and_refills():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.wait_time(2, now=0.0) == 0.0
+    bucket.consume(2)
+    assert bucket.wait_time(1, now=0.0) == 1.0
+    assert bucket.wait_time(1, now=0.5) == 0.5
+    assert bucket.wait_time(1, now=1.0) == 0.0
+
+
+def test_bucket_refill_is_capped_at_burst():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    bucket.wait_time(1, now=0.0)
+    assert bucket.wait_time(1, now=3600.0) == 0.0
+    assert bucket.tokens == 2.0
+
+
+def test_bucket_allows_cost_above_burst_as_debt():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.wait_time(5, now=0.0) == 0.0
+    bucket.consume(5)
+    # 欠账 3 个令牌，需要 5 秒补满到 2 个
+    assert bucket.wait_time(1, now=0.0) == 4.0
+
+
+def test_bucket_reconfigure_keeps_tokens_within_new_burst():
+    bucket = TokenBucket(rate_per_minute=60, burst=10)
+    bucket.configure(rate_per_minute=60, burst=3)
+    assert bucket.tokens == 3.0
+
+
+def test_token_rate_limit(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=clock))
+    limiter = QuotaLimiter()
+    info = token(rate_limit_per_minute=60, rate_limit_burst=2)
+
+    for _ in range(2):
+        lease, exceeded = limiter.acquire(info)
+        assert exceeded is None
+        lease.release()
+
+    lease, exceeded = limiter.acquire(info)
+    assert lease is None
+    assert (exceeded.scope, exceeded.reason, exceeded.limit) == ('token', 'rate', 60)
+    assert exceeded.retry_after == 1.0
+    assert exceeded.retry_after_header() == '1'
+
+    clock.now += 1.0
+    lease, exceeded = limiter.acquire(info)
+    assert exceeded is None
+    assert limiter.stats()['rejected'] == {'token_rate': 1}
+
+
+def test_default_rate_applies_when_token_has_no_quota(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=FakeClock()))
+    limiter = QuotaLimiter(default_rate=1)
+    assert limiter.acquire(token())[1] is None
+    assert limiter.acquire(token())[1].reason == 'rate'
+    # 显式设置为 0 表示不限制
+    assert limiter.acquire(token(2, rate_limit_per_minute=0))[1] is None
+
+
+def test_token_concurrency_limit_and_lease_release():
+    limiter = QuotaLimiter()
+    info = token(max_concurrency=2)
+
+    first, _ = limiter.acquire(info)
+    second, _ = limiter.acquire(info)
+    lease, exceeded = limiter.acquire(info)
+    assert lease is None
+    assert (exceeded.scope, exceeded.reason, exceeded.limit) == ('token', 'concurrency', 2)
+    assert limiter.in_flight() == {'token': 2, 'app': 0}
+
+    first.release()
+    first.release()  # 重复释放只生效一次
+    assert limiter.in_flight() == {'token': 1, 'app': 0}
+    with limiter.acquire(info)[0]:
+        assert limiter.in_flight() == {'token': 2, 'app': 0}
+    second.release()
+    assert limiter.in_flight() == {'token': 0, 'app': 0}
+
+
+def test_batch_slots_are_capped_at_concurrency():
+    limiter = QuotaLimiter()
+    lease, exceeded = limiter.acquire(token(max_concurrency=2), slots=5)
+    assert exceeded is None
+    assert limiter.in_flight()['token'] == 2
+    lease.release()
+
+
+def test_app_quota_is_shared_by_all_tokens():
+    limiter = QuotaLimiter()
+    target = app(max_concurrency=1)
+    lease, exceeded = limiter.acquire(token(1), target)
+    assert exceeded is None
+    _, exceeded = limiter.acquire(token(2), target)
+    assert (exceeded.scope, exceeded.reason) == ('app', 'concurrency')
+    lease.release()
+    assert limiter.acquire(token(2), target)[1] is None
+
+
+def test_rejection_consumes_nothing(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=FakeClock()))
+    limiter = QuotaLimiter()
+    info = token(rate_limit_per_minute=60, rate_limit_burst=1)
+    target = app(max_concurrency=1)
+
+    held, _ = limiter.acquire(token(2), target)
+    # 应用并发已满：Token 的令牌不应被消耗
+    assert limiter.acquire(info, target)[1].scope == 'app'
+    held.release()
+    assert limiter.acquire(info, target)[1] is None
+
+
+def test_aggregate_app_costs_checked_per_app(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=FakeClock()))
+    limiter = QuotaLimiter()
+    cheap = app(1, rate_limit_per_minute=60, rate_limit_burst=5)
+    scarce = app(2, rate_limit_per_minute=60, rate_limit_burst=1)
+
+    _, exceeded = limiter.acquire(token(), cost=3, app_costs={cheap: 1, scarce: 2})
+    assert exceeded is None  # 单次消耗超过容量时桶满即放行
+    _, exceeded = limiter.acquire(token(), cost=1, app_costs={scarce: 1})
+    assert (exceeded.scope, exceeded.reason) == ('app', 'rate')
+    assert limiter.acquire(token(), cost=1, app_costs={cheap: 1})[1] is None
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 大模型响应缓存
+测试缓存键的组成、按应用的缓存秒数（TTL 为 0 不缓存、总是实时生成）、过期和按应用统计（不需要启动服务器）
+"""
+
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_utils
+import ai_generator as generator_module
+from ai_generator import AIResponseGenerator
+from response_cache import ResponseCache, canonical_parameters
+
+APP = {'id': 1, 'version': 'v1', 'category': 'IM', 'name': 'WeChat'}
+
+
+class FakeClock:
+    """可手动推进的 time.monotonic（替换 cache_utils 模块中的 time）"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_canonical_parameters_ignore_key_order():
+    assert canonical_parameters({'b': 1, 'a': [1, 2]}) == canonical_parameters({'a': [1, 2], 'b': 1})
+    assert canonical_parameters({'text': '你好'}) == '{"text":"你好"}'
+
+
+def test_key_changes_with_every_component():
+    key = ResponseCache.make_key(APP, 'send', {'to': 'a'}, (1, 'p1'), 'model-a')
+    assert key == ResponseCache.make_key(APP, 'send', {'to': 'a'}, (1, 'p1'), 'model-a')
+    assert len({
+        key,
+        ResponseCache.make_key(dict(APP, version='v2'), 'send', {'to': 'a'}, (1, 'p1'), 'model-a'),
+        ResponseCache.make_key(dict(APP, id=2), 'send', {'to': 'a'}, (1, 'p1'), 'model-a'),
+        ResponseCache.make_key(APP, 'recall', {'to': 'a'}, (1, 'p1'), 'model-a'),
+        ResponseCache.make_key(APP, 'send', {'to': 'b'}, (1, 'p1'), 'model-a'),
+        ResponseCache.make_key(APP, 'send', {'to': 'a'}, (1, 'p2'), 'model-a'),
+        ResponseCache.make_key(APP, 'send', {'to': 'a'}, (1, 'p1'), 'model-b'),
+    }) == 7
+
+
+@pytest.mark.parametrize('app_settings, default_ttl, expected', [
+    ({'response_cache_ttl': 60}, 0, 60.0),
+    ({'response_cache_ttl': None}, 30, 30.0),
+    ({}, 0, None),                                   # 默认不缓存
+    ({'response_cache_ttl': 0}, 30, None),           # 应用设置为 0 时不缓存，不回退到默认值
+    ({'response_cache_ttl': 60, 'response_cache_always_fresh': True}, 30, None),
+])
+def test_ttl_for(app_settings, default_ttl, expected):
+    cache = ResponseCache(default_ttl=default_ttl)
+    assert cache.ttl_for(dict(APP, **app_settings)) == expected
+
+
+def test_zero_maxsize_disables_cache():
+    cache = ResponseCache(maxsize=0, default_ttl=60)
+    assert cache.ttl_for(dict(APP, response_cache_ttl=60)) is None
+    assert cache.stats()['enabled'] is False
+
+
+def test_cached_response_expires_after_app_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_utils, 'time', SimpleNamespace(monotonic=clock))
+    cache = ResponseCache()
+    key = ResponseCache.make_key(APP, 'send', {}, None, 'm')
+    assert cache.get(key, 'IM/WeChat') is None
+
+    cache.set(key, {'success': True}, ttl=60)
+    clock.now += 59
+    assert cache.get(key, 'IM/WeChat') == {'success': True}
+    clock.now += 1
+    assert cache.get(key, 'IM/WeChat') is None
+
+
+def test_per_app_stats():
+    cache = ResponseCache()
+    key = ResponseCache.make_key(APP, 'send', {}, None, 'm')
+    cache.get(key, 'IM/WeChat')
+    cache.set(key, {'success': True}, ttl=60)
+    cache.get(key, 'IM/WeChat')
+    cache.bypass('IM/Slack')
+    stats = cache.stats()
+    assert stats['apps'] == {
+        'IM/WeChat': {'hits': 1, 'misses': 1, 'bypassed': 0},
+        'IM/Slack': {'hits': 0, 'misses': 0, 'bypassed': 1},
+    }
+    assert stats['bypassed'] == 1
+
+
+def test_clear_drops_entries():
+    cache = ResponseCache()
+    key = ResponseCache.make_key(APP, 'send', {}, None, 'm')
+    cache.set(key, {'success': True}, ttl=60)
+    cache.clear()
+    assert cache.get(key, 'IM/WeChat') is None
+
+
+class FakeDatabase:
+    def get_llm_config(self):
+        return SimpleNamespace(id=1, api_key='sk-test', api_base_url='http://127.0.0.1:1/v1', model_name='m',
+                               enable_thinking=False, enable_stream=False, request_timeout=None,
+                               max_concurrency=None, updated_at=datetime(2026, 1, 1))
+
+
+class FakePrompts:
+    def stale(self):
+        return False
+
+    def get(self, name):
+        return None
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.setattr(generator_module, 'DatabaseManager', FakeDatabase)
+    monkeypatch.setattr(generator_module, 'prompt_registry', FakePrompts())
+    monkeypatch.setattr(generator_module, 'response_cache', ResponseCache())
+    return AIResponseGenerator()
+
+
+def test_generation_is_served_from_cache(generator):
+    app_info = dict(APP, response_cache_ttl=60)
+    prompt, _, cache_entry, _ = generator._prepare_generation(app_info, 'send', {'to': 'a'})
+    assert prompt is not None and cache_entry[1] == 60.0
+    generator_module.response_cache.set(cache_entry[0], {'success': True, 'cached': True}, cache_entry[1])
+
+    prompt, response, _, _ = generator._prepare_generation(app_info, 'send', {'to': 'a'})
+    assert prompt is None and response == {'success': True, 'cached': True}
+
+
+@pytest.mark.parametrize('app_settings', [
+    {'response_cache_ttl': 0},
+    {'response_cache_ttl': 60, 'response_cache_always_fresh': True},
+])
+def test_uncached_apps_always_call_llm(generator, app_settings):
+    app_info = dict(APP, **app_settings)
+    for _ in range(2):
+        prompt, response, cache_entry, _ = generator._prepare_generation(app_info, 'send', {'to': 'a'})
+        assert prompt is not None and response is None and cache_entry is None
+    assert generator_module.response_cache.stats()['apps']['IM/WeChat'] == {'hits': 0, 'misses': 0, 'bypassed': 2}
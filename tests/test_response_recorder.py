@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 大模型响应录制与回放
+测试回放键、录制文件的读写与回放索引，以及回放未命中时 fail / llm / default 三种处理方式（不需要启动服务器）
+"""
+
+import os
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_generator as generator_module
+from ai_generator import AIResponseGenerator
+from response_recorder import ResponseRecorder, replay_key
+
+APP_PATH = 'IM/WeChat'
+APP_INFO = {'id': 1, 'version': 'v1', 'category': 'IM', 'name': 'WeChat', 'display_name': 'WeChat'}
+
+
+def test_replay_key_ignores_parameter_order():
+    assert replay_key(APP_PATH, 'send', {'to': 'a', 'text': 'hi'}) == replay_key(APP_PATH, 'send', {'text': 'hi', 'to': 'a'})
+    assert replay_key(APP_PATH, 'send', {'to': 'a'}) != replay_key(APP_PATH, 'send', {'to': 'b'})
+    assert replay_key(APP_PATH, 'send', {}) != replay_key('IM/Slack', 'send', {})
+    assert replay_key(APP_PATH, 'send', {}) != replay_key(APP_PATH, 'recall', {})
+
+
+def test_invalid_mode_and_miss_policy_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseRecorder(str(tmp_path / 'r.jsonl'), mode='playback')
+    with pytest.raises(ValueError):
+        ResponseRecorder(str(tmp_path / 'r.jsonl'), mode='replay', miss_policy='error')
+
+
+def test_recorded_responses_are_replayed(tmp_path):
+    path = str(tmp_path / 'recordings' / 'r.jsonl')
+    recorder = ResponseRecorder(path, mode='record')
+    recorder.record(APP_PATH, 'send', {'to': 'a', 'text': 'hi'}, {'success': True, 'n': 1}, model='m')
+    recorder.record(APP_PATH, 'send', {'to': 'a', 'text': 'hi'}, {'success': True, 'n': 2}, model='m')
+    recorder.record('IM/Slack', 'send', {}, {'success': True, 'n': 3})
+    assert recorder.recorded == 3
+
+    replayer = ResponseRecorder(path, mode='replay')
+    # 同一调用有多条录制时使用最后一条，参数顺序不影响匹配
+    assert replayer.lookup(APP_PATH, 'send', {'text': 'hi', 'to': 'a'}) == {'success': True, 'n': 2}
+    assert replayer.lookup(APP_PATH, 'send', {'to': 'b', 'text': 'hi'}) is None
+    assert replayer.stats()['hits'] == 1 and replayer.stats()['misses'] == 1
+    assert replayer.stats()['replay_entries'] == 2
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / 'r.jsonl'
+    recorder = ResponseRecorder(str(path), mode='record')
+    recorder.record(APP_PATH, 'send', {}, {'success': True})
+    with open(path, 'ab') as f:
+        f.write(b'{"app": "IM/WeChat", "action": "re')
+
+    replayer = ResponseRecorder(str(path), mode='replay')
+    assert replayer.lookup(APP_PATH, 'send', {}) == {'success': True}
+    assert replayer.stats()['skipped_lines'] == 1
+
+
+def test_reload_picks_up_new_recordings(tmp_path):
+    path = str(tmp_path / 'r.jsonl')
+    replayer = ResponseRecorder(path, mode='replay')
+    assert replayer.lookup(APP_PATH, 'send', {}) is None
+    ResponseRecorder(path, mode='record').record(APP_PATH, 'send', {}, {'success': True})
+    assert replayer.lookup(APP_PATH, 'send', {}) is None
+    replayer.reload()
+    assert replayer.lookup(APP_PATH, 'send', {}) == {'success': True}
+
+
+def test_export_only_includes_one_app(tmp_path):
+    path = str(tmp_path / 'r.jsonl')
+    recorder = ResponseRecorder(path, mode='record')
+    recorder.record(APP_PATH, 'send', {}, {'success': True})
+    recorder.record('IM/Slack', 'send', {}, {'success': True})
+    exported = tmp_path / 'wechat.jsonl'
+    exported.write_bytes(recorder.export(APP_PATH))
+
+    replayer = ResponseRecorder(str(exported), mode='replay')
+    assert replayer.lookup(APP_PATH, 'send', {}) == {'success': True}
+    assert replayer.lookup('IM/Slack', 'send', {}) is None
+    assert set(recorder.summary()) == {APP_PATH, 'IM/Slack'}
+
+
+class FakeDatabase:
+    """记录查询次数的大模型配置来源"""
+
+    queries = 0
+
+    def get_llm_config(self):
+        FakeDatabase.queries += 1
+        return SimpleNamespace(id=1, api_key='sk-test', api_base_url='http://127.0.0.1:1/v1', model_name='m',
+                               enable_thinking=False, enable_stream=False, request_timeout=None,
+                               max_concurrency=None, updated_at=datetime(2026, 1, 1))
+
+
+class FakePrompts:
+    def stale(self):
+        return False
+
+    def get(self, name):
+        return None
+
+
+def replaying_generator(monkeypatch, tmp_path, miss_policy):
+    path = str(tmp_path / 'r.jsonl')
+    ResponseRecorder(path, mode='record').record(APP_PATH, 'send', {'to': 'a'}, {'success': True, 'recorded': True})
+    monkeypatch.setattr(generator_module, 'DatabaseManager', FakeDatabase)
+    monkeypatch.setattr(generator_module, 'prompt_registry', FakePrompts())
+    monkeypatch.setattr(generator_module, 'response_recorder', ResponseRecorder(path, 'replay', miss_policy))
+    monkeypatch.setattr(FakeDatabase, 'queries', 0)
+    generator = AIResponseGenerator()
+    FakeDatabase.queries = 0
+    return generator
+
+
+@pytest.mark.parametrize('miss_policy', ['fail', 'llm', 'default'])
+def test_replay_hit_skips_database_and_llm(monkeypatch, tmp_path, miss_policy):
+    generator = replaying_generator(monkeypatch, tmp_path, miss_policy)
+    prompt, response, _, _ = generator._prepare_generation(APP_INFO, 'send', {'to': 'a'})
+    assert prompt is None
+    assert response == {'success': True, 'recorded': True}
+    assert FakeDatabase.queries == 0
+
+
+def test_replay_miss_fail_returns_error(monkeypatch, tmp_path):
+    generator = replaying_generator(monkeypatch, tmp_path, 'fail')
+    prompt, response, _, _ = generator._prepare_generation(APP_INFO, 'send', {'to': 'b'})
+    assert prompt is None
+    assert response['success'] is False and response['code'] == 404
+    assert response['error'] == "No recorded response"
+
+
+def test_replay_miss_llm_falls_through_to_generation(monkeypatch, tmp_path):
+    generator = replaying_generator(monkeypatch, tmp_path, 'llm')
+    prompt, response, _, record_entry = generator._prepare_generation(APP_INFO, 'send', {'to': 'b'})
+    assert response is None
+    assert 'send' in prompt
+    # 回放模式下大模型生成的结果不写回录制文件
+    assert record_entry is None
+
+
+def test_replay_miss_default_returns_simulated_response(monkeypatch, tmp_path):
+    generator = replaying_generator(monkeypatch, tmp_path, 'default')
+    prompt, response, _, _ = generator._prepare_generation(APP_INFO, 'send', {'to': 'b'})
+    assert prompt is None
+    assert response['success'] is True
+    assert FakeDatabase.queries == 0
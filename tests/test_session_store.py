@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+单元测试 - MCP会话存储
+测试 SessionStore 的容量上限（LRU淘汰）和空闲过期（不需要启动服务器）
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import session_store as session_module
+from session_store import SessionStore
+
+
+class FakeClock:
+    """可手动推进的 time.monotonic（替换 session_store 模块中的 time）"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def use_clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(session_module, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_create_issues_unique_ids():
+    store = SessionStore()
+    first, second = store.create(), store.create()
+    assert first != second
+    assert first in store and second in store
+    assert store.touch(first)['initialized'] is True
+
+
+def test_create_keeps_client_supplied_id():
+    store = SessionStore()
+    assert store.create('client-session', {'name': 'agent'}) == 'client-session'
+    assert store.touch('client-session')['client_info'] == {'name': 'agent'}
+    # 重新初始化同一会话不计为新会话
+    store.create('client-session')
+    assert store.stats()['created'] == 1
+
+
+def test_least_recently_active_session_is_evicted():
+    store = SessionStore(maxsize=2, idle_ttl=None)
+    a, b = store.create('a'), store.create('b')
+    store.touch(a)
+    store.create('c')
+    assert a in store and 'c' in store
+    assert b not in store
+    assert store.stats()['evicted'] == 1
+
+
+def test_idle_session_expires(monkeypatch):
+    clock = use_clock(monkeypatch)
+    store = SessionStore(idle_ttl=60)
+    session_id = store.create()
+    clock.now += 59
+    assert store.touch(session_id) is not None
+    clock.now += 60
+    assert store.touch(session_id) is None
+    assert session_id not in store
+    assert store.stats()['expired'] == 1
+
+
+def test_touch_extends_idle_ttl(monkeypatch):
+    clock = use_clock(monkeypatch)
+    store = SessionStore(idle_ttl=60)
+    session_id = store.create()
+    for _ in range(5):
+        clock.now += 50
+        assert store.touch(session_id) is not None
+
+
+def test_expired_sessions_are_purged_on_create(monkeypatch):
+    clock = use_clock(monkeypatch)
+    store = SessionStore(idle_ttl=60)
+    for _ in range(3):
+        store.create()
+    clock.now += 61
+    store.create()
+    assert len(store) == 1
+    assert store.stats() == {'live': 1, 'maxsize': store.maxsize, 'created': 4, 'adopted': 0, 'adopted_live': 0, 'evicted': 0, 'expired': 3}
+
+
+def test_remove():
+    store = SessionStore()
+    session_id = store.create()
+    assert store.remove(session_id) is True
+    assert store.remove(session_id) is False
+    assert store.touch(session_id) is None
+
+
+def test_issued_ids_are_signed():
+    store = SessionStore(secret='k')
+    session_id = store.new_id()
+    assert store.verify_id(session_id)
+    assert SessionStore(secret='k').verify_id(session_id)
+    assert not SessionStore(secret='other').verify_id(session_id)
+    raw_id, _, signature = session_id.partition('.')
+    assert not store.verify_id(raw_id)
+    assert not store.verify_id(f"{raw_id}.{'0' * len(signature)}")
+    assert not store.verify_id('made-up-session')
+    assert not store.verify_id('')
+
+
+def test_resume_adopts_signed_ids_from_other_workers():
+    issuer = SessionStore(secret='shared')
+    store = SessionStore(secret='shared')
+    session_id = issuer.create()
+    assert store.resume(session_id) is None
+
+    # 多工作进程时通知流请求可能落到未处理 initialize 的工作进程
+    store.adopt_unknown = True
+    session = store.resume(session_id)
+    assert session is not None and session['client_info'] == {}
+    assert store.resume(session_id) is session
+    # 伪造或其他密钥签发的会话ID不被接纳
+    assert store.resume('made-up-session') is None
+    assert store.resume(SessionStore(secret='other').new_id()) is None
+    assert store.stats()['adopted'] == 1 and store.stats()['created'] == 0
+
+
+def test_adopted_sessions_cannot_evict_initialized_sessions():
+    store = SessionStore(maxsize=2, adopt_unknown=True, adopt_maxsize=2, secret='shared')
+    initialized = [store.create(), store.create()]
+    adopted = [store.new_id() for _ in range(5)]
+    for session_id in adopted:
+        assert store.resume(session_id) is not None
+    assert all(session_id in store for session_id in initialized)
+    assert store.stats()['live'] == 2 and store.stats()['adopted_live'] == 2
+    # 被挤出接纳表的会话在下次请求时重新接纳
+    assert store.resume(adopted[0]) is not None
+
+
+def test_initialize_moves_adopted_session_into_main_table():
+    store = SessionStore(adopt_unknown=True, secret='shared')
+    session_id = store.new_id()
+    store.resume(session_id)
+    store.create(session_id, {'name': 'agent'})
+    assert store.stats()['adopted_live'] == 0
+    assert store.resume(session_id)['client_info'] == {'name': 'agent'}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+单元测试 - 相同调用合并
+测试 SingleFlight 的生成者/等待者分配、结果共享、生成失败和等待超时（不需要启动服务器）
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+# 添加父目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight
+
+
+def test_first_caller_leads_and_others_follow():
+    flights = SingleFlight()
+    leader, is_leader = flights.join('k')
+    follower, is_follower_leader = flights.join('k')
+    other, other_is_leader = flights.join('other')
+    assert is_leader and other_is_leader
+    assert not is_follower_leader
+    assert follower is leader and other is not leader
+    assert flights.in_flight() == 2
+
+
+def test_followers_share_the_leader_result():
+    flights = SingleFlight()
+    flight, _ = flights.join('k')
+    results = []
+
+    def follow():
+        joined, is_leader = flights.join('k')
+        assert not is_leader
+        results.append(joined.wait(2))
+
+    threads = [threading.Thread(target=follow) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()['followers'] < 3:
+        time.sleep(0.005)
+
+    flights.finish('k', flight, {'success': True})
+    for thread in threads:
+        thread.join(2)
+    assert results == [{'success': True}] * 3
+    assert flights.in_flight() == 0
+
+
+def test_failed_generation_propagates_none():
+    flights = SingleFlight()
+    flight, _ = flights.join('k')
+    follower, _ = flights.join('k')
+    flights.finish('k', flight, None)
+    assert follower.wait(1) is None
+    assert follower.done
+
+
+def test_wait_times_out_without_result():
+    flights = SingleFlight()
+    flights.join('k')
+    follower, _ = flights.join('k')
+    started = time.monotonic()
+    assert follower.wait(0.05) is None
+    assert time.monotonic() - started < 1.0
+    assert not follower.done
+
+
+def test_finished_key_starts_a_new_flight():
+    flights = SingleFlight()
+    flight, _ = flights.join('k')
+    flights.finish('k', flight, {'n': 1})
+    again, is_leader = flights.join('k')
+    assert is_leader and again is not flight
+
+
+def test_stale_finish_does_not_remove_newer_flight():
+    flights = SingleFlight()
+    old, _ = flights.join('k')
+    flights.finish('k', old, None)
+    new, _ = flights.join('k')
+    flights.finish('k', old, None)
+    assert flights.join('k') == (new, False)
+
+
+def test_async_followers_are_woken():
+    async def scenario():
+        flights = SingleFlight()
+        flight, _ = flights.join('k')
+        follower, _ = flights.join('k')
+        waiting = asyncio.ensure_future(follower.wait_async(2))
+        await asyncio.sleep(0.01)
+        # 生成者可能在其他线程中结束
+        threading.Thread(target=flights.finish, args=('k', flight, {'success': True})).start()
+        assert await waiting == {'success': True}
+        # 已结束的生成立即返回结果
+        assert await follower.wait_async(2) == {'success': True}
+
+    asyncio.run(scenario())
+
+
+def test_async_wait_times_out():
+    async def scenario():
+        flights = SingleFlight()
+        flights.join('k')
+        follower, _ = flights.join('k')
+        assert await follower.wait_async(0.05) is None
+
+    asyncio.run(scenario())
+
+
+def test_stats():
+    flights = SingleFlight(enabled=True, max_wait=10)
+    flight, _ = flights.join('k')
+    flights.join('k')
+    flights.fallback()
+    flights.finish('k', flight, None)
+    assert flights.stats() == {'enabled': True, 'in_flight': 0, 'leaders': 1, 'followers': 1, 'fallbacks': 1}
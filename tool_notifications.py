@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+工具列表变更通知
+MCP会话通过 GET SSE 流订阅所连接端点的工具列表，管理后台修改模板、应用或Token权限后
+推送 notifications/tools/list_changed，客户端可以长期缓存 tools/list 结果而无需轮询
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Dict, Hashable, Optional
+from dotenv import load_dotenv
+
+from cache_utils import cache_generation
+from models import db_manager
+from template_cache import template_registry
+from metrics import metrics_registry
+
+load_dotenv()
+
+# 通知流的保活间隔（秒），同时用于检测客户端断开和刷新会话活动时间
+KEEPALIVE_INTERVAL = float(os.getenv('MCP_NOTIFY_KEEPALIVE', '15'))
+
+
+def tools_version(target: Hashable) -> Optional[bytes]:
+    """订阅目标当前的 tools/list 结果（直接读数据库，不使用可能过期的授权缓存）
+
+    Args:
+        target: ('app', category, name) 为产品端点，('token', token) 为聚合端点
+    """
+    if target[0] == 'app':
+        app = db_manager.get_application_by_path(target[1], target[2])
+        return template_registry.get(app).tools_result.json_bytes if app else None
+    apps = db_manager.get_token_applications(target[1])
+    return template_registry.get_aggregate(apps).tools_result.json_bytes
+
+
+class Subscription:
+    """一个会话打开的通知流（同步流使用 Event，异步流使用事件循环中的 asyncio.Event）"""
+
+    def __init__(self, notifier: 'ToolChangeNotifier', session_id: str, target: Hashable,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.notifier = notifier
+        self.session_id = session_id
+        self.target = target
+        self.closed = False
+        self._pending = False
+        self._loop = loop
+        self._event = threading.Event() if loop is None else asyncio.Event()
+
+    def _wake(self):
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def _notify(self):
+        # 多次变更合并为一次通知
+        self._pending = True
+        self._wake()
+
+    def _close(self):
+        self.closed = True
+        self._wake()
+
+    def _take(self) -> bool:
+        pending, self._pending = self._pending, False
+        return pending and not self.closed
+
+    def wait(self, timeout: float) -> bool:
+        """等待变更通知，返回是否需要发送 list_changed（超时或流被关闭时返回 False）"""
+        self._event.wait(timeout)
+        self._event.clear()
+        return self._take()
+
+    async def wait_async(self, timeout: float) -> bool:
+        """等待变更通知（异步版本）"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        return self._take()
+
+    def close(self):
+        """关闭通知流并取消订阅（可重复调用）"""
+        self.closed = True
+        self.notifier.unsubscribe(self)
+
+
+class ToolChangeNotifier:
+    """工具列表变更检测与分发（每个进程一个）
+
+    管理后台修改数据后会推进跨进程缓存代数；后台线程每隔 interval 秒检查代数，
+    发生变化时按订阅目标重新计算工具列表，只有工具列表确实变化的会话才收到通知。
+    同一会话只保留一个通知流，新流打开时旧流被关闭。
+
+    Args:
+        interval: 缓存代数检查间隔（秒）
+        max_streams: 本进程同时打开的通知流上限
+    """
+
+    def __init__(self, interval: float = 1.0, max_streams: int = 1000):
+        self.interval = interval
+        self.max_streams = max_streams
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._versions: Dict[Hashable, Optional[bytes]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._generation: Any = None
+
+        # 统计信息
+        self.opened = 0
+        self.notified = 0
+
+    def reset_after_fork(self):
+        """子进程中重置状态（通知流和后台线程不会随fork复制）"""
+        self._subscriptions = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def subscribe(self, session_id: str, target: Hashable, version: Optional[bytes],
+                  loop: Optional[asyncio.AbstractEventLoop] = None) -> Optional[Subscription]:
+        """为会话打开通知流，达到上限时返回 None
+
+        Args:
+            version: 客户端当前看到的工具列表（tools/list 的序列化结果），用于比较变化
+            loop: 异步流所在的事件循环，同步流为 None
+        """
+        subscription = Subscription(self, session_id, target, loop)
+        with self._lock:
+            previous = self._subscriptions.get(session_id)
+            if previous is None and len(self._subscriptions) >= self.max_streams:
+                return None
+            self._subscriptions[session_id] = subscription
+            self._versions.setdefault(target, version)
+            self.opened += 1
+        if previous is not None:
+            previous._close()
+        self._ensure_started()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if self._subscriptions.get(subscription.session_id) is subscription:
+                del self._subscriptions[subscription.session_id]
+            if not any(sub.target == subscription.target for sub in self._subscriptions.values()):
+                self._versions.pop(subscription.target, None)
+
+    def check(self) -> int:
+        """缓存代数变化时重新计算被订阅目标的工具列表，返回发送的通知数"""
+        generation = cache_generation.current()
+        if generation == self._generation:
+            return 0
+        self._generation = generation
+
+        with self._lock:
+            targets = {sub.target for sub in self._subscriptions.values()}
+        changed = set()
+        for target in targets:
+            version = tools_version(target)
+            with self._lock:
+                if target in self._versions and self._versions[target] != version:
+                    self._versions[target] = version
+                    changed.add(target)
+        if not changed:
+            return 0
+
+        with self._lock:
+            subscriptions = [sub for sub in self._subscriptions.values() if sub.target in changed]
+            self.notified += len(subscriptions)
+        for subscription in subscriptions:
+            subscription._notify()
+        return len(subscriptions)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # 数据库暂时不可用时下一轮重试
+                self._generation = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._generation = cache_generation.current()
+                thread = threading.Thread(target=self._run, name='tool-notifier', daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def stop(self):
+        self._stop_event.set()
+
+    def open_streams(self) -> int:
+        """当前打开的通知流数"""
+        return len(self._subscriptions)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取通知统计信息"""
+        with self._lock:
+            return {
+                'open_streams': len(self._subscriptions),
+                'max_streams': self.max_streams,
+                'watched_targets': len(self._versions),
+                'opened': self.opened,
+                'notified': self.notified
+            }
+
+
+# 全局工具列表变更通知
+tool_notifier = ToolChangeNotifier(
+    interval=float(os.getenv('MCP_NOTIFY_CHECK_INTERVAL', '1')),
+    max_streams=int(os.getenv('MCP_NOTIFY_MAX_STREAMS', '1000'))
+)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=tool_notifier.reset_after_fork)
+
+metrics_registry.callback(
+    'unimcp_notify_streams_open', 'Open tools/list_changed notification streams', tool_notifier.open_streams
+)
+metrics_registry.callback(
+    'unimcp_notify_sent_total', 'tools/list_changed notifications sent',
+    lambda: tool_notifier.stats()['notified'], kind='counter'
+)